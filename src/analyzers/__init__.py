@@ -0,0 +1,29 @@
+"""
+Registry of the analyzers per data source. An analyzer module is only imported when its data
+source is selected, so the heavy dependencies of the other analyzers are not loaded on startup.
+"""
+import importlib
+
+import utils.constants as const
+
+ANALYZERS_BY_DATA_SOURCE = {
+    const.DATA_SOURCE_REDDIT: ('analyzers.reddit_analyzer', 'RedditAnalyzer'),
+    const.DATA_SOURCE_TWITTER: ('analyzers.twitter_analyzer', 'TwitterAnalyzer'),
+    const.DATA_SOURCE_RSS: ('analyzers.rss_analyzer', 'RssAnalyzer'),
+    const.DATA_SOURCE_COMBINED: ('analyzers.combined_analyzer', 'CombinedAnalyzer')
+}
+
+
+def load_analyzer_class(data_source):
+    """
+    Imports the analyzer module of a data source and returns its analyzer class
+
+    :param data_source: data source selected in the sidebar
+    :type data_source: str
+    :raises KeyError: if no analyzer is registered for the data source
+    :return: analyzer class
+    :rtype: type
+    """
+    module_name, class_name = ANALYZERS_BY_DATA_SOURCE[data_source]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
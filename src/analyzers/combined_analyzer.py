@@ -5,18 +5,47 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 import utils.aggregation_pipelines as ap
+from utils import article_attributes
+from utils.connection_manager import get_client
+from utils.dataframe_loader import cursor_to_dataframe
+from utils.instrumentation import span
+from utils.parallel_queries import run_concurrently
 import streamlit as st
 import pandas as pd
-from utils.helper_functions import get_profanity_distribution
+from utils.helper_functions import get_profanity_distribution, has_documents, has_profanity_scores, \
+    score_unscored_documents
+from utils.sampling import DEFAULT_SEED, estimate_shares, hash_windows, merge_window_counts, object_id_windows, window_counts
+
+# source names of the activity cube and their names in the charts
+ACTIVITY_SOURCES = (('twitter', 'Twitter activity'), ('reddit', 'Reddit activity'), ('rss', 'RSS Activity'))
+DAYS_OF_THE_WEEK = ("ISO Week days start from 1",
+    "Monday",
+    "Tuesday",
+    "Wednesday",
+    "Thursday",
+    "Friday",
+    "Saturday",
+    "Sunday"
+)
 
 class CombinedAnalyzer:
 
-    def __init__(self, mongoclient):
+    def __init__(self, mongoclient=None):
+        """
+        Analyzes data across all collected sources
+
+        :param mongoclient: MongoDB connection client, defaults to the shared client of the connection manager
+        :type mongoclient: pymongo.MongoClient
+        """
+        if mongoclient is None:
+            mongoclient = get_client()
         self.rss_collection = mongoclient['data']['rss.articles']
         self.twitter_collection = mongoclient['data']['twitter.tweets']
         self.reddit_collection = mongoclient['data']['reddit.posts']
         self.combined_keyword_collection = mongoclient['analysis']['combined_keyword_analysis']
         self.reddit_comments_collection = mongoclient['analysis']['reddit_comments']
+        self.reddit_comment_facts = mongoclient['analysis']['reddit_comment_facts']
+        self.activity_cube = mongoclient['analysis']['activity_cube']
 
     def keyword_frequency_twitter(self):
         keywords = [k['keyword'] for k in list(ap.keywords_in_news_article(self.combined_keyword_collection, source='twitter'))]
@@ -32,8 +61,9 @@ class CombinedAnalyzer:
                     list_twitter.append({'date': str(entry['date']), 'count': entry['count']})
                 else:
                     list_rss.append({'date': str(entry['date']), 'count': entry['count']})
-            df_twitter = pd.DataFrame(list_twitter).sort_values('date')
-            df_rss = pd.DataFrame(list_rss).sort_values('date')
+            with span('transform'):
+                df_twitter = pd.DataFrame(list_twitter).sort_values('date')
+                df_rss = pd.DataFrame(list_rss).sort_values('date')
             fig.add_trace(
                 go.Scatter(x=list(df_twitter['date']), y=list(df_twitter['count']), name='Twitter tweets'), secondary_y=False
             )
@@ -42,7 +72,8 @@ class CombinedAnalyzer:
             )
             fig.update_yaxes(title_text='Occurrences of keyword in Twitter tweets', secondary_y=False)
             fig.update_yaxes(title_text='Occurrences of keyword in News article', secondary_y=True)
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def keyword_frequency_reddit(self):
         keywords = [k['keyword'] for k in list(ap.keywords_in_news_article(self.combined_keyword_collection, source='reddit'))]
@@ -58,8 +89,9 @@ class CombinedAnalyzer:
                     list_reddit.append({'date': str(entry['date']), 'count': entry['count']})
                 else:
                     list_rss.append({'date': str(entry['date']), 'count': entry['count']})
-            df_reddit = pd.DataFrame(list_reddit).sort_values('date')
-            df_rss = pd.DataFrame(list_rss).sort_values('date')
+            with span('transform'):
+                df_reddit = pd.DataFrame(list_reddit).sort_values('date')
+                df_rss = pd.DataFrame(list_rss).sort_values('date')
             fig.add_trace(
                 go.Scatter(x=list(df_reddit['date']), y=list(df_reddit['count']), name='Reddit posts'), secondary_y=False
             )
@@ -68,13 +100,99 @@ class CombinedAnalyzer:
             )
             fig.update_yaxes(title_text='Occurrences of keyword in Reddit posts', secondary_y=False)
             fig.update_yaxes(title_text='Occurrences of keyword in News article', secondary_y=True)
+            with span('render'):
+                st.write(fig)
+
+    def _approximation_settings(self, analysis):
+        """
+        Shows the controls of the approximate mode of an analysis, which computes the analysis on
+        a sample and shows confidence intervals
+
+        :param analysis: name of the analysis, prefixes the keys of the controls
+        :type analysis: str
+        :return: sampled share of the documents, confidence level and seed, None for exact results
+        :rtype: tuple
+        """
+        if not st.checkbox('Approximate on a sample', key=f'{analysis}_approximate'):
+            return None
+        columns = st.columns(3)
+        fraction = columns[0].slider('Sample size (% of documents)', 1, 50, 5, key=f'{analysis}_fraction') / 100
+        confidence = columns[1].select_slider('Confidence level', options=[0.8, 0.9, 0.95, 0.99], value=0.95,
+                                              key=f'{analysis}_confidence')
+        seed = int(columns[2].number_input('Seed', value=DEFAULT_SEED, step=1, key=f'{analysis}_seed'))
+        return fraction, confidence, seed
+
+    def _show_requested(self, analysis):
+        # the exact rerun of an approximate result shows the analysis without another click
+        return st.button('Show') or st.session_state.pop(f'{analysis}_exact_rerun', False)
+
+    def _offer_exact_rerun(self, analysis, settings, sampled):
+        fraction, confidence, seed = settings
+        st.caption(f'Approximation on {fraction:.0%} of the documents ({sampled} sampled) with seed {seed}, '
+                   f'error bars show {confidence:.0%} confidence intervals')
+
+        def rerun_exactly():
+            st.session_state[f'{analysis}_approximate'] = False
+            st.session_state[f'{analysis}_exact_rerun'] = True
+        st.button('Rerun exactly', on_click=rerun_exactly)
+
+    def _estimate_bar(self, name, x, estimates):
+        """
+        Helper function for the approximate analyses, bar of estimated shares with error bars
+        """
+        return go.Bar(x=x, y=[share for share, _, _ in estimates], name=name, error_y=dict(
+            type='data',
+            symmetric=False,
+            array=[upper - share for share, _, upper in estimates],
+            arrayminus=[share - lower for share, lower, _ in estimates]
+        ))
+
+    def _approximate_sentiment_analysis(self, settings):
+        fraction, confidence, seed = settings
+        sources = [
+            ('Twitter tweets', self.twitter_collection, {}),
+            ('Reddit posts', self.reddit_collection, {}),
+            ('Reddit comments', self.reddit_collection, {'compound': '$comments.sentiment.compound', 'unwind': '$comments'})
+        ]
+
+        def sampled_counts(collection, kwargs):
+            windows, slots = object_id_windows(collection, fraction, seed)
+            return ap.sampled_sentiment_counts(collection, windows, **kwargs), len(windows), slots
+
+        results = run_concurrently({name: lambda collection=collection, kwargs=kwargs: sampled_counts(collection, kwargs)
+                                    for name, collection, kwargs in sources})
+        estimates = {}
+        sampled = 0
+        for name, (counts, sampled_slots, slots) in results.items():
+            shares, documents = estimate_shares(counts, sampled_slots, slots, confidence)
+            estimates[name] = shares or [(0, 0, 0)] * len(ap.SENTIMENT_LABELS)
+            sampled += documents
+        fig = go.Figure()
+        for index, label in enumerate(ap.SENTIMENT_LABELS):
+            fig.add_trace(self._estimate_bar(label, list(estimates), [shares[index] for shares in estimates.values()]))
+        fig.update_layout(barmode='group', xaxis_title='Sources', yaxis_title='Share')
+        with span('render'):
             st.write(fig)
+        return sampled
+
+    def _comment_sentiment(self):
+        if has_documents(self.reddit_comment_facts):
+            return ap.reddit_comment_facts_sentiment(self.reddit_comment_facts)
+        return ap.sentiment_analysis_comments(self.reddit_collection)
 
     def sentiment_analysis(self):
-        if st.button('Show'):
-            twitter_tweets = list(ap.sentiment_analysis(self.twitter_collection))
-            reddit_posts = list(ap.sentiment_analysis(self.reddit_collection))
-            reddit_comments = list(ap.sentiment_analysis_comments(self.reddit_collection))
+        settings = self._approximation_settings('sentiment_analysis')
+        if self._show_requested('sentiment_analysis'):
+            if settings:
+                sampled = self._approximate_sentiment_analysis(settings)
+                self._offer_exact_rerun('sentiment_analysis', settings, sampled)
+                return
+            results = run_concurrently({
+                'tweets': lambda: ap.sentiment_analysis(self.twitter_collection),
+                'posts': lambda: ap.sentiment_analysis(self.reddit_collection),
+                'comments': self._comment_sentiment
+            })
+            twitter_tweets, reddit_posts, reddit_comments = results['tweets'], results['posts'], results['comments']
             all_tweets = 0
             for bucket in twitter_tweets:
                 all_tweets += bucket['count']
@@ -91,90 +209,215 @@ class CombinedAnalyzer:
                 result[bucket['bucket']]['Reddit posts'] = bucket['count'] / all_posts
             for bucket in reddit_comments:
                 result[bucket['bucket']]['Reddit comments'] = bucket['count'] / all_comments
-            df_result = pd.DataFrame(result).reset_index().rename({'index': 'Sources'}, axis=1)
+            with span('transform'):
+                df_result = pd.DataFrame(result).reset_index().rename({'index': 'Sources'}, axis=1)
             print(df_result)
             fig = px.bar(df_result, x='Sources', y=['negative', 'neutral', 'positive'])
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
+
+
+    def _profanity_distribution(self, collection, field, text_field, categories, load):
+        """
+        Helper function for compare_profanity_score_reddit_twitter, aggregates the scores stored by
+        score_profanity.py or scores the texts returned by load if there are none. Documents
+        stored since the last run of score_profanity.py are scored here and added to the counts.
+        """
+        if has_profanity_scores(collection, field):
+            counts = {bucket['bucket']: bucket['count'] for bucket in ap.profanity_distribution(collection, field)}
+            # texts scored zero ('nan') are left out like in the stored distribution
+            for category in score_unscored_documents(collection, field, text_field)['category']:
+                if category in categories:
+                    counts[category] = counts.get(category, 0) + 1
+            total = sum(counts.values())
+            return [counts.get(category, 0) / total if total else 0 for category in categories]
+        with span('transform'):
+            data = load()
+        return get_profanity_distribution(data)
 
+    def _load_reddit_comments(self):
+        reddit_comments = cursor_to_dataframe(self.reddit_comments_collection.find({}, {'_id': 0, 'comment': 1}), {'comment': 'object'})
+        reddit_comments['text'] = reddit_comments['comment'].astype('U').values
+        return reddit_comments
+
+    def _approximate_profanity_distribution(self, collection, field, text_field, windows, slots, confidence):
+        """
+        Helper function for compare_profanity_score_reddit_twitter, estimates the distribution from
+        the stored scores of the sampled documents and scores the texts of the sampled documents
+        without a stored score, i.e. of all sampled documents if there are no scores
+        """
+        stored = list(ap.sampled_profanity_counts(collection, windows, field)) if has_profanity_scores(collection, field) else []
+        query = {'$or': [{'_id': {'$gte': lower, '$lt': upper}} for lower, upper in windows]}
+        data = score_unscored_documents(collection, field, text_field, {'_id': 1}, query)
+        scored = window_counts(windows, zip(data['_id'], data['category']), ap.PROFANITY_LABELS)
+        # texts scored zero are left out like in the exact distribution
+        for window in scored:
+            window['count'] = sum(window['labels'])
+        counts = merge_window_counts(stored + scored)
+        shares, sampled = estimate_shares(counts, len(windows), slots, confidence)
+        return shares or [(0, 0, 0)] * len(ap.PROFANITY_LABELS), sampled
+
+    def _approximate_profanity_comparison(self, settings):
+        fraction, confidence, seed = settings
+        sources = [
+            ('Tweets', self.twitter_collection, 'profanity', 'text', object_id_windows(self.twitter_collection, fraction, seed)),
+            ('Reddit posts', self.reddit_collection, 'title_profanity', 'title',
+             object_id_windows(self.reddit_collection, fraction, seed)),
+            # the comments are stored with the hash of their text as _id
+            ('Reddit comments', self.reddit_comments_collection, 'profanity', 'comment', hash_windows(fraction, seed))
+        ]
+        if self.reddit_comments_collection.find_one({'_id': {'$type': 'objectId'}}, {'_id': 1}) is not None:
+            st.warning('Some Reddit comments are not keyed by their hash yet and are left out of the sample, '
+                       'run upsert_reddit_comments.py to re-key them')
+        results = run_concurrently({
+            name: lambda collection=collection, field=field, text_field=text_field, sample=sample:
+                self._approximate_profanity_distribution(collection, field, text_field, *sample, confidence)
+            for name, collection, field, text_field, sample in sources
+        })
+        fig = go.Figure()
+        sampled = 0
+        for name, (estimates, documents) in results.items():
+            fig.add_trace(self._estimate_bar(name, ap.PROFANITY_LABELS, estimates))
+            sampled += documents
+        fig.update_layout(barmode='group', xaxis_title='Profanity score', yaxis_title='Percentage')
+        with span('render'):
+            st.write(fig)
+        return sampled
 
     def compare_profanity_score_reddit_twitter(self):
-        if st.button('Show'):
+        settings = self._approximation_settings('compare_profanity_score_reddit_twitter')
+        if self._show_requested('compare_profanity_score_reddit_twitter'):
+            if settings:
+                sampled = self._approximate_profanity_comparison(settings)
+                self._offer_exact_rerun('compare_profanity_score_reddit_twitter', settings, sampled)
+                return
             fig = go.Figure()
-            categories = ['(0.0, 0.25]', '(0.25, 0.5]', '(0.5, 0.75]', '(0.75, 1.0]']
-            tweets = pd.DataFrame(self.twitter_collection.find({}, {'_id': 0, 'text': 1}))
-            tweet_distribution = get_profanity_distribution(tweets)
-            fig.add_trace(go.Bar(
-                x=categories,
-                y=tweet_distribution,
-                name='Tweets'
-            ))
-            reddit_posts = pd.DataFrame(self.reddit_collection.find({}, {'_id': 0, 'text': '$title'}))
-            reddit_posts_distribution = get_profanity_distribution(reddit_posts)
-            fig.add_trace(go.Bar(
-                x=categories,
-                y=reddit_posts_distribution,
-                name='Reddit posts'
-            ))
-            reddit_comments = pd.DataFrame(self.reddit_comments_collection.find({}, {'_id': 0, 'comment': 1}))
-            reddit_comments['text'] = reddit_comments['comment'].astype('U').values
-            reddit_comments_distribution = get_profanity_distribution(reddit_comments)
-            fig.add_trace(go.Bar(
-                x=categories,
-                y=reddit_comments_distribution,
-                name='Reddit comments'
-            ))
+            categories = ap.PROFANITY_LABELS
+            distributions = run_concurrently({
+                'Tweets': lambda: self._profanity_distribution(
+                    self.twitter_collection, 'profanity', 'text', categories,
+                    lambda: cursor_to_dataframe(self.twitter_collection.find({}, {'_id': 0, 'text': 1}), {'text': 'object'})),
+                'Reddit posts': lambda: self._profanity_distribution(
+                    self.reddit_collection, 'title_profanity', 'title', categories,
+                    lambda: cursor_to_dataframe(self.reddit_collection.find({}, {'_id': 0, 'text': '$title'}), {'text': 'object'})),
+                'Reddit comments': lambda: self._profanity_distribution(
+                    self.reddit_comments_collection, 'profanity', 'comment', categories, self._load_reddit_comments)
+            })
+            for name, distribution in distributions.items():
+                fig.add_trace(go.Bar(
+                    x=categories,
+                    y=distribution,
+                    name=name
+                ))
             fig.update_layout(barmode='group', xaxis_title='Profanity score', yaxis_title='Percentage')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
+
+    def _cube_sources(self):
+        """
+        Returns the sources with cells in the activity cube, upsert_activity_cube.py may have
+        filled it for some sources only
+        """
+        return [source for source, _ in ACTIVITY_SOURCES if has_documents(self.activity_cube, {'source': source})]
+
+    def _activity(self, dimension):
+        """
+        Returns the number of documents of every source per hour or weekday, summed up from the
+        activity cube for the sources with cells and counted in the source collections for the
+        others
+
+        :param dimension: 'hour' or 'weekday'
+        :type dimension: str
+        :return: rows with the columns source, the dimension and count
+        :rtype: pandas.DataFrame
+        """
+        if dimension == 'hour':
+            rss_distribution = ap.rss_published_distribution_per_hour_from_published
+            if article_attributes.has_attributes(self.rss_collection):
+                rss_distribution = ap.rss_published_distribution_per_hour
+            fallbacks = {
+                'twitter': lambda: ap.twitter_tweets_by_hour(self.twitter_collection),
+                'rss': lambda: rss_distribution(self.rss_collection),
+                'reddit': lambda: ap.reddit_posts_by_hour(self.reddit_collection)
+            }
+        else:
+            rss_distribution = ap.rss_published_distribution_per_weekday_from_published
+            if article_attributes.has_attributes(self.rss_collection):
+                rss_distribution = ap.rss_published_distribution_per_weekday
+            fallbacks = {
+                'twitter': lambda: ap.twitter_activity_per_weekday(self.twitter_collection),
+                'rss': lambda: rss_distribution(self.rss_collection),
+                'reddit': lambda: ap.reddit_activity_per_weekday(self.reddit_collection)
+            }
+        cube_sources = self._cube_sources()
+        calls = {source: fallback for source, fallback in fallbacks.items() if source not in cube_sources}
+        if cube_sources:
+            calls['cube'] = lambda: ap.activity_cube_counts(self.activity_cube, [dimension])
+        results = run_concurrently(calls)
+        with span('transform'):
+            frames = []
+            if 'cube' in results:
+                frames.append(pd.DataFrame(results.pop('cube'), columns=['source', dimension, 'count']))
+            for source, documents in results.items():
+                # the hour pipelines of Twitter and Reddit name the hour, the others return it as _id
+                frame = pd.DataFrame(list(documents)).rename(columns={'_id': dimension})
+                frame['source'] = source
+                frames.append(frame)
+            return pd.concat(frames, ignore_index=True)[['source', dimension, 'count']]
 
     def activity_by_hour(self):
         if st.button('Show'):
-            twitter_activity = pd.DataFrame(list(ap.twitter_tweets_by_hour(self.twitter_collection)))
-            rss_activity = pd.DataFrame(list(ap.rss_published_distribution_per_hour(self.rss_collection)))
-            reddit_activity = pd.DataFrame(list(ap.reddit_posts_by_hour(self.reddit_collection)))
+            activity = self._activity('hour').sort_values(by=['hour'], ascending=True)
             fig = make_subplots(specs=[[{"secondary_y": True}]])
-            fig.add_trace(
-                go.Scatter(x=list(twitter_activity['hour']), y=list(twitter_activity['count']), name='Twitter activity')
-            )
-            fig.add_trace(
-                go.Scatter(x=list(reddit_activity['hour']), y=list(reddit_activity['count']), name='Reddit activity')
-            )
-            fig.add_trace(
-                go.Scatter(x=list(rss_activity['_id']), y=list(rss_activity['count']), name='RSS Activity')
-            )
+            for source, name in ACTIVITY_SOURCES:
+                source_activity = activity[activity['source'] == source]
+                fig.add_trace(
+                    go.Scatter(x=list(source_activity['hour']), y=list(source_activity['count']), name=name)
+                )
             fig.update_xaxes(title_text='Hour')
             fig.update_yaxes(title_text='Activity')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def activity_by_weekday(self):
         if st.button('Show'):
-            twitter_activity = pd.DataFrame(list(ap.twitter_activity_per_weekday(self.twitter_collection))).sort_values(by=['_id'], ascending=True)
-            rss_activity = pd.DataFrame(list(ap.rss_published_distribution_per_weekday(self.rss_collection))).sort_values(by=['_id'], ascending=True)
-            reddit_activity = pd.DataFrame(list(ap.reddit_activity_per_weekday(self.reddit_collection))).sort_values(by=['_id'], ascending=True)
-
-            daysOftheWeek = ("ISO Week days start from 1",
-                "Monday",
-                "Tuesday",
-                "Wednesday",
-                "Thursday",
-                "Friday",
-                "Saturday",
-                "Sunday"
-            )
-
-            twitter_activity['_id'] = twitter_activity['_id'].apply(lambda day: daysOftheWeek[day])
-            rss_activity['_id'] = rss_activity['_id'].apply(lambda day: daysOftheWeek[day])
-            reddit_activity['_id'] = reddit_activity['_id'].apply(lambda day: daysOftheWeek[day])
+            activity = self._activity('weekday').sort_values(by=['weekday'], ascending=True)
+            activity['weekday'] = activity['weekday'].apply(lambda day: DAYS_OF_THE_WEEK[day])
 
             fig = make_subplots(specs=[[{"secondary_y": True}]])
-            fig.add_trace(
-                go.Scatter(x=list(twitter_activity['_id']), y=list(twitter_activity['count']), name='Twitter activity')
-            )
-            fig.add_trace(
-                go.Scatter(x=list(reddit_activity['_id']), y=list(reddit_activity['count']), name='Reddit activity')
-            )
-            fig.add_trace(
-                go.Scatter(x=list(rss_activity['_id']), y=list(rss_activity['count']), name='RSS Activity')
-            )
+            for source, name in ACTIVITY_SOURCES:
+                source_activity = activity[activity['source'] == source]
+                fig.add_trace(
+                    go.Scatter(x=list(source_activity['weekday']), y=list(source_activity['count']), name=name)
+                )
             fig.update_xaxes(title_text='Day of the Week')
             fig.update_yaxes(title_text='Activity')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
+
+    def activity_heatmap(self):
+        """
+        Analyzes the activity of a data source or of all data sources per weekday and hour of the
+        day (UTC). Output is provided as heatmap.
+        """
+        options = {'All data sources': None}
+        options.update({name: source for source, name in ACTIVITY_SOURCES})
+        selection = st.selectbox(label='Data source', options=tuple(options))
+        if st.button('Show'):
+            cube_sources = self._cube_sources()
+            selected = [options[selection]] if options[selection] else [source for source, _ in ACTIVITY_SOURCES]
+            missing = [source for source in selected if source not in cube_sources]
+            if len(missing) == len(selected):
+                st.warning('The activity cube has no cells for the selection, it is filled by batch_scripts/upsert_activity_cube.py')
+                return
+            if missing:
+                st.caption(f'The activity cube has no cells for {", ".join(missing)}, they are not included')
+            with span('transform'):
+                cells = pd.DataFrame(ap.activity_cube_counts(self.activity_cube, ['weekday', 'hour'], options[selection]),
+                                     columns=['source', 'weekday', 'hour', 'count'])
+                heatmap = cells.pivot_table(index='weekday', columns='hour', values='count', aggfunc='sum', fill_value=0)
+                heatmap = heatmap.reindex(index=range(1, 8), columns=range(24), fill_value=0)
+                heatmap.index = [DAYS_OF_THE_WEEK[day] for day in heatmap.index]
+            fig = px.imshow(heatmap, labels={'x': 'Hour', 'y': 'Day of the Week', 'color': 'Activity'}, aspect='auto')
+            with span('render'):
+                st.write(fig)
@@ -1,4 +1,8 @@
 import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client
+from utils.helper_functions import has_documents
+from utils.instrumentation import span
+from utils.parallel_queries import run_concurrently
 import streamlit as st
 import pandas as pd
 import utils.constants as const
@@ -9,11 +13,33 @@ class RedditAnalyzer:
     """
     Analyzes collected reddit posts, comments and users
 
-    :param mongoclient: MongoDB connection client
+    :param mongoclient: MongoDB connection client, defaults to the shared client of the connection manager
     :type mongoclient: pymongo.MongoClient
     """
-    def __init__(self, mongoclient):
+    def __init__(self, mongoclient=None):
+        if mongoclient is None:
+            mongoclient = get_client()
         self.collection = mongoclient['data']['reddit.posts']
+        self.comment_facts = mongoclient['analysis']['reddit_comment_facts']
+        self.activity_cube = mongoclient['analysis']['activity_cube']
+
+    # the comment analyses read the comment facts once they are filled by upsert_reddit_comment_facts.py,
+    # otherwise they unwind the comments embedded in the posts
+
+    def _comment_length_per_subreddit(self):
+        if has_documents(self.comment_facts):
+            return ap.reddit_comment_facts_length_per_subreddit(self.comment_facts)
+        return ap.reddit_comment_length_per_subreddit(self.collection)
+
+    def _distribution_number_comments_per_user(self):
+        if has_documents(self.comment_facts):
+            return ap.reddit_comment_facts_distribution_number_comments_per_user(self.comment_facts)
+        return ap.reddit_distribution_number_comments_per_user(self.collection)
+
+    def _comment_sentiment(self):
+        if has_documents(self.comment_facts):
+            return ap.reddit_comment_facts_sentiment(self.comment_facts)
+        return ap.reddit_sentiment_analysis_comments(self.collection)
 
     def top_posts(self):
         """
@@ -21,8 +47,10 @@ class RedditAnalyzer:
         """
         limit = int(st.text_input("Limit", value="30"))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_top_posts(self.collection, limit)))
-            st.table(result)
+            with span('transform'):
+                result = pd.DataFrame(list(ap.reddit_top_posts(self.collection, limit)))
+            with span('render'):
+                st.table(result)
 
     def most_controversial_posts(self):
         """
@@ -30,29 +58,35 @@ class RedditAnalyzer:
         """
         limit = int(st.text_input("Limit", value="30"))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_controversial_posts(self.collection, limit)))
-            st.table(result)
+            with span('transform'):
+                result = pd.DataFrame(list(ap.reddit_controversial_posts(self.collection, limit)))
+            with span('render'):
+                st.table(result)
 
     def subreddit_upvote_ratios(self):
         """
         Analyzes the average upvote ratios for each subreddit 
         """
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_upvote_ratios(self.collection))).sort_values(by=["upvote_ratio"], ascending=False)
+            with span('transform'):
+                result = pd.DataFrame(list(ap.reddit_upvote_ratios(self.collection))).sort_values(by=["upvote_ratio"], ascending=False)
             result.rename(columns={'_id': "Subreddit", 'upvote_ratio': 'Average Upvote Ratio'}, inplace=True)
             fig=px.bar(result, x='Subreddit', y='Average Upvote Ratio', orientation='v')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def comment_length_per_subreddit(self):
         """
         Analyzes how long comments are on average for each collected subreddit
         """
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_comment_length_per_subreddit(self.collection))).sort_values(by='average_comment_length', ascending=False)
+            with span('transform'):
+                result = pd.DataFrame(list(self._comment_length_per_subreddit())).sort_values(by='average_comment_length', ascending=False)
             result.rename(columns={ 'subreddit': 'Subreddit', 'average_comment_length': 'Average comment length' }, inplace=True)
             fig = px.bar(result, x='Average comment length', y='Subreddit', orientation='h')
             fig.update_yaxes(autorange='reversed')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def keyword_per_subreddit(self):
         """
@@ -64,45 +98,61 @@ class RedditAnalyzer:
         if st.button('Show'):
             result = list(ap.reddit_keyword_per_subreddit(self.collection, subreddit))
             result = list(filter(lambda row: not row["keyword"].isspace(), result))
-            result = pd.DataFrame(result[:limit]).sort_values(by='count', ascending=False)
+            with span('transform'):
+                result = pd.DataFrame(result[:limit]).sort_values(by='count', ascending=False)
             if output_wc == 'Yes':
                 occurences = { keyword : count for keyword, count in zip(result["keyword"].tolist(), result["count"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True, output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True, output_format='PNG')
             else:
                 result.rename(columns={'keyword': 'Keyword', 'count': 'Number of occurrences'}, inplace=True)
                 fig = px.bar(result[:limit], x='Number of occurrences', y='Keyword', orientation='h')
                 fig.update_yaxes(autorange='reversed')
-                st.write(fig)
+                with span('render'):
+                    st.write(fig)
+
+    def _score_by_hour(self):
+        # the activity cube of upsert_activity_cube.py holds the sum and number of the scores per hour
+        if has_documents(self.activity_cube, {'source': 'reddit'}):
+            return [{'hour': row['hour'], 'score': row['score_sum'] / row['score_count']}
+                    for row in ap.activity_cube_counts(self.activity_cube, ['hour'], 'reddit') if row['score_count']]
+        return ap.reddit_score_by_hour(self.collection)
 
     def score_dist_by_hour(self):
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_score_by_hour(self.collection)))
+            with span('transform'):
+                result = pd.DataFrame(list(self._score_by_hour()))
             result.rename(columns={"hour": "Hour", "score": "Score"}, inplace=True)
             fig=px.bar(result, x='Hour', y='Score', orientation='v')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def distribution_number_comments_per_user(self):
         """
         Analyzes the distribution of comments over users (top commentors vs. inactive commentors)
         """
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_distribution_number_comments_per_user(self.collection)))
+            with span('transform'):
+                result = pd.DataFrame(list(self._distribution_number_comments_per_user()))
             result.rename(columns={'min_number_of_comments': 'Number of comments', 'number_of_users': 'Number of users'}, inplace=True)
             fig = px.bar(result, x='Number of comments', y='Number of users')
             fig.update_xaxes(type='category')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def distribution_number_posts_per_user(self):
         """
         Analyzes the distribution of posts over users (top posters vs. inactive posters)
         """
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_distribution_number_posts_per_user(self.collection)))
+            with span('transform'):
+                result = pd.DataFrame(list(ap.reddit_distribution_number_posts_per_user(self.collection)))
             result.rename(columns={'min_number_of_posts': 'Number of posts', 'number_of_users': 'Number of users'}, inplace=True)
             fig = px.bar(result, x='Number of posts', y='Number of users')
             fig.update_xaxes(type='category')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def frequently_used_news_sources(self):
         """
@@ -111,11 +161,13 @@ class RedditAnalyzer:
         limit = int(st.text_input("Limit", value="30"))
         subreddit = st.selectbox(label='Subreddit', options=tuple(const.SUBREDDITS))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_frequently_used_news_sources(self.collection, subreddit))).sort_values(by='number_of_occurrences', ascending=False)
+            with span('transform'):
+                result = pd.DataFrame(list(ap.reddit_frequently_used_news_sources(self.collection, subreddit))).sort_values(by='number_of_occurrences', ascending=False)
             result.rename(columns={'domain': 'Domain', 'number_of_occurrences': 'Number of occurrences'}, inplace=True)
             fig = px.bar(result[:limit], x='Number of occurrences', y='Domain', orientation='h')
             fig.update_yaxes(autorange='reversed')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def count_posts_per_user(self):
         """
@@ -123,19 +175,24 @@ class RedditAnalyzer:
         """
         limit = int(st.text_input(label='Limit', value='30'))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.reddit_count_posts_per_user(self.collection, limit)))
+            with span('transform'):
+                result = pd.DataFrame(list(ap.reddit_count_posts_per_user(self.collection, limit)))
             result.rename(columns={'_id': 'Username', 'num_posts': 'Number of posts'}, inplace=True)
             fig = px.bar(result, x='Number of posts', y='Username', orientation='h')
             fig.update_yaxes(autorange='reversed')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def reddit_posts_comment_sentiment_analysis(self):
         """
         Analyzes overall sentiment for all submissions and their respective comments across all scraped reddit data.
         """
         if st.button('Show'):
-            reddit_posts = list(ap.sentiment_analysis(self.collection))
-            reddit_comments = list(ap.reddit_sentiment_analysis_comments(self.collection))
+            results = run_concurrently({
+                'posts': lambda: ap.sentiment_analysis(self.collection),
+                'comments': self._comment_sentiment
+            })
+            reddit_posts, reddit_comments = results['posts'], results['comments']
 
             all_posts = 0
             for bucket in reddit_posts:
@@ -153,7 +210,9 @@ class RedditAnalyzer:
             for bucket in reddit_comments:
                 result[bucket['bucket']]['Reddit comments'] = bucket['count'] / all_comments
 
-            df_result = pd.DataFrame(result).reset_index().rename({'index': 'Sources'}, axis=1)
+            with span('transform'):
+                df_result = pd.DataFrame(result).reset_index().rename({'index': 'Sources'}, axis=1)
 
             fig = px.bar(df_result, x='Sources', y=['negative', 'neutral', 'positive'])
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
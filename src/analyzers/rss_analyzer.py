@@ -1,62 +1,87 @@
 import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client
+from utils.dataframe_loader import cursor_to_dataframe
+from utils.helper_functions import has_documents
+from utils.instrumentation import span
+from utils.result_cache import definition_version, get_or_compute, make_key
 import streamlit as st
 import pandas as pd
 import plotly.express as px
 from wordcloud import WordCloud 
 import numpy as np
-import nltk
-import re
 import itertools
 
 from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 
-nltk.download('stopwords')
-from nltk.corpus import stopwords
+from utils import article_attributes, content_embeddings, headline_terms, minhash, similarity, text_processing
 
-from collections import Counter, defaultdict
+from collections import Counter
 
+# the content similarity reads every article, so it is kept for a day unless new articles arrive
+CONTENT_SIMILARITY_TTL_SECONDS = 24 * 60 * 60
+# sources with fewer tags on all their articles are left out of the tag similarity
+MIN_TAG_OCCURRENCES = 500
+TAG_SIMILARITY_MEASURES = {'Jaccard': similarity.JACCARD, 'Weighted Jaccard': similarity.WEIGHTED_JACCARD}
+ALL_SOURCES = 'All sources'
+# words occurring at most this often in all headlines are left out of the relative occurences
+HEADLINE_COUNT_THRESHOLD = 100
+# minimum share of the occurrences of a word in the headlines of a source to be shown
+HEADLINE_RELATIVE_THRESHOLD = 0.05
+# number of words drawn by the wordcloud of WordCloud
+WORDCLOUD_MAX_WORDS = 200
 
 class RssAnalyzer:
 
-    static_source_options = None
-
-    def __init__(self, mongoclient):
+    def __init__(self, mongoclient=None):
         """
         Analyzes collected articles from rss feeds
 
-        :param mongoclient: MongoDB connection client
+        :param mongoclient: MongoDB connection client, defaults to the shared client of the connection manager
         :type mongoclient: pymongo.MongoClient
         """
+        if mongoclient is None:
+            mongoclient = get_client()
         self.collection = mongoclient['data']['rss.articles']
-
-        if not RssAnalyzer.static_source_options:
-            RssAnalyzer.static_source_options = pd.DataFrame(ap.rss_headlines(self.collection))['feed_source'].unique().tolist()
-        
-        self.sources = RssAnalyzer.static_source_options
+        self.content_embeddings = content_embeddings.get_collection(mongoclient)
+        self.tag_sketches = minhash.get_collection(mongoclient)
+        self.headline_terms, self.headline_term_totals = headline_terms.get_collections(mongoclient)
+        self.activity_cube = mongoclient['analysis']['activity_cube']
+        self.sources = ap.rss_feed_sources(self.collection)
 
     def publication_stats(self):
         """
         Analyzes the number of articles published by each news source. Output is provided as bar chart.
         """
         if st.button('Show'):
-            result = pd.DataFrame(ap.rss_publication_stats(self.collection)).sort_values(by=["article_count"], ascending=False)
-            result.rename(columns={"article_count": "Number of articles", "feed_source": "News Source"}, inplace=True)
-            fig=px.bar(result[:30], x='Number of articles', y='News Source', orientation='h')
+            with span('transform'):
+                result = pd.DataFrame(ap.rss_source_catalog(self.collection)).sort_values(by=["article_count"], ascending=False)
+            result.rename(columns={"article_count": "Number of articles", "feed_source": "News Source",
+                                   "first_published": "First publication", "last_published": "Last publication"}, inplace=True)
+            fig=px.bar(result[:30], x='Number of articles', y='News Source', orientation='h',
+                       hover_data=['First publication', 'Last publication'])
             # reverse display order
             fig.update_yaxes(autorange="reversed")
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
     
     def avg_article_length(self):
         """
         Analyzes the average article length of a news source in number of characters. Output is provided as bar chart.
         """
         if st.button('Show'):
-            result =  pd.DataFrame(ap.rss_avg_article_length(self.collection)).sort_values(by=["avg_article_length"], ascending=False)
-            result.rename(columns={"_id": "News Source", 'avg_article_length': 'Average Article Length'}, inplace=True)
-            fig=px.bar(result, x='Average Article Length', y='News Source', orientation='h')
+            if article_attributes.has_attributes(self.collection):
+                data = ap.rss_avg_article_length(self.collection)
+            else:
+                data = ap.rss_avg_article_length_from_content(self.collection)
+            result =  pd.DataFrame(data).sort_values(by=["avg_article_length"], ascending=False)
+            result.rename(columns={"_id": "News Source", 'avg_article_length': 'Average Article Length',
+                                   'avg_token_count': 'Average Number of Tokens'}, inplace=True)
+            fig=px.bar(result, x='Average Article Length', y='News Source', orientation='h',
+                       hover_data=[column for column in ['Average Number of Tokens'] if column in result.columns])
             fig.update_yaxes(autorange="reversed")
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def tags_per_source(self):
         """
@@ -66,28 +91,35 @@ class RssAnalyzer:
         source = st.selectbox(label='News Source', options=tuple(self.sources))
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
-            data = pd.DataFrame(ap.rss_tag_count(self.collection, source))
+            with span('transform'):
+                data = pd.DataFrame(ap.rss_tag_count(self.collection, source))
             result = data.sort_values(by=["count"], ascending=False)
             result = result[:limit]
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["tag"].tolist(), result["count"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 #rearrange column order for better output
                 cols = result.columns.tolist()
                 cols = cols[-2:] + cols[:-2]
                 result = result[cols]
-                st.table(result)
+                with span('render'):
+                    st.table(result)
 
     def tag_similarity(self):
         """
         Analyzes the similarity of news articles based on their tags
         """
         limit = int(st.text_input("Limit", value="30"))
+        source = st.selectbox(label='News Source', options=(ALL_SOURCES,) + tuple(self.sources))
+        measure = st.radio("Measure", options=tuple(TAG_SIMILARITY_MEASURES))
         if st.button('Show'):
-            result = self._tag_similarity_wrapper(ascending=False)
-            st.table(result[:limit])
+            result = self._tag_similarity_wrapper(ascending=False, limit=limit, measure=TAG_SIMILARITY_MEASURES[measure],
+                                                  source=source)
+            with span('render'):
+                st.table(result)
 
 
     def tag_dissimilarity(self):
@@ -95,30 +127,45 @@ class RssAnalyzer:
         Analyzes the dissimilarity of news articles based on their tags
         """
         limit = int(st.text_input("Limit", value="30"))
+        source = st.selectbox(label='News Source', options=(ALL_SOURCES,) + tuple(self.sources))
+        measure = st.radio("Measure", options=tuple(TAG_SIMILARITY_MEASURES))
         if st.button('Show'):
-            result = self._tag_similarity_wrapper(ascending=True)
-            st.table(result[:limit])
+            result = self._tag_similarity_wrapper(ascending=True, limit=limit, measure=TAG_SIMILARITY_MEASURES[measure],
+                                                  source=source)
+            with span('render'):
+                st.table(result)
 
-    def _tag_similarity_wrapper(self, ascending=True):
+    def _tag_similarity_wrapper(self, ascending=True, limit=None, measure=similarity.JACCARD, source=ALL_SOURCES):
         """
-        Helper function for tag_similarity and tag_dissimilarity 
+        Helper function for tag_similarity and tag_dissimilarity. The pairs of a single source are
+        estimated from the MinHash sketches of update_rss_tag_sketches.py if there are any, the
+        exact similarities of all pairs of sources are cached until new articles arrive.
         """
-        data = list(ap.rss_tags(self.collection))
-        df = pd.DataFrame(data)
-        sources = df["feed_source"].unique()
-        pairs = itertools.combinations(sources, 2)
-        rows = []
-        for pair in pairs:
-            first_tags = set(df[df["feed_source"] == pair[0]]["tags"].values[0])
-            second_tags = set(df[df["feed_source"] == pair[1]]["tags"].values[0])
-            intersection = first_tags.intersection(second_tags)
-            union = first_tags.union(second_tags)
-            iou_similarity = len(intersection)/len(union)
-            rows.append([*pair, iou_similarity])
-        result = pd.DataFrame(rows, columns=["Source 1", "Source 2", "Similarity"])
-
-        result = result.sort_values(by=["Similarity"], ascending=ascending)
-        return result
+        if source != ALL_SOURCES and measure == similarity.JACCARD and minhash.has_sketch(self.tag_sketches, source):
+            find = minhash.dissimilar_sources if ascending else minhash.similar_sources
+            st.caption('Jaccard similarity estimated from MinHash sketches')
+            return pd.DataFrame(find(self.tag_sketches, source, limit, MIN_TAG_OCCURRENCES),
+                                columns=["Source 1", "Source 2", "Similarity"])
+        key = make_key('tag_similarity', self.collection, version=definition_version(RssAnalyzer._tag_similarity))
+        sources, similarities = get_or_compute(key, self.collection, self._tag_similarity)
+        return similarity.top_pairs(similarities[measure], sources, limit, ascending,
+                                    item=None if source == ALL_SOURCES else source)
+
+    def _tag_similarity(self):
+        """
+        Computes the Jaccard and weighted Jaccard similarity of the tags of all pairs of news
+        sources with enough tagged articles
+        """
+        data = ap.rss_source_tag_counts(self.collection)
+        with span('transform'):
+            df = cursor_to_dataframe(data, ap.RSS_SOURCE_TAG_COUNTS_SCHEMA)
+            totals = df.groupby('feed_source', observed=True)['count'].transform('sum')
+            df = df[totals >= MIN_TAG_OCCURRENCES]
+            matrix, sources = similarity.incidence_matrix(df, 'feed_source', 'tag', 'count')
+        return sources, {
+            similarity.JACCARD: similarity.jaccard(matrix),
+            similarity.WEIGHTED_JACCARD: similarity.weighted_jaccard(matrix)
+        }
 
     def content_similarity(self):
         """
@@ -127,7 +174,8 @@ class RssAnalyzer:
         limit = int(st.text_input("Limit", value="30"))
         if st.button('Show'):
             result = self._content_similarity_wrapper(ascending=False)
-            st.table(result[:limit])
+            with span('render'):
+                st.table(result[:limit])
 
     def content_dissimilarity(self):
         """
@@ -136,54 +184,77 @@ class RssAnalyzer:
         limit = int(st.text_input("Limit", value="30"))
         if st.button('Show'):
             result = self._content_similarity_wrapper(ascending=True)
-            st.table(result[:limit])
+            with span('render'):
+                st.table(result[:limit])
 
     def _content_similarity_wrapper(self, ascending=True):
         """
-        Helper function for content_similarity and content_dissimilarity 
+        Helper function for content_similarity and content_dissimilarity, reads the embeddings of
+        update_rss_content_embeddings.py or embeds every article if there are none
+        """
+        sources, similarities = content_embeddings.source_similarity(self.content_embeddings)
+        if sources:
+            return similarity.top_pairs(similarities, sources, ascending=ascending)
+        key = make_key('content_similarity', self.collection, version=definition_version(RssAnalyzer._content_similarity))
+        result = get_or_compute(key, self.collection, self._content_similarity, ttl=CONTENT_SIMILARITY_TTL_SECONDS)
+        result = result.sort_values(by=["Similarity"], ascending=ascending)
+        return result
+
+    def _content_similarity(self):
+        """
+        Computes the cosine similarity of the average content embeddings of all pairs of news sources
         """
-        try:
-            result = pd.read_pickle('_content_similarity_wrapper.pkl')
-        except:
-            data = ap.rss_content(self.collection)
-            df = pd.DataFrame(data)
-        
+        data = ap.rss_content(self.collection)
+        with span('transform'):
+            df = cursor_to_dataframe(data, ap.RSS_CONTENT_SCHEMA)
 
-            sws = stopwords.words("english")
-            tokenized_articles = list(map(lambda text: nltk.tokenize.wordpunct_tokenize(text), df["content"]))
-            cleaned_articles = [list(filter(lambda word: word.lower() not in sws, article)) for article in tokenized_articles]
+        with span('tokenize'):
+            cleaned_articles = text_processing.tokenize_many(df["content"], words_only=False, lowercase=False)
             df["content"] = [" ".join(cleaned_article) for cleaned_article in cleaned_articles]
-            
 
-            # vectorizer = TfidfVectorizer()
-            vectorizer = HashingVectorizer(n_features=100)
-            X = vectorizer.fit_transform(df['content']).todense()
-
-            average_embeddings = {}
-            sources = df["feed_source"].unique()
-            for source in sources:
-                ids = df[df["feed_source"] == source].index
-                average_embeddings[source] = np.ravel(np.mean(X[ids], axis=0))
-                    
-            pairs = itertools.combinations(sources, 2)
-            rows = []
-            for pair in pairs:
-                x,y = pair
-                similaritiy = np.ravel(cosine_similarity(average_embeddings[x].reshape(1,-1),average_embeddings[y].reshape(1,-1)))[0]
-                rows.append([*pair, similaritiy])
+        # vectorizer = TfidfVectorizer()
+        vectorizer = HashingVectorizer(n_features=100)
+        X = vectorizer.fit_transform(df['content']).todense()
 
-            result = pd.DataFrame(rows, columns=["Source 1", "Source 2", "Similarity"])
-            result.to_pickle('_content_similarity_wrapper.pkl')
-        finally:
-            result = result.sort_values(by=["Similarity"], ascending=ascending)
-            return result
+        average_embeddings = {}
+        sources = df["feed_source"].unique()
+        for source in sources:
+            ids = df[df["feed_source"] == source].index
+            average_embeddings[source] = np.ravel(np.mean(X[ids], axis=0))
+
+        pairs = itertools.combinations(sources, 2)
+        rows = []
+        for pair in pairs:
+            x,y = pair
+            similaritiy = np.ravel(cosine_similarity(average_embeddings[x].reshape(1,-1),average_embeddings[y].reshape(1,-1)))[0]
+            rows.append([*pair, similaritiy])
+
+        return pd.DataFrame(rows, columns=["Source 1", "Source 2", "Similarity"])
+
+    def _published_distribution(self, dimension):
+        """
+        Helper function for published_dist_day and published_dist_hour, reads the activity cube of
+        upsert_activity_cube.py, else the attributes of update_rss_article_attributes.py, else the
+        publication dates of the articles
+        """
+        if has_documents(self.activity_cube, {'source': 'rss'}):
+            return [{"_id": row[dimension], "count": row["count"]}
+                    for row in ap.activity_cube_counts(self.activity_cube, [dimension], 'rss')]
+        enriched = article_attributes.has_attributes(self.collection)
+        if dimension == 'hour':
+            if enriched:
+                return ap.rss_published_distribution_per_hour(self.collection)
+            return ap.rss_published_distribution_per_hour_from_published(self.collection)
+        if enriched:
+            return ap.rss_published_distribution_per_weekday(self.collection)
+        return ap.rss_published_distribution_per_weekday_from_published(self.collection)
 
     def published_dist_day(self):
         """
         Analyzes on which day of the week most articles are published. Output is provided as bar chart.
         """
         if st.button('Show'):
-            data = ap.rss_published_distribution_per_weekday(self.collection)
+            data = self._published_distribution('weekday')
             
             daysOftheWeek = ("ISO Week days start from 1",
                 "Monday",
@@ -199,24 +270,44 @@ class RssAnalyzer:
             for row in data:
                 rows.append([daysOftheWeek[row["_id"]], row["count"]])
             
-            published_on = pd.DataFrame(rows, columns=["Weekday", "Count"])
+            with span('transform'):
+                published_on = pd.DataFrame(rows, columns=["Weekday", "Count"])
             fig=px.bar(published_on, x='Weekday', y='Count', orientation='v')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def published_dist_hour(self):
         """
         Analyzes during which hours of the day most articles are published. Output is provided as bar chart.
         """
         if st.button('Show'):
-            data = ap.rss_published_distribution_per_hour(self.collection)
+            data = self._published_distribution('hour')
             rows = []
             for row in data:
                 rows.append([row["_id"], row["count"]])
 
-            published_on = pd.DataFrame(rows, columns=["Hour", "Count"])
+            with span('transform'):
+                published_on = pd.DataFrame(rows, columns=["Hour", "Count"])
 
             fig=px.bar(published_on, x='Hour', y='Count', orientation='v')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
+
+    def _headline_occurences(self, source, limit=None):
+        """
+        Helper function for headline_stats_per_feed_source, reads the counts of
+        update_rss_headline_terms.py or tokenizes the headlines of the source if there are none
+        """
+        if has_documents(self.headline_terms):
+            return Counter({row['term']: row['count'] for row in ap.rss_headline_term_counts(self.headline_terms, source, limit)})
+
+        data = ap.rss_headlines(self.collection)
+        with span('transform'):
+            df = cursor_to_dataframe(data, ap.RSS_HEADLINES_SCHEMA)
+
+        with span('tokenize'):
+            # stop words, numbers and special characters are removed, words are lowercased
+            return text_processing.term_counts(df[df['feed_source']==source]["title"])
 
     def headline_stats_per_feed_source(self):
         """
@@ -226,36 +317,18 @@ class RssAnalyzer:
         source = st.selectbox(label='News Source', options=tuple(self.sources))
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
-
-            data = ap.rss_headlines(self.collection)
-            df = pd.DataFrame(data)
-
-            sws = stopwords.words("english")
-            
             occurences_per_source = {}
-
-            tokenized_titles = list(map(lambda text: nltk.tokenize.wordpunct_tokenize(text), df[df['feed_source']==source]["title"]))
-
-            #remove stop words
-            cleaned_titles_tokenized = [list(filter(lambda word: word.lower() not in sws, title)) for title in tokenized_titles]
-            #remove numbers and special characters
-            pattern = re.compile('\W+')
-            cleaned_titles_tokenized = [list(filter(lambda word: not (pattern.match(word) or word.isdigit()), title)) for title in cleaned_titles_tokenized]
-
-            #flatten list
-            flat_words = []
-            for tokens in cleaned_titles_tokenized:
-                flat_words += tokens
-
-            lowercase_words = list(map(lambda word: word.lower(), flat_words))
-            occurences = Counter(lowercase_words)
             if output_wc == "Yes":
-                wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                occurences = self._headline_occurences(source, WORDCLOUD_MAX_WORDS)
+                wc = WordCloud(max_words=WORDCLOUD_MAX_WORDS).fit_words(occurences)
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
+                occurences = self._headline_occurences(source, limit)
                 occurences_per_source["Count"] = occurences
 
-                result = pd.DataFrame.from_dict(occurences_per_source).fillna(0)
+                with span('transform'):
+                    result = pd.DataFrame.from_dict(occurences_per_source).fillna(0)
                 # print(result)
                 result = result.sort_values(by=["Count"], ascending=False)
                 result["Word"] = result.index
@@ -266,7 +339,21 @@ class RssAnalyzer:
                 result = result[cols]
 
                 st.info(f"Headline word count for {source}")
-                st.table(result[:limit])
+                with span('render'):
+                    st.table(result[:limit])
+
+    def _relative_occurences_from_index(self, source):
+        """
+        Helper function for headline_relative_occurences, divides the counts of a source by the
+        totals of update_rss_headline_terms.py in one vectorized pass
+        """
+        counts = pd.DataFrame(ap.rss_headline_term_counts(self.headline_terms, source), columns=["term", "count"])
+        totals = pd.DataFrame(ap.rss_headline_term_totals(self.headline_term_totals, HEADLINE_COUNT_THRESHOLD), columns=["term", "count"])
+        with span('transform'):
+            merged = counts.merge(totals, on="term", suffixes=("", "_total"))
+            merged["Relative Importance"] = merged["count"] / merged["count_total"]
+            merged = merged[merged["Relative Importance"] >= HEADLINE_RELATIVE_THRESHOLD]
+            return pd.DataFrame({"Source": source, "Keyword": merged["term"], "Relative Importance": merged["Relative Importance"]})
 
     def headline_relative_occurences(self):
         """
@@ -275,55 +362,40 @@ class RssAnalyzer:
         limit = int(st.text_input("Limit", value="30"))
         source_selection = st.selectbox(label='News Source', options=tuple(self.sources))
         if st.button('Show'):
-
-            data = ap.rss_headlines(self.collection)
-            df = pd.DataFrame(data)
-
-            sws = stopwords.words("english")
-            
-            occurences_per_source = {}
-            for source in self.sources:
-                tokenized_titles = list(map(lambda text: nltk.tokenize.wordpunct_tokenize(text), df[df['feed_source']==source]["title"]))
-
-                #remove stop words
-                cleaned_titles_tokenized = [list(filter(lambda word: word.lower() not in sws, title)) for title in tokenized_titles]
-                #remove numbers and special characters
-                pattern = re.compile('\W+')
-                cleaned_titles_tokenized = [list(filter(lambda word: not (pattern.match(word) or word.isdigit()), title)) for title in cleaned_titles_tokenized]
-
-                #flatten list
-                flat_words = []
-                for tokens in cleaned_titles_tokenized:
-                    flat_words += tokens
-
-                lowercase_words = list(map(lambda word: word.lower(), flat_words))
-                occurences = Counter(lowercase_words)
-                occurences_per_source[source] = occurences
-
-
-            super_dict = defaultdict(list)
-            for d in occurences_per_source.values():
-                for k, v in d.items():
-                    if k in super_dict.keys():
-                        super_dict[k] = super_dict[k] + v
-                    else:
-                        super_dict[k] = v
-
-            count_threshold = 100
-
-            relative_word_occurences = {k:{} for k in occurences_per_source.keys()}
-            rows = []
-            for source, d in occurences_per_source.items():
-                    for k, v in d.items():
-                        if super_dict[k] > count_threshold:
-                            relative_probability = float(v/super_dict[k])
-                            if relative_probability >= 0.05:
-                                relative_word_occurences[source][k] = relative_probability
-                                rows.append([source, k, relative_probability])
-
-            result = pd.DataFrame(rows, columns=["Source", "Keyword", "Relative Importance"])
+            if has_documents(self.headline_terms):
+                result = self._relative_occurences_from_index(source_selection)
+            else:
+                data = ap.rss_headlines(self.collection)
+                with span('transform'):
+                    df = cursor_to_dataframe(data, ap.RSS_HEADLINES_SCHEMA)
+
+                occurences_per_source = {source: Counter() for source in self.sources}
+                with span('tokenize'):
+                    # all headlines are tokenized at once, stop words, numbers and special characters are removed
+                    tokenized_titles = text_processing.tokenize_many(df["title"])
+                    for source, tokens in zip(df["feed_source"], tokenized_titles):
+                        if source in occurences_per_source:
+                            occurences_per_source[source].update(tokens)
+
+                super_dict = Counter()
+                for occurences in occurences_per_source.values():
+                    super_dict.update(occurences)
+
+                relative_word_occurences = {k:{} for k in occurences_per_source.keys()}
+                rows = []
+                for source, d in occurences_per_source.items():
+                        for k, v in d.items():
+                            if super_dict[k] > HEADLINE_COUNT_THRESHOLD:
+                                relative_probability = float(v/super_dict[k])
+                                if relative_probability >= HEADLINE_RELATIVE_THRESHOLD:
+                                    relative_word_occurences[source][k] = relative_probability
+                                    rows.append([source, k, relative_probability])
+
+                with span('transform'):
+                    result = pd.DataFrame(rows, columns=["Source", "Keyword", "Relative Importance"])
             result = result.sort_values(by=["Relative Importance"], ascending=False)
             # convert score to percentage with 2 decimal points
             result["Relative Importance"] = result["Relative Importance"].apply(lambda score: f"{score*100:.2f}%")
 
-            st.table(result[result["Source"]==source_selection][:limit])
+            with span('render'):
+                st.table(result[result["Source"]==source_selection][:limit])
@@ -3,6 +3,10 @@ import networkx as nx
 import itertools
 from pyvis.network import Network
 import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client
+from utils.dataframe_loader import cursor_to_dataframe
+from utils.helper_functions import has_profanity_scores, score_unscored_documents
+from utils.instrumentation import span
 import plotly.express as px
 import streamlit as st
 import streamlit.components.v1 as components
@@ -17,7 +21,7 @@ class TwitterAnalyzer:
     """
     Analyzes collected tweets
 
-    :param mongoclient: MongoDB connection client
+    :param mongoclient: MongoDB connection client, defaults to the shared client of the connection manager
     :type mongoclient: pymongo.MongoClient
     """
     static_trend_options = None
@@ -25,20 +29,43 @@ class TwitterAnalyzer:
     valid_dates = None
     user_types = {'longtime': 3650, 'recent': 30, 'bot': 1}
 
-    def __init__(self, mongoclient):
+    def __init__(self, mongoclient=None):
+        if mongoclient is None:
+            mongoclient = get_client()
         self.collection = mongoclient['data']['twitter.tweets']
-        if not TwitterAnalyzer.valid_dates:
-            datestrings_dicts = list(ap.twitter_valid_dates(self.collection))
-            datestrings = list(map(lambda _dict: _dict["_id"], datestrings_dicts))
-            # get strings into list of (year,month,day) as ints
-            year_month_day_list = [(int(datestring[:4]), int(datestring[4:6]), int(datestring[6:])) for datestring in datestrings]
-            dates = list(map(lambda date_triple: datetime(*date_triple), year_month_day_list))
-            TwitterAnalyzer.valid_dates = sorted(dates)
+        self.daily_catalog = mongoclient['analysis']['twitter_daily_catalog']
+        # the catalog is cheap to read, so the valid dates are refreshed on every rerun
+        TwitterAnalyzer.valid_dates = self._valid_dates()
+        if not TwitterAnalyzer.date_selected:
             # pick most recent valid date as default
             TwitterAnalyzer.date_selected = TwitterAnalyzer.valid_dates[-1]
         if not TwitterAnalyzer.static_trend_options:
-            trends = list(ap.twitter_recent_trends(self.collection, TwitterAnalyzer.date_selected))
-            TwitterAnalyzer.static_trend_options = list(map(lambda trend_dict: trend_dict.get('trend'), trends))
+            TwitterAnalyzer.static_trend_options = self._trends(TwitterAnalyzer.date_selected)
+
+    def _valid_dates(self):
+        """
+        Reads the days with tweets from the daily catalog, falls back to scanning all tweets if
+        the catalog has not been filled yet
+        """
+        dates = ap.twitter_catalog_dates(self.daily_catalog)
+        if dates:
+            return dates
+        datestrings_dicts = list(ap.twitter_valid_dates(self.collection))
+        datestrings = list(map(lambda _dict: _dict["_id"], datestrings_dicts))
+        # get strings into list of (year,month,day) as ints
+        year_month_day_list = [(int(datestring[:4]), int(datestring[4:6]), int(datestring[6:])) for datestring in datestrings]
+        dates = list(map(lambda date_triple: datetime(*date_triple), year_month_day_list))
+        return sorted(dates)
+
+    def _trends(self, date):
+        """
+        Reads the top trends of a day from the daily catalog, falls back to aggregating the
+        tweets of that day if the day is not contained in the catalog
+        """
+        trends = ap.twitter_catalog_trends(self.daily_catalog, date)
+        if not trends:
+            trends = ap.twitter_recent_trends(self.collection, date)
+        return list(map(lambda trend_dict: trend_dict.get('trend'), trends))
 
     def hashtags_per_trend(self):
         """
@@ -46,53 +73,64 @@ class TwitterAnalyzer:
         """
         limit = int(st.text_input("Limit", value="30"))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.twitter_hashtags_per_trend(self.collection, limit=limit)))
-            st.table(result)
+            with span('transform'):
+                result = pd.DataFrame(list(ap.twitter_hashtags_per_trend(self.collection, limit=limit)))
+            with span('render'):
+                st.table(result)
 
     def most_common_hashtags(self):
         limit = int(st.text_input("Limit", value="30"))
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.twitter_common_hashtags(self.collection, limit=limit)))
+            with span('transform'):
+                result = pd.DataFrame(list(ap.twitter_common_hashtags(self.collection, limit=limit)))
             result.rename(columns={"_id": "Hashtag", 'count': 'Count'}, inplace=True)
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["Hashtag"].tolist(), result["Count"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 fig=px.bar(result, x='Count', y='Hashtag', orientation='h')
                 fig.update_yaxes(autorange="reversed")
-                st.write(fig)
+                with span('render'):
+                    st.write(fig)
 
     def most_liked_hashtags(self):
         limit = int(st.text_input("Limit", value="30"))
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.twitter_most_liked_hashtags(self.collection, limit=limit)))
+            with span('transform'):
+                result = pd.DataFrame(list(ap.twitter_most_liked_hashtags(self.collection, limit=limit)))
             result.rename(columns={"_id": "Hashtag", 'num_likes': 'Number of Likes'}, inplace=True)
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["Hashtag"].tolist(), result["Number of Likes"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 fig=px.bar(result, x='Number of Likes', y='Hashtag', orientation='h')
                 fig.update_yaxes(autorange="reversed")
-                st.write(fig)
+                with span('render'):
+                    st.write(fig)
 
     def high_interaction_hashtags(self):
         limit = int(st.text_input("Limit", value="30"))
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
-            result = pd.DataFrame(list(ap.twitter_high_interaction_hashtags(self.collection, limit=limit)))
+            with span('transform'):
+                result = pd.DataFrame(list(ap.twitter_high_interaction_hashtags(self.collection, limit=limit)))
             result.rename(columns={"_id": "Hashtag", 'num_replies': 'Number of Replies'}, inplace=True)
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["Hashtag"].tolist(), result["Number of Replies"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 fig=px.bar(result, x='Number of Replies', y='Hashtag', orientation='h')
                 fig.update_yaxes(autorange="reversed")
-                st.write(fig)
+                with span('render'):
+                    st.write(fig)
 
     def create_hashtag_network_from_trend(self):
         """
@@ -101,8 +139,7 @@ class TwitterAnalyzer:
         with st.form("Trends"):
             TwitterAnalyzer.date_selected = st.date_input("Pick a day to see trends from", min_value=TwitterAnalyzer.valid_dates[0], max_value=TwitterAnalyzer.valid_dates[-1])
             if st.form_submit_button("Confirm Date"): 
-                trends = list(ap.twitter_recent_trends(self.collection, TwitterAnalyzer.date_selected))
-                TwitterAnalyzer.static_trend_options = list(map(lambda trend_dict: trend_dict.get('trend'), trends))
+                TwitterAnalyzer.static_trend_options = self._trends(TwitterAnalyzer.date_selected)
         st.info(f"Top Trends from {TwitterAnalyzer.date_selected}")
         if not TwitterAnalyzer.static_trend_options:
             st.warning(f"No Trends available for {TwitterAnalyzer.date_selected}. Please choose another date.")
@@ -133,22 +170,38 @@ class TwitterAnalyzer:
         Analyzes the (cor-)relation between tweet profanity, i.e. use of cursewords, and like count.
         """
         if st.button('Show'):
-            tweets = list(ap.twitter_tweets_with_likes(self.collection))
-            df = pd.DataFrame(tweets)
-            
-            profanity_scores = predict_prob(df["text"])
-            df["profanity_scores"] = profanity_scores
+            if has_profanity_scores(self.collection):
+                # scores stored by score_profanity.py are aggregated on the server, tweets inserted
+                # since its last run are scored here and added to the sums and counts
+                stored = list(ap.twitter_profanity_likes(self.collection))
+                unscored = score_unscored_documents(self.collection, fields={'likes': '$metrics.like_count'})
+                with span('transform'):
+                    stored = pd.DataFrame(stored, columns=['bucket', 'likes', 'count']).astype(
+                        {'likes': 'float64', 'count': 'float64'}).set_index('bucket')
+                    unscored = unscored[unscored['category'].isin(ap.PROFANITY_LABELS)]
+                    added = pd.to_numeric(unscored['likes']).groupby(unscored['category']).agg(['sum', 'count'])
+                    sums = (stored['likes'].fillna(0) * stored['count']).add(added['sum'], fill_value=0)
+                    counts = stored['count'].add(added['count'], fill_value=0)
+                    grouped_bins_avg_likes = (sums / counts).rename('likes').sort_index().to_frame()
+                bin_index = grouped_bins_avg_likes.index.values
+            else:
+                tweets = ap.twitter_tweets_with_likes(self.collection)
+                with span('transform'):
+                    df = cursor_to_dataframe(tweets, ap.TWITTER_TWEETS_WITH_LIKES_SCHEMA)
 
-            pd.cut(df["profanity_scores"], [0, 0.25, 0.5, 0.75, 1])
+                with span('profanity'):
+                    profanity_scores = predict_prob(df["text"])
+                df["profanity_scores"] = profanity_scores
 
-            bins = pd.cut(df["profanity_scores"], bins=[0, 0.25, 0.5, 0.75, 1])
-            grouped_bins_avg_likes = df.groupby(bins)['likes'].mean()
-            bin_index = grouped_bins_avg_likes.index.values.astype('str')
+                bins = pd.cut(df["profanity_scores"], bins=[0, 0.25, 0.5, 0.75, 1])
+                grouped_bins_avg_likes = df.groupby(bins)['likes'].mean()
+                bin_index = grouped_bins_avg_likes.index.values.astype('str')
 
             fig = px.bar(grouped_bins_avg_likes, x=bin_index, y="likes")
             fig.update_layout(xaxis_title="Profanity Scores",
                               yaxis_title="Average Likes")
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def links_tweet_share(self):
         """
@@ -165,9 +218,11 @@ class TwitterAnalyzer:
                 {"count": tweet_total, "label": "Total Tweets"}
             ]
 
-            df = pd.DataFrame(content)
+            with span('transform'):
+                df = pd.DataFrame(content)
             fig = px.pie(df, values="count", names="label")
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def tweet_sentiment_analysis(self):
         """
@@ -182,9 +237,11 @@ class TwitterAnalyzer:
 
             result = [{'count': bucket['count'], 'label': bucket['bucket']} for bucket in tweets]
 
-            df_result = pd.DataFrame(result)
+            with span('transform'):
+                df_result = pd.DataFrame(result)
             fig = px.pie(df_result, values="count", names="label")
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
 
     def tweets_overall_on_map(self):
@@ -192,22 +249,18 @@ class TwitterAnalyzer:
         Creates a map with markers for all geolocations of all tweet data.
         """
         if st.button('Show'):
-            tweets = list(ap.twitter_all_tweets_with_geodata(self.collection))
-
-            for tweet in tweets:
-                tweet['long'] = tweet['geo']['long']
-                tweet['lat'] = tweet['geo']['lat']
-                tweet.pop('geo')
-            
-            df = pd.DataFrame(tweets)
-            df['trend'] = df['trend'].apply(lambda trend: trend.lstrip('#'))
+            tweets = ap.twitter_all_tweets_with_geodata(self.collection)
+            with span('transform'):
+                df = cursor_to_dataframe(tweets, ap.TWITTER_GEODATA_SCHEMA)
+            df['trend'] = df['trend'].astype(str).str.lstrip('#')
             fig = pgo.Figure(data=pgo.Scattergeo(
                 lon=df['long'],
                 lat=df['lat'],
                 text=df['user'] + ": #" + df['trend'],
                 mode='markers'
             ))
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def longtime_user_trends(self):
         """
@@ -218,19 +271,22 @@ class TwitterAnalyzer:
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
             longtime_user_predicate = {"$gte": TwitterAnalyzer.user_types["longtime"]}
-            result = pd.DataFrame(ap.twitter_hashtag_count_per_usertype(self.collection, longtime_user_predicate))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_hashtag_count_per_usertype(self.collection, longtime_user_predicate))
             # result = data.sort_values(by=["count"], ascending=False)
             result = result[:limit]
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["hashtag"].tolist(), result["count"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 #rearrange column order for better output
                 cols = result.columns.tolist()
                 cols = cols[-2:] + cols[:-2]
                 result = result[cols]
-                st.table(result)
+                with span('render'):
+                    st.table(result)
 
     def recent_user_trends(self):
         """
@@ -241,19 +297,22 @@ class TwitterAnalyzer:
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
             longtime_user_predicate = {"$lte": TwitterAnalyzer.user_types["recent"]}
-            result = pd.DataFrame(ap.twitter_hashtag_count_per_usertype(self.collection, longtime_user_predicate))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_hashtag_count_per_usertype(self.collection, longtime_user_predicate))
             # result = data.sort_values(by=["count"], ascending=False)
             result = result[:limit]
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["hashtag"].tolist(), result["count"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 #rearrange column order for better output
                 cols = result.columns.tolist()
                 cols = cols[-2:] + cols[:-2]
                 result = result[cols]
-                st.table(result)
+                with span('render'):
+                    st.table(result)
 
 
     def bot_trends(self):
@@ -265,70 +324,85 @@ class TwitterAnalyzer:
         output_wc = st.radio("Output as Wordcloud", options=tuple(["Yes", "No"]))
         if st.button('Show'):
             longtime_user_predicate = {"$lte": TwitterAnalyzer.user_types["bot"]}
-            result = pd.DataFrame(ap.twitter_hashtag_count_per_usertype(self.collection, longtime_user_predicate))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_hashtag_count_per_usertype(self.collection, longtime_user_predicate))
             # result = data.sort_values(by=["count"], ascending=False)
             result = result[:limit]
             if output_wc == "Yes":
                 occurences = {tag:count for tag,count in zip(result["hashtag"].tolist(), result["count"].tolist())}
                 wc = WordCloud().fit_words(occurences)
-                st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
+                with span('render'):
+                    st.image(wc.to_array(), use_column_width=True,  output_format='PNG')
             else:
                 #rearrange column order for better output
                 cols = result.columns.tolist()
                 cols = cols[-2:] + cols[:-2]
                 result = result[cols]
-                st.table(result)
+                with span('render'):
+                    st.table(result)
 
     def likes_by_membership_duration(self):
         if st.button('Show'):
-            result = pd.DataFrame(ap.twitter_user_stats(self.collection))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_user_stats(self.collection))
             result["_id"] = result["_id"].astype(str)
             result.rename(columns={"avg_likes": "Average Likes"}, inplace=True)
             fig=px.bar(result, x=['< 1 Day', '< 1 Month', '< 1 Year', '< 2 Years', '< 5 Years', '< 10 Years', '< 15 Years', 'More'], y='Average Likes', orientation='v')
             fig.update_xaxes(title_text='Membership Duration')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def followers_by_membership_duration(self):
         if st.button('Show'):
-            result = pd.DataFrame(ap.twitter_user_stats(self.collection))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_user_stats(self.collection))
             result["_id"] = result["_id"].astype(str)
             result.rename(columns={"avg_follower": "Average Number of Followers"}, inplace=True)
             fig=px.bar(result, x=['< 1 Day', '< 1 Month', '< 1 Year', '< 2 Years', '< 5 Years', '< 10 Years', '< 15 Years', 'More'], y='Average Number of Followers', orientation='v')
             fig.update_xaxes(title_text='Membership Duration')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def quoted_by_membership_duration(self):
         if st.button('Show'):
-            result = pd.DataFrame(ap.twitter_user_stats(self.collection))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_user_stats(self.collection))
             result["_id"] = result["_id"].astype(str)
             result.rename(columns={"avg_quoted": "Average Number of Quotations"}, inplace=True)
             fig=px.bar(result, x=['< 1 Day', '< 1 Month', '< 1 Year', '< 2 Years', '< 5 Years', '< 10 Years', '< 15 Years', 'More'], y='Average Number of Quotations', orientation='v')
             fig.update_xaxes(title_text='Membership Duration')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def retweets_by_membership_duration(self):
         if st.button('Show'):
-            result = pd.DataFrame(ap.twitter_user_stats(self.collection))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_user_stats(self.collection))
             result["_id"] = result["_id"].astype(str)
             result.rename(columns={"avg_retweets": "Average Number of Retweets"}, inplace=True)
             fig=px.bar(result, x=['< 1 Day', '< 1 Month', '< 1 Year', '< 2 Years', '< 5 Years', '< 10 Years', '< 15 Years', 'More'], y='Average Number of Retweets', orientation='v')
             fig.update_xaxes(title_text='Membership Duration')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def replies_by_membership_duration(self):
         if st.button('Show'):
-            result = pd.DataFrame(ap.twitter_user_stats(self.collection))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_user_stats(self.collection))
             result["_id"] = result["_id"].astype(str)
             result.rename(columns={"avg_replies": "Average Number of Replies"}, inplace=True)
             fig=px.bar(result, x=['< 1 Day', '< 1 Month', '< 1 Year', '< 2 Years', '< 5 Years', '< 10 Years', '< 15 Years', 'More'], y='Average Number of Replies', orientation='v')
             fig.update_xaxes(title_text='Membership Duration')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
 
     def verified_by_membership_duration(self):
         if st.button('Show'):
-            result = pd.DataFrame(ap.twitter_user_stats(self.collection))
+            with span('transform'):
+                result = pd.DataFrame(ap.twitter_user_stats(self.collection))
             result["verified"] = result["num_verified"] / result["count"]
             result.rename(columns={"verified": "Percentage of verified users"}, inplace=True)
             fig=px.bar(result, x=['< 1 Day', '< 1 Month', '< 1 Year', '< 2 Years', '< 5 Years', '< 10 Years', '< 15 Years', 'More'], y='Percentage of verified users', orientation='v')
             fig.update_xaxes(title_text='Membership Duration')
-            st.write(fig)
+            with span('render'):
+                st.write(fig)
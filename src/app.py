@@ -3,27 +3,47 @@ Script which starts an interactive dashboard based on streamlit where different
 the collected data can be performed 
 """
 
-from analyzers.reddit_analyzer import RedditAnalyzer
-from analyzers.twitter_analyzer import TwitterAnalyzer
-from analyzers.rss_analyzer import RssAnalyzer
-from analyzers.combined_analyzer import CombinedAnalyzer
+from analyzers import load_analyzer_class
 import utils.constants as const
 
+from utils.connection_manager import get_client
+import utils.instrumentation as instrumentation
+
 import logging
-import os
-from pymongo import MongoClient
+import pandas as pd
 import streamlit as st
 
 
+def show_debug_panel(trace):
+    """
+    Shows the timings, counters and peak memory of the last analysis run in the sidebar together
+    with a download of the recent traces as structured log
+
+    :param trace: trace of the last analysis run
+    :type trace: utils.instrumentation.AnalysisTrace
+    """
+    st.sidebar.subheader('Performance')
+    st.sidebar.write(f'Total: {trace.duration:.3f} s')
+    durations = trace.durations_by_kind()
+    st.sidebar.table(pd.DataFrame({'Span': list(durations.keys()),
+                                   'Seconds': [round(duration, 3) for duration in durations.values()]}))
+    st.sidebar.write(f"Documents returned: {trace.counters['documents_returned']}")
+    st.sidebar.write(f"Cache hits: {trace.counters['cache_hits']}, misses: {trace.counters['cache_misses']}")
+    if trace.peak_memory_bytes is not None:
+        # tracemalloc is process-wide, the peak includes the memory of concurrent sessions
+        st.sidebar.write(f'Process peak memory: {trace.peak_memory_bytes / 2**20:.1f} MiB')
+    with st.sidebar.expander('Spans'):
+        st.json(trace.spans)
+    st.sidebar.download_button('Download trace log', data=instrumentation.export_json_lines(instrumentation.recent_traces()),
+                               file_name='analysis_traces.jsonl', mime='application/json')
+
+
 def main():
     """
     Main Method
     """
     try:
-        user = os.environ["MONGO_INITDB_ROOT_USERNAME"] 
-        pw = os.environ["MONGO_INITDB_ROOT_PASSWORD"] 
-        mongo_host = os.environ["MONGO_HOST"]
-        client = MongoClient(mongo_host, 27017, username=user, password=pw)
+        client = get_client()
     except KeyError:
         logging.error('Environment variables for connecting to MongoDB not set')
         return
@@ -41,18 +61,13 @@ def main():
         st.info(f'No analysis implemented for data source {data_source}')
         st.stop()
 
-    analyzer = None
-    if data_source == const.DATA_SOURCE_REDDIT:
-        analyzer = RedditAnalyzer(client)
-    elif data_source == const.DATA_SOURCE_TWITTER:
-        analyzer = TwitterAnalyzer(client)
-    elif data_source == const.DATA_SOURCE_RSS:
-        analyzer = RssAnalyzer(client)
-    elif data_source == const.DATA_SOURCE_COMBINED:
-        analyzer = CombinedAnalyzer(client)
-    else:
+    # the analyzer module is imported only now, when its data source is selected
+    try:
+        analyzer_class = load_analyzer_class(data_source)
+    except KeyError:
         st.warning(f'Data source {data_source} does not exist')
         st.stop()
+    analyzer = analyzer_class(client)
 
 
     # dynamically calling the method corresponding to the analysis that is chosen in the selectbox
@@ -73,7 +88,14 @@ def main():
 
     # Inject CSS with Markdown
     st.markdown(hide_table_row_index, unsafe_allow_html=True)
-    analysis_method()
+
+    # the peak memory is only tracked if ANALYSIS_TRACE_MEMORY is set, tracemalloc slows down every session
+    instrumentation.start_memory_tracking()
+    show_debug = st.sidebar.checkbox('Show performance details')
+    with instrumentation.trace_analysis(analysis, data_source) as trace:
+        analysis_method()
+    if show_debug:
+        show_debug_panel(trace)
 
 if __name__ == '__main__':
     main()
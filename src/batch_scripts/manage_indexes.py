@@ -0,0 +1,66 @@
+"""Managing the indexes required by the aggregation pipelines.
+
+'create' creates all indexes declared in utils.indexes, existing ones are left untouched.
+'explain' runs explain for every pipeline in utils.pipeline_catalog and reports whether it scans
+the whole collection (COLLSCAN) or uses an index (IXSCAN), together with the number of examined
+and returned documents. With --fail-on-collscan it serves as a regression check against a
+local mongod.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.indexes as indexes
+from utils.connection_manager import get_client, close_client
+
+def print_report(rows):
+    """
+    Prints the explain report as table
+    """
+    print(f"{'pipeline':<45} {'command':<10} {'plan':<24} {'docs examined':>14} {'keys examined':>14} {'returned':>10} {'ms':>8}")
+    for row in rows:
+        print(f"{row['pipeline']:<45} {row['command']:<10} {','.join(row['stages']) or '-':<24} "
+              f"{row['docs_examined']:>14} {row['keys_examined']:>14} {row['docs_returned']:>10} {row['execution_time_ms']:>8}")
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('create', help='create all required indexes')
+    explain_parser = subparsers.add_parser('explain', help='report the query plans of all pipelines')
+    explain_parser.add_argument('pipelines', nargs='*', help='only explain these pipeline functions')
+    explain_parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    explain_parser.add_argument('--fail-on-collscan', action='store_true',
+                                help='exit with an error if a pipeline scans a whole collection')
+    explain_parser.add_argument('--allow', nargs='*', default=[],
+                                help='pipelines which are expected to scan a whole collection')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    if args.command == 'create':
+        for collection, names in indexes.ensure_indexes(client).items():
+            print(f'{collection}: {", ".join(names)}')
+    else:
+        rows = indexes.explain_all(client, args.pipelines)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print_report(rows)
+        collscans = sorted({row['pipeline'] for row in rows if row['collscan'] and row['pipeline'] not in args.allow})
+        if args.fail_on_collscan and collscans:
+            print(f'Pipelines scanning a whole collection: {", ".join(collscans)}', file=sys.stderr)
+            close_client()
+            sys.exit(1)
+    close_client()
+
+if __name__ == '__main__':
+    main()
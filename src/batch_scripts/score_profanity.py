@@ -0,0 +1,70 @@
+"""Scoring the profanity of tweets, Reddit post titles, Reddit comments and Reddit comment facts.
+
+The texts are scored once across a process pool and the score is stored with the document
+('profanity', 'title_profanity' for posts). Later runs only score documents without a score,
+use --rescore to score all documents again. The profanity analyses of the dashboard aggregate
+the stored scores as soon as there are any.
+"""
+import argparse
+import logging
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.profanity_store as profanity_store
+from utils.connection_manager import get_client, close_client
+
+TARGETS = ('tweets', 'reddit_posts', 'reddit_comments', 'reddit_comment_facts')
+
+def target_documents(client, target, rescore):
+    """
+    Returns the collection, the score field and the documents to score of a target
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param target: one of TARGETS
+    :type target: str
+    :param rescore: whether to score documents which already have a score
+    :type rescore: bool
+    :return: collection, score field and pairs of `_id` and text
+    :rtype: (pymongo.collection.Collection, str, generator)
+    """
+    if target == 'tweets':
+        collection = client['data']['twitter.tweets']
+        return collection, 'profanity', profanity_store.unscored_documents(collection, 'text', 'profanity', rescore)
+    if target == 'reddit_posts':
+        collection = client['data']['reddit.posts']
+        return collection, 'title_profanity', profanity_store.unscored_documents(collection, 'title', 'title_profanity', rescore)
+    if target == 'reddit_comments':
+        collection = client['analysis']['reddit_comments']
+        return collection, 'profanity', profanity_store.unscored_documents(collection, 'comment', 'profanity', rescore)
+    collection = client['analysis']['reddit_comment_facts']
+    documents = profanity_store.unscored_comment_facts(collection, client['data']['reddit.posts'], 'profanity', rescore)
+    return collection, 'profanity', documents
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', nargs='*', choices=TARGETS, default=list(TARGETS), help='collections to score')
+    parser.add_argument('--processes', type=int, help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--batch-size', type=int, default=profanity_store.DEFAULT_BATCH_SIZE,
+                        help='number of texts scored at once')
+    parser.add_argument('--rescore', action='store_true', help='score documents which already have a score')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    for target in args.targets:
+        logging.info(f'Start scoring the profanity of {target}')
+        collection, field, documents = target_documents(client, target, args.rescore)
+        scored, elapsed = profanity_store.store_scores(collection, documents, field, args.processes, args.batch_size)
+        print(f'{target}: {scored} documents scored in {elapsed:.1f} s ({scored / elapsed if elapsed else 0:.0f} documents/s)')
+    close_client()
+
+if __name__ == '__main__':
+    main()
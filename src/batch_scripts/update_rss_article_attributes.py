@@ -0,0 +1,54 @@
+"""Storing the derived attributes of new RSS articles: the length of the content in characters,
+its number of tokens and the hour and weekday of the publication ('content_length',
+'token_count', 'published_hour', 'published_weekday'). The RSS analyses group
+these stored values on covered indexes instead of measuring every article on every request.
+
+Only articles inserted since the last run are considered, the newest processed article `_id` is
+stored as watermark in 'analysis.watermarks'. Articles which already have the attributes are
+skipped. Use --full to recompute the attributes of all articles.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.article_attributes as article_attributes
+from utils.connection_manager import get_client, close_client
+from utils.watermarks import newest_id, resume_after, set_watermark
+
+WATERMARK_NAME = 'rss_article_attributes'
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=article_attributes.DEFAULT_BATCH_SIZE,
+                        help='number of articles written at once')
+    parser.add_argument('--full', action='store_true', help='recompute the attributes of all articles')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    articles = client['data']['rss.articles']
+    # read before the update, articles arriving meanwhile are processed in the next run
+    newest = newest_id(articles)
+    after = resume_after(client, WATERMARK_NAME, args.full)
+
+    logging.info(f'Start enriching the RSS articles since {after.generation_time if after else "the beginning"}')
+    started = time.perf_counter()
+    enriched = article_attributes.update_attributes(articles, after, args.batch_size, args.full)
+    if newest is not None:
+        set_watermark(client, WATERMARK_NAME, newest)
+    elapsed = time.perf_counter() - started
+    logging.info('Enriching the RSS articles finished')
+    print(f'{enriched} articles enriched in {elapsed:.1f} s ({enriched / elapsed if elapsed else 0:.0f} articles/s)')
+    close_client()
+
+if __name__ == '__main__':
+    main()
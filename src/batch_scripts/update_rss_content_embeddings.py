@@ -0,0 +1,60 @@
+"""Adding the content of new RSS articles to the content embeddings of their news sources in
+the collection 'rss_content_embeddings'. The content similarity of the news sources is computed
+from these embeddings instead of reading every article.
+
+Only articles inserted since the last run are considered, the newest processed article `_id` is
+stored as watermark in 'analysis.watermarks'. Articles are marked once they are added, so they
+are never counted twice. Use --features for embeddings of another size, the dashboard reads the
+embeddings with the default size, and --full to rebuild the embeddings from all articles.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.content_embeddings as content_embeddings
+from utils.connection_manager import get_client, close_client
+from utils.watermarks import delete_watermark, newest_id, resume_after, set_watermark
+
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--features', type=int, default=content_embeddings.DEFAULT_FEATURES,
+                        help='number of features of the embeddings')
+    parser.add_argument('--batch-size', type=int, default=content_embeddings.DEFAULT_BATCH_SIZE,
+                        help='number of articles embedded at once')
+    parser.add_argument('--full', action='store_true', help='rebuild the embeddings from all articles')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    articles = client['data']['rss.articles']
+    store = content_embeddings.get_collection(client)
+    watermark_name = f'rss_content_embeddings.{args.features}'
+    if args.full:
+        content_embeddings.reset_embeddings(store, articles, args.features)
+        delete_watermark(client, watermark_name)
+    # read before the update, articles arriving meanwhile are processed in the next run
+    newest = newest_id(articles)
+    after = resume_after(client, watermark_name)
+
+    logging.info(f'Start adding RSS articles since {after.generation_time if after else "the beginning"} to the content embeddings')
+    started = time.perf_counter()
+    added = content_embeddings.update_embeddings(store, articles, args.features, after, args.batch_size)
+    if newest is not None:
+        set_watermark(client, watermark_name, newest)
+    elapsed = time.perf_counter() - started
+    logging.info('Adding RSS articles to the content embeddings finished')
+    print(f'{added} articles added in {elapsed:.1f} s ({added / elapsed if elapsed else 0:.0f} articles/s)')
+    close_client()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Adding the headlines of new RSS articles to the headline term index, the collections
+'rss_headline_terms' with the number of occurrences per news source and term and
+'rss_headline_term_totals' with the number of occurrences per term. The headline analyses read
+this index instead of tokenizing every headline.
+
+Only articles inserted since the last run are considered, the newest processed article `_id` is
+stored as watermark in 'analysis.watermarks'. Articles are marked once they are added, so they
+are never counted twice. Use --full to rebuild the index from all articles.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.headline_terms as headline_terms
+from utils.connection_manager import get_client, close_client
+from utils.watermarks import newest_id, resume_after, set_watermark
+
+WATERMARK_NAME = 'rss_headline_terms'
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=headline_terms.DEFAULT_BATCH_SIZE,
+                        help='number of articles added at once')
+    parser.add_argument('--full', action='store_true', help='rebuild the index from all articles')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    articles = client['data']['rss.articles']
+    terms, totals = headline_terms.get_collections(client)
+    if args.full:
+        headline_terms.reset_index(terms, totals, articles)
+    # read before the update, articles arriving meanwhile are processed in the next run
+    newest = newest_id(articles)
+    after = resume_after(client, WATERMARK_NAME, args.full)
+
+    logging.info(f'Start adding the headlines of RSS articles since {after.generation_time if after else "the beginning"}')
+    started = time.perf_counter()
+    added = headline_terms.update_index(terms, totals, articles, after, args.batch_size)
+    if newest is not None:
+        set_watermark(client, WATERMARK_NAME, newest)
+    elapsed = time.perf_counter() - started
+    logging.info('Adding the headlines of RSS articles finished')
+    print(f'{added} articles added in {elapsed:.1f} s ({added / elapsed if elapsed else 0:.0f} articles/s)')
+    close_client()
+
+if __name__ == '__main__':
+    main()
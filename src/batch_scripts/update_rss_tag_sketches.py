@@ -0,0 +1,59 @@
+"""Merging the tags of new RSS articles into the MinHash sketches of their news sources in the
+collection 'rss_tag_sketches'. The tag similarity of a single source is answered from these
+sketches and their LSH band index instead of comparing all pairs of sources.
+
+The tags are read in one streaming pass. Only articles inserted since the last run are read, the
+newest processed article `_id` is stored as watermark in 'analysis.watermarks'. Merging a tag
+twice does not change a sketch, so the overlap with the previous run is harmless; the tag
+occurrences of an article are only counted once, counted articles are marked by their field
+'tag_sketch_counted'. Use --full to rebuild the sketches from all articles.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.minhash as minhash
+from utils.connection_manager import get_client, close_client
+from utils.watermarks import newest_id, resume_after, set_watermark
+
+WATERMARK_NAME = 'rss_tag_sketches'
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=minhash.DEFAULT_BATCH_SIZE,
+                        help='number of articles merged at once')
+    parser.add_argument('--full', action='store_true', help='rebuild the sketches from all articles')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    articles = client['data']['rss.articles']
+    store = minhash.get_collection(client)
+    if args.full:
+        # tags removed from the articles only disappear from rebuilt sketches
+        minhash.reset_sketches(store, articles)
+    # read before streaming, articles arriving meanwhile are processed in the next run
+    newest = newest_id(articles)
+    after = resume_after(client, WATERMARK_NAME, args.full)
+
+    logging.info(f'Start merging the tags of RSS articles since {after.generation_time if after else "the beginning"}')
+    started = time.perf_counter()
+    processed = minhash.update_sketches(store, articles, after, args.batch_size)
+    if newest is not None:
+        set_watermark(client, WATERMARK_NAME, newest)
+    elapsed = time.perf_counter() - started
+    logging.info('Merging the tags of RSS articles finished')
+    print(f'{processed} articles merged in {elapsed:.1f} s ({processed / elapsed if elapsed else 0:.0f} articles/s)')
+    close_client()
+
+if __name__ == '__main__':
+    main()
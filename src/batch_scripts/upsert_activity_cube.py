@@ -0,0 +1,63 @@
+"""Filling the collection 'activity_cube' with the number of tweets, Reddit posts and RSS
+articles per source, day and hour (UTC) and the sums of their scores (likes of tweets, scores of
+posts). The activity analyses and the hour by weekday heatmap sum up these cells instead of
+scanning the source collections.
+
+By default only the days of the documents inserted since the last run are recomputed. The
+newest processed `_id` of every source is stored as watermark in 'analysis.watermarks'. Sources
+without a watermark and all sources with --full are recomputed for all days.
+
+The sources are upserted concurrently, each in partitions of a few days. Every cell of a
+recomputed day is replaced, so a day is never counted twice. The progress is recorded in
+'analysis.jobs', a source whose last run failed resumes with the partitions it has not
+completed, unless --restart or --full is given. --dry-run prints the planned partitions.
+"""
+import argparse
+import logging
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client, close_client
+from utils.job_runner import day_partition_job, print_plan, run_jobs
+
+# name of the source, (database, collection), field holding the date and upserting pipeline
+SOURCES = [
+    ('twitter', ('data', 'twitter.tweets'), 'created_at', ap.upserting_activity_cube_for_twitter),
+    ('reddit', ('data', 'reddit.posts'), 'created', ap.upserting_activity_cube_for_reddit),
+    ('rss', ('data', 'rss.articles'), 'published', ap.upserting_activity_cube_for_rss)
+]
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='recompute all days of all sources')
+    parser.add_argument('--sources', nargs='*', choices=[source[0] for source in SOURCES],
+                        help='only upsert these sources')
+    parser.add_argument('--restart', action='store_true', help='do not resume failed runs')
+    parser.add_argument('--dry-run', action='store_true', help='only print the planned partitions')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    jobs = [day_partition_job(client, f'activity_cube.{name}', client[database][collection], date_field, upsert, args.full)
+            for name, (database, collection), date_field, upsert in SOURCES
+            if not args.sources or name in args.sources]
+    if args.dry_run:
+        print_plan(client, jobs, resume=not (args.restart or args.full))
+        close_client()
+        return
+    failed = run_jobs(client, jobs, resume=not (args.restart or args.full))
+    close_client()
+    if failed:
+        logging.error(f'Failed jobs: {", ".join(failed)}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
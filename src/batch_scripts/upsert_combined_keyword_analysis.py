@@ -1,46 +1,60 @@
 """Filling the collection 'combined_keyword_analysis'. Its purpose is the reduction of
 computation time for combined analysis
+
+By default only the days of the documents inserted since the last run are recomputed. The
+newest processed `_id` of every source is stored as watermark in 'analysis.watermarks'. Sources
+without a watermark and all sources with --full are recomputed for all days.
+
+The sources are upserted concurrently, each in partitions of a few days. The progress is
+recorded in 'analysis.jobs', a source whose last run failed resumes with the partitions it has
+not completed, unless --restart or --full is given. --dry-run prints the planned partitions.
 """
-from pymongo import MongoClient
+import argparse
 import logging
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client, close_client
+from utils.job_runner import day_partition_job, print_plan, run_jobs
+
+# name of the source, (database, collection), field holding the date and upserting pipeline
+SOURCES = [
+    ('twitter', ('data', 'twitter.tweets'), 'created_at', ap.upserting_combined_analysis_for_twitter),
+    ('reddit', ('data', 'reddit.posts'), 'created', ap.upserting_combined_analysis_for_reddit),
+    ('rss', ('data', 'rss.articles'), 'published', ap.upserting_combined_analysis_for_rss)
+]
 
 def main():
     """
     Main Method
     """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='recompute all days of all sources')
+    parser.add_argument('--sources', nargs='*', choices=[source[0] for source in SOURCES],
+                        help='only upsert these sources')
+    parser.add_argument('--restart', action='store_true', help='do not resume failed runs')
+    parser.add_argument('--dry-run', action='store_true', help='only print the planned partitions')
+    args = parser.parse_args()
+
     try:
-        user = os.environ["MONGO_INITDB_ROOT_USERNAME"] 
-        pw = os.environ["MONGO_INITDB_ROOT_PASSWORD"] 
-        mongo_host = os.environ["MONGO_HOST"]
-        client = MongoClient(mongo_host, 27017, username=user, password=pw)
+        client = get_client()
     except KeyError:
         logging.error('Environment variables for connecting to MongoDB not set')
         return
 
-    # Twitter
-    logging.info('Start upserting from data source Twitter')
-    collection = client['data']['twitter.tweets']
-    result = ap.upserting_combined_analysis_for_twitter(collection)
-    logging.info(result)
-    logging.info('Upserting from data source Twitter finished')
-
-    # Reddit
-    logging.info('Start upserting from data source Reddit')
-    collection = client['data']['reddit.posts']
-    result = ap.upserting_combined_analysis_for_reddit(collection)
-    logging.info(result)
-    logging.info('Upserting from data source Twitter finished')
-
-    # RSS
-    logging.info('Start upserting from data source RSS')
-    collection = client['data']['rss.articles']
-    result = ap.upserting_combined_analysis_for_rss(collection)
-    logging.info(result)
-    logging.info('Upserting from data source RSS finished')
+    jobs = [day_partition_job(client, f'combined_keyword_analysis.{name}', client[database][collection], date_field, upsert, args.full)
+            for name, (database, collection), date_field, upsert in SOURCES
+            if not args.sources or name in args.sources]
+    if args.dry_run:
+        print_plan(client, jobs, resume=not (args.restart or args.full))
+        close_client()
+        return
+    failed = run_jobs(client, jobs, resume=not (args.restart or args.full))
+    close_client()
+    if failed:
+        logging.error(f'Failed jobs: {", ".join(failed)}')
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,47 @@
+"""Filling the collection 'reddit_comment_facts' with one document per Reddit comment, holding
+the post, subreddit, author, creation time, text length and sentiment of the comment. The Reddit
+comment analyses read these facts instead of unwinding the comments of every post.
+
+By default only the comments of posts inserted since the last run are upserted, the newest
+processed post `_id` is stored as watermark in 'analysis.watermarks'. Use --full to upsert the
+comments of all posts.
+"""
+import argparse
+import logging
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client, close_client
+from utils.watermarks import newest_id, resume_after, set_watermark
+
+WATERMARK_NAME = 'reddit_comment_facts'
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='upsert the comments of all posts')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    collection = client['data']['reddit.posts']
+    # read before the upsert, posts arriving meanwhile are processed in the next run
+    newest = newest_id(collection)
+    after = resume_after(client, WATERMARK_NAME, args.full)
+
+    logging.info(f'Start upserting Reddit comment facts of posts since {after.generation_time if after else "the beginning"}')
+    ap.upserting_reddit_comment_facts(collection, after)
+    if newest is not None:
+        set_watermark(client, WATERMARK_NAME, newest)
+    logging.info('Upserting Reddit comment facts finished')
+    close_client()
+
+if __name__ == '__main__':
+    main()
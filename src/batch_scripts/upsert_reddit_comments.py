@@ -1,38 +1,147 @@
-from pymongo import MongoClient
+"""Filling the collection 'reddit_comments' with the texts of the comments of all Reddit posts.
+
+The comments are streamed in batches and written with unordered bulk upserts. The `_id` of a
+comment is the SHA-1 hash of its text, so every text is stored once. Only the comments of posts
+inserted since the last run are processed, the newest processed post `_id` is stored as watermark
+in 'analysis.watermarks'. Use --full to process the comments of all posts.
+
+Comments stored by earlier versions of this script have an ObjectId as `_id`. They are re-keyed
+to the hash of their text at the start of every run, so the hash windows of the approximate
+analyses cover all comments. The unique index on the text does not allow inserting the re-keyed
+copy first, a batch interrupted between deleting and inserting is restored by a --full run.
+"""
+import argparse
+import hashlib
 import logging
 import os
 import sys
+import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client, close_client
+from utils.watermarks import newest_id, resume_after, set_watermark
+
+WATERMARK_NAME = 'reddit_comments'
+BATCH_SIZE = 5000
+DUPLICATE_KEY_ERROR = 11000
+
+def comment_id(text):
+    """
+    Returns the content hash of a comment, which is used as its `_id`
+
+    :param text: text of the comment
+    :type text: str
+    :return: hex digest
+    :rtype: str
+    """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def rekey_comments(collection):
+    """
+    Replaces the ObjectId `_id` of comments stored by earlier versions of this script with the
+    hash of their text, stored fields like the profanity score are kept
+
+    :param collection: collection 'reddit_comments'
+    :type collection: pymongo.collection.Collection
+    :return: number of re-keyed comments
+    :rtype: int
+    """
+    rekeyed = 0
+    while True:
+        # the _id index returns the ObjectIds as one type bracket, re-keyed comments leave it
+        batch = list(collection.find({'_id': {'$type': 'objectId'}, 'comment': {'$type': 'string'}}).limit(BATCH_SIZE))
+        if not batch:
+            return rekeyed
+        collection.delete_many({'_id': {'$in': [document['_id'] for document in batch]}})
+        try:
+            collection.insert_many([dict(document, _id=comment_id(document['comment'])) for document in batch],
+                                   ordered=False)
+        except BulkWriteError as error:
+            if any(write_error['code'] != DUPLICATE_KEY_ERROR for write_error in error.details['writeErrors']):
+                raise
+        rekeyed += len(batch)
+
+def write_batch(collection, texts):
+    """
+    Upserts a batch of distinct comment texts
+
+    :param collection: collection 'reddit_comments'
+    :type collection: pymongo.collection.Collection
+    :param texts: comment texts by their hash
+    :type texts: dict
+    :return: number of inserted comments and of comments which were already stored
+    :rtype: (int, int)
+    """
+    requests = [UpdateOne({'_id': key}, {'$setOnInsert': {'comment': text}}, upsert=True) for key, text in texts.items()]
+    try:
+        result = collection.bulk_write(requests, ordered=False)
+        inserted = result.upserted_count
+    except BulkWriteError as error:
+        # a text stored concurrently by another run is rejected by the unique index on the text
+        errors = error.details['writeErrors']
+        if any(write_error['code'] != DUPLICATE_KEY_ERROR for write_error in errors):
+            raise
+        inserted = error.details['nUpserted']
+    return inserted, len(texts) - inserted
 
 def main():
     """
     Main Method
     """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--full', action='store_true', help='process the comments of all posts')
+    args = parser.parse_args()
+
     try:
-        user = os.environ["MONGO_INITDB_ROOT_USERNAME"] 
-        pw = os.environ["MONGO_INITDB_ROOT_PASSWORD"] 
-        mongo_host = os.environ["MONGO_HOST"]
-        client = MongoClient(mongo_host, 27017, username=user, password=pw)
+        client = get_client()
     except KeyError:
         logging.error('Environment variables for connecting to MongoDB not set')
         return
 
     reddit_collection = client['data']['reddit.posts']
     reddit_comments_collection = client['analysis']['reddit_comments']
-    logging.info('Start upserting Reddit comments')
-    result = list(ap.get_all_reddit_comments(reddit_collection))
-    duplicates = 0
-    success = 0
-    for row in result:
-        try:
-            reddit_comments_collection.insert_one({'comment': row.get('text')})
-            success = success + 1
-        except Exception:
-            duplicates = duplicates + 1
+    # read before streaming, posts arriving meanwhile are processed in the next run
+    newest = newest_id(reddit_collection)
+    after = resume_after(client, WATERMARK_NAME, args.full)
+    rekeyed = rekey_comments(reddit_comments_collection)
+    if rekeyed:
+        logging.info(f'{rekeyed} comments re-keyed to the hash of their text')
+    logging.info(f'Start upserting Reddit comments of posts since {after.generation_time if after else "the beginning"}')
+
+    started = time.perf_counter()
+    processed = inserted = duplicates = skipped = 0
+    cursor = ap.get_all_reddit_comments(reddit_collection, after).batch_size(BATCH_SIZE)
+    batch = {}
+    for row in cursor:
+        processed += 1
+        text = row.get('text')
+        if not text:
+            skipped += 1
+            continue
+        key = comment_id(text)
+        if key in batch:
+            duplicates += 1
+            continue
+        batch[key] = text
+        if len(batch) == BATCH_SIZE:
+            batch_inserted, batch_duplicates = write_batch(reddit_comments_collection, batch)
+            inserted += batch_inserted
+            duplicates += batch_duplicates
+            batch = {}
+    if batch:
+        batch_inserted, batch_duplicates = write_batch(reddit_comments_collection, batch)
+        inserted += batch_inserted
+        duplicates += batch_duplicates
+    if newest is not None:
+        set_watermark(client, WATERMARK_NAME, newest)
+    elapsed = time.perf_counter() - started
 
     logging.info('Upserting of Reddit comments finished')
-    print(f'{success} entries inserted, {duplicates} Duplicates were found')
+    print(f'{processed} comments processed in {elapsed:.1f} s ({processed / elapsed if elapsed else 0:.0f} comments/s): '
+          f'{inserted} inserted, {duplicates} duplicates, {skipped} skipped without text')
+    close_client()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,44 @@
+"""Filling the collection 'twitter_daily_catalog' with the number of tweets and the top trends
+of every day. By default only the most recent day in the catalog and the days after it are
+recomputed, use --full to rebuild the whole catalog.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import timedelta
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.aggregation_pipelines as ap
+from utils.connection_manager import get_client, close_client
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--full', action='store_true', help='rebuild the catalog for all days')
+    args = parser.parse_args()
+
+    try:
+        client = get_client()
+    except KeyError:
+        logging.error('Environment variables for connecting to MongoDB not set')
+        return
+
+    collection = client['data']['twitter.tweets']
+    catalog = client['analysis']['twitter_daily_catalog']
+    since = None
+    if not args.full:
+        latest_day = catalog.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        if latest_day:
+            # the latest day was probably incomplete during the last run, tweets of the day
+            # before are recomputed as well to cover late arriving tweets
+            since = latest_day['_id'] - timedelta(days=1)
+
+    logging.info(f'Start upserting daily catalog of tweets since {since or "the beginning"}')
+    ap.upserting_twitter_daily_catalog(collection, since)
+    logging.info('Upserting daily catalog of tweets finished')
+    close_client()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Compares the distinct tweet counting of upserting_combined_analysis_for_twitter with the
+previous implementation, which collected the ids of all tweets per (keyword, day) group with
+$addToSet and took the size of the set.
+
+Both pipelines run on the tweets of a local mongod (default mongodb://localhost:27017), filled
+with synthetic tweets up to --size. Instead of merging into combined_keyword_analysis, both
+pipelines end with a checksum of their groups, so they can be compared without writing. The
+report contains the latencies, whether the grouping spilled to disk and the number of groups.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymongo import MongoClient
+
+import utils.aggregation_pipelines as ap
+import utils.pipeline_catalog as catalog
+from utils.indexes import PipelineRecorder
+from pipeline_benchmark import DEFAULT_URI, fill_collections
+
+# stages of the previous implementation between the day truncation and the threshold
+LEGACY_STAGES = [
+    {
+        '$addFields': {
+            'trend_and_hashtags': {
+                '$concatArrays': [[{'$ltrim': {'input': '$trend', 'chars': '#'}}], '$hashtags']
+            }
+        }
+    }, {
+        '$project': {
+            'created_at_trunc': {
+                '$dateFromParts': {
+                    'year': {'$year': '$created_at'},
+                    'month': {'$month': '$created_at'},
+                    'day': {'$dayOfMonth': '$created_at'}
+                }
+            },
+            'trend_and_hashtags': 1
+        }
+    }, {
+        '$unwind': {'path': '$trend_and_hashtags'}
+    }, {
+        '$group': {
+            '_id': {'keyword': {'$toLower': '$trend_and_hashtags'}, 'date': '$created_at_trunc', 'source': 'twitter'},
+            'ids': {'$addToSet': '$_id'}
+        }
+    }, {
+        '$project': {'count': {'$size': '$ids'}}
+    }, {
+        '$match': {'count': {'$gte': 10}}
+    }
+]
+
+# replaces $merge, the groups are summarized instead of written
+CHECKSUM_STAGE = {'$group': {'_id': None, 'groups': {'$sum': 1}, 'tweets': {'$sum': '$count'}}}
+
+
+def current_stages(collection):
+    """
+    Returns the stages of the current implementation without $merge
+
+    :param collection: collection of tweets
+    :type collection: pymongo.collection.Collection
+    :return: aggregation pipeline
+    :rtype: list
+    """
+    recorder = PipelineRecorder(collection)
+    ap.upserting_combined_analysis_for_twitter(recorder)
+    stages = recorder.commands[0]['pipeline']
+    return [stage for stage in stages if '$merge' not in stage]
+
+
+def used_disk(collection, pipeline):
+    """
+    Returns whether a stage of the pipeline spilled to disk according to explain
+
+    :param collection: collection of tweets
+    :type collection: pymongo.collection.Collection
+    :param pipeline: aggregation pipeline
+    :type pipeline: list
+    :return: True if a stage reports usedDisk
+    :rtype: bool
+    """
+    explain = collection.database.command('explain', {'aggregate': collection.name, 'pipeline': pipeline, 'cursor': {}},
+                                          verbosity='executionStats')
+    return '"usedDisk": true' in json.dumps(explain, default=str)
+
+
+def run(collection, pipeline, repeat):
+    latencies = []
+    summary = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        summary = next(collection.aggregate(pipeline, allowDiskUse=True), None)
+        latencies.append(time.perf_counter() - started)
+    return {
+        'latency_s': {'min': min(latencies), 'median': statistics.median(latencies), 'max': max(latencies)},
+        'used_disk': used_disk(collection, pipeline),
+        'groups': summary['groups'] if summary else 0,
+        'tweets': summary['tweets'] if summary else 0
+    }
+
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=DEFAULT_URI, help='connection string of the local mongod')
+    parser.add_argument('--size', type=int, default=1000000, help='number of tweets')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per implementation')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the synthetic data generator')
+    parser.add_argument('--output', default='combined_keyword_benchmark.json', help='path of the JSON report')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    fill_collections(client, args.size, args.seed, [catalog.TWITTER_TWEETS])
+    database, name = catalog.TWITTER_TWEETS
+    collection = client[database][name]
+
+    report = {'size': args.size, 'repeat': args.repeat}
+    report['legacy'] = run(collection, LEGACY_STAGES + [CHECKSUM_STAGE], args.repeat)
+    report['current'] = run(collection, current_stages(collection) + [CHECKSUM_STAGE], args.repeat)
+    for implementation in ('legacy', 'current'):
+        result = report[implementation]
+        print(f"{implementation:<8} {result['latency_s']['median']:10.3f} s  used disk: {result['used_disk']!s:<5}  "
+              f"groups: {result['groups']}  tweets: {result['tweets']}", file=sys.stderr)
+    if (report['legacy']['groups'], report['legacy']['tweets']) != (report['current']['groups'], report['current']['tweets']):
+        print('The implementations count different groups', file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
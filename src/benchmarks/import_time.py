@@ -0,0 +1,92 @@
+"""Measures the cold import time of the dashboard and of every analyzer module. Each module is
+imported in a fresh interpreter, like on the first start of a new container. The script fails
+if importing the app, i.e. everything loaded before the first widget is drawn, exceeds the budget.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+STARTUP_MODULE = 'app'
+MODULES = [
+    STARTUP_MODULE,
+    'analyzers.reddit_analyzer',
+    'analyzers.twitter_analyzer',
+    'analyzers.rss_analyzer',
+    'analyzers.combined_analyzer'
+]
+DEFAULT_BUDGET_SECONDS = 2.0
+
+
+def _import_times(statement):
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement],
+                             cwd=SRC_DIRECTORY, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f'Running {statement} failed:\n{process.stderr}')
+    times = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|', 2)
+        # the name is indented by two spaces per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times.append((name.strip(), depth, int(cumulative_us)))
+    return times
+
+
+def measure_import(module, top=5):
+    """
+    Imports a module in a fresh interpreter with -X importtime
+
+    :param module: name of the module to import
+    :type module: str
+    :param top: number of the slowest transitively imported packages to report
+    :type top: int
+    :return: total import time in seconds and the slowest imported packages
+    :rtype: (float, list)
+    """
+    interpreter_startup = {name for name, _, _ in _import_times('pass')}
+    times = [entry for entry in _import_times(f'import {module}') if entry[0] not in interpreter_startup]
+    total = sum(cumulative for _, depth, cumulative in times if depth == 0)
+    packages = {}
+    for name, depth, cumulative in times:
+        if depth > 0 and '.' not in name and not name.startswith('_'):
+            packages[name] = max(packages.get(name, 0), cumulative)
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return total / 1e6, [(package, micros / 1e6) for package, micros in slowest]
+
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help='maximum import time of the app in seconds')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+
+    report = []
+    for module in MODULES:
+        seconds, slowest = measure_import(module)
+        report.append({'module': module, 'seconds': seconds, 'slowest_imports': slowest})
+
+    if args.json:
+        print(json.dumps({'budget_seconds': args.budget, 'modules': report}, indent=2))
+    else:
+        for entry in report:
+            print(f"{entry['module']:<32} {entry['seconds']:8.3f} s")
+            for package, seconds in entry['slowest_imports']:
+                print(f"    {package:<28} {seconds:8.3f} s")
+
+    startup = next(entry for entry in report if entry['module'] == STARTUP_MODULE)
+    if startup['seconds'] > args.budget:
+        print(f"Startup import time {startup['seconds']:.3f} s exceeds the budget of {args.budget:.3f} s", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Benchmarks every aggregation pipeline and the analyzer computations on synthetic data.
+
+The collections of the data sources are filled with synthetic documents up to each of the
+given sizes, then every pipeline of utils.pipeline_catalog and every analyzer computation is
+timed. The report contains latency, throughput and peak client memory per function and is
+written as JSON, so runs before and after a change can be compared.
+
+Only run this against a local mongod (default mongodb://localhost:27017), the pipelines read
+the databases 'data' and 'analysis' of the given instance and the generator writes into them.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# results have to be computed on every run instead of being served from the result cache
+os.environ['PIPELINE_CACHE_TTL'] = '0'
+os.environ.pop('RESULT_CACHE_DIR', None)
+
+from pymongo import MongoClient
+
+import utils.aggregation_pipelines as ap
+import utils.pipeline_catalog as catalog
+from utils.indexes import ensure_indexes
+from synthetic_data import SyntheticData, load
+
+DEFAULT_URI = 'mongodb://localhost:27017'
+
+
+def _analyzer_computation(module_name, class_name, method_name, **kwargs):
+    def run(client):
+        module = __import__(module_name, fromlist=[class_name])
+        analyzer = getattr(module, class_name)(client)
+        return getattr(analyzer, method_name)(**kwargs)
+    return run
+
+
+# computations of the analyzers besides the pipelines, (name, collection, function of the client)
+ANALYZER_COMPUTATIONS = [
+    ('RssAnalyzer._tag_similarity', catalog.RSS_ARTICLES,
+     _analyzer_computation('analyzers.rss_analyzer', 'RssAnalyzer', '_tag_similarity')),
+    ('RssAnalyzer._content_similarity', catalog.RSS_ARTICLES,
+     _analyzer_computation('analyzers.rss_analyzer', 'RssAnalyzer', '_content_similarity'))
+]
+
+
+def fill_collections(client, size, seed, collections=None):
+    """
+    Tops up the collections of all data sources to the given number of documents
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param size: number of documents per collection
+    :type size: int
+    :param seed: seed of the generator
+    :type seed: int
+    :param collections: only fills these (database, collection) pairs
+    :type collections: list
+    """
+    factories = {
+        catalog.REDDIT_POSTS: SyntheticData.reddit_post,
+        catalog.TWITTER_TWEETS: SyntheticData.tweet,
+        catalog.RSS_ARTICLES: SyntheticData.rss_article
+    }
+    for (database, name), factory in factories.items():
+        if collections and (database, name) not in collections:
+            continue
+        collection = client[database][name]
+        existing = collection.estimated_document_count()
+        if existing > size:
+            collection.drop()
+            existing = 0
+        missing = size - existing
+        if missing > 0:
+            # the seed depends on the existing documents, so topping up does not repeat them
+            generator = SyntheticData(seed + existing)
+            started = time.perf_counter()
+            load(collection, lambda: factory(generator), missing)
+            print(f'Generated {missing} documents in {database}.{name} in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+
+
+def measure(func, repeat):
+    """
+    Runs a function repeatedly and measures its latency, then runs it once more with tracemalloc
+    to measure its peak memory on the client without distorting the latencies
+
+    :param func: function without arguments returning a list
+    :type func: callable
+    :param repeat: number of timed runs
+    :type repeat: int
+    :return: latencies in seconds, peak memory in bytes and number of returned documents
+    :rtype: (list, int, int)
+    """
+    latencies = []
+    returned = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        latencies.append(time.perf_counter() - started)
+        returned = len(result)
+        del result
+    tracemalloc.start()
+    result = func()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return latencies, peak_memory, returned
+
+
+def report_entry(kind, name, collection, size, latencies, peak_memory, returned):
+    median = statistics.median(latencies)
+    return {
+        'kind': kind,
+        'name': name,
+        'collection': '.'.join(collection),
+        'collection_size': size,
+        'latency_s': {'min': min(latencies), 'median': median, 'max': max(latencies)},
+        'throughput_docs_per_s': size / median if median else None,
+        'docs_returned': returned,
+        'peak_memory_bytes': peak_memory
+    }
+
+
+def run_benchmarks(client, size, repeat, names=None):
+    """
+    Times every cataloged pipeline and analyzer computation
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param size: number of documents per collection
+    :type size: int
+    :param repeat: number of runs per function
+    :type repeat: int
+    :param names: restricts the benchmark to these functions
+    :type names: list
+    :return: report entries
+    :rtype: list
+    """
+    entries = []
+    for pipeline in catalog.PIPELINES:
+        if names and pipeline['name'] not in names:
+            continue
+        collection = catalog.get_collection(client, pipeline)
+        func = getattr(ap, pipeline['name'])
+        func = getattr(func, '__wrapped__', func)
+        run = lambda: list(func(collection, **pipeline['kwargs']))
+        latencies, peak_memory, returned = measure(run, repeat)
+        entries.append(report_entry('pipeline', pipeline['name'], pipeline['collection'], size, latencies, peak_memory, returned))
+        print(f"{pipeline['name']:<50} {statistics.median(latencies):10.3f} s", file=sys.stderr)
+    for name, collection, computation in ANALYZER_COMPUTATIONS:
+        if names and name not in names:
+            continue
+        latencies, peak_memory, returned = measure(lambda: computation(client), repeat)
+        entries.append(report_entry('analyzer', name, collection, size, latencies, peak_memory, returned))
+        print(f"{name:<50} {statistics.median(latencies):10.3f} s", file=sys.stderr)
+    return entries
+
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default=DEFAULT_URI, help='connection string of the local mongod')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='numbers of documents per collection, e.g. 10000 1000000 50000000')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per function')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the synthetic data generator')
+    parser.add_argument('--only', nargs='*', help='only benchmark these pipelines or computations')
+    parser.add_argument('--no-indexes', action='store_true', help='benchmark without the required indexes')
+    parser.add_argument('--output', default='pipeline_benchmark.json', help='path of the JSON report')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    if not args.no_indexes:
+        ensure_indexes(client)
+
+    report = {
+        'started': datetime.utcnow().isoformat(),
+        'mongodb_version': client.server_info()['version'],
+        'python_version': platform.python_version(),
+        'repeat': args.repeat,
+        'indexes': not args.no_indexes,
+        'results': []
+    }
+    for size in sorted(args.sizes):
+        fill_collections(client, size, args.seed)
+        report['results'].extend(run_benchmarks(client, size, args.repeat, args.only))
+
+    with open(args.output, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+    print(f'Report written to {args.output}', file=sys.stderr)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
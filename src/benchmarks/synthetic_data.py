@@ -0,0 +1,175 @@
+"""
+Module generating synthetic Reddit posts, tweets and RSS articles with the fields read by the
+aggregation pipelines. Words, keywords, hashtags and sources follow a Zipf-like distribution,
+so group sizes are as skewed as in the scraped data. The same seed produces the same documents.
+"""
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from utils.article_attributes import article_attributes
+from utils.constants import SUBREDDITS
+
+START_DATE = datetime(2022, 5, 1)
+PERIOD_DAYS = 120
+VOCABULARY_SIZE = 20000
+NUM_HASHTAGS = 5000
+NUM_TRENDS = 800
+NUM_FEED_SOURCES = 300
+NUM_AUTHORS = 200000
+NUM_DOMAINS = 500
+DEFAULT_BATCH_SIZE = 5000
+
+
+class SyntheticData:
+    """
+    Generator for synthetic documents of all data sources
+
+    :param seed: seed of the random number generator
+    :type seed: int
+    """
+    def __init__(self, seed=42):
+        self.rng = random.Random(seed)
+        self.vocabulary = [f'word{i}' for i in range(VOCABULARY_SIZE)]
+        self.vocabulary_weights = self._zipf_weights(VOCABULARY_SIZE)
+        self.hashtags = [f'Tag{i}' for i in range(NUM_HASHTAGS)]
+        self.hashtag_weights = self._zipf_weights(NUM_HASHTAGS)
+        self.trends = [f'#Trend{i}' for i in range(NUM_TRENDS)]
+        self.trend_weights = self._zipf_weights(NUM_TRENDS)
+        self.feed_sources = [f'Source {i}' for i in range(NUM_FEED_SOURCES)]
+        self.feed_source_weights = self._zipf_weights(NUM_FEED_SOURCES)
+        self.domains = [f'news{i}.example.com' for i in range(NUM_DOMAINS)]
+        self.domain_weights = self._zipf_weights(NUM_DOMAINS)
+
+    @staticmethod
+    def _zipf_weights(size):
+        # cumulative weights, so random.choices does not accumulate them on every draw
+        return list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+    def _words(self, count):
+        return self.rng.choices(self.vocabulary, cum_weights=self.vocabulary_weights, k=count)
+
+    def _text(self, min_words, max_words):
+        return ' '.join(self._words(self.rng.randint(min_words, max_words)))
+
+    def _timestamp(self):
+        return START_DATE + timedelta(seconds=self.rng.randrange(PERIOD_DAYS * 24 * 3600))
+
+    def _author(self):
+        return f'user{int(self.rng.paretovariate(1.2)) % NUM_AUTHORS}'
+
+    def _sentiment(self):
+        return {'compound': round(self.rng.uniform(-1, 1), 4)}
+
+    def reddit_post(self):
+        """
+        Generates a document of the collection reddit.posts
+
+        :return: reddit post
+        :rtype: dict
+        """
+        created = self._timestamp()
+        comments = []
+        for _ in range(min(int(self.rng.expovariate(1 / 8)), 500)):
+            comments.append({
+                'text': self._text(3, 80),
+                'author': {'name': self._author()},
+                'created': created + timedelta(minutes=self.rng.randrange(2880)),
+                'sentiment': self._sentiment()
+            })
+        return {
+            'id': f'{self.rng.getrandbits(40):x}',
+            'title': self._text(5, 20),
+            'reddit': {'subreddit': self.rng.choice(SUBREDDITS)},
+            'author': {'name': self._author()},
+            'created': created,
+            'score': int(self.rng.paretovariate(1.1)),
+            'upvote_ratio': round(self.rng.uniform(0.3, 1.0), 2),
+            'domain': self.rng.choices(self.domains, cum_weights=self.domain_weights)[0],
+            'keywords': list(set(self._words(self.rng.randint(0, 8)))),
+            'sentiment': self._sentiment(),
+            'comments': comments
+        }
+
+    def tweet(self):
+        """
+        Generates a document of the collection twitter.tweets
+
+        :return: tweet
+        :rtype: dict
+        """
+        created_at = self._timestamp()
+        hashtags = list(set(self.rng.choices(self.hashtags, cum_weights=self.hashtag_weights, k=self.rng.randint(0, 6))))
+        text = self._text(5, 40)
+        if self.rng.random() < 0.3:
+            text += ' https://t.co/' + f'{self.rng.getrandbits(40):x}'
+        tweet = {
+            'text': text,
+            'trend': self.rng.choices(self.trends, cum_weights=self.trend_weights)[0],
+            'hashtags': hashtags,
+            'created_at': created_at,
+            'metrics': {
+                'like_count': int(self.rng.paretovariate(1.3)) - 1,
+                'reply_count': int(self.rng.paretovariate(2)) - 1,
+                'retweet_count': int(self.rng.paretovariate(1.5)) - 1,
+                'quote_count': int(self.rng.paretovariate(2.5)) - 1
+            },
+            'author': {
+                'username': self._author(),
+                'created_at': created_at - timedelta(days=self.rng.expovariate(1 / 1500)),
+                'num_followers': int(self.rng.paretovariate(1.1)),
+                'verified': self.rng.random() < 0.02
+            },
+            'sentiment': self._sentiment()
+        }
+        if self.rng.random() < 0.02:
+            tweet['geo'] = {'long': round(self.rng.uniform(-180, 180), 5), 'lat': round(self.rng.uniform(-90, 90), 5)}
+        return tweet
+
+    def rss_article(self):
+        """
+        Generates a document of the collection rss.articles
+
+        :return: rss article
+        :rtype: dict
+        """
+        published_roll = self.rng.random()
+        if published_roll < 0.9:
+            published = self._timestamp()
+        elif published_roll < 0.95:
+            published = self._timestamp().strftime('%a, %d %b %Y %H:%M:%S')
+        else:
+            published = None
+        article = {
+            'title': self._text(4, 14),
+            'feed_source': self.rng.choices(self.feed_sources, cum_weights=self.feed_source_weights)[0],
+            'content': self._text(50, 1200),
+            'tags': list(set(self._words(self.rng.randint(0, 10)))),
+            'published': published
+        }
+        # enriched like on ingest
+        article.update(article_attributes(article))
+        return article
+
+
+def load(collection, factory, count, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Inserts generated documents into a collection in batches
+
+    :param collection: target collection
+    :type collection: pymongo.collection.Collection
+    :param factory: function without arguments generating one document
+    :type factory: callable
+    :param count: number of documents to insert
+    :type count: int
+    :param batch_size: number of documents per insert_many
+    :type batch_size: int
+    :return: number of inserted documents
+    :rtype: int
+    """
+    inserted = 0
+    while inserted < count:
+        batch = [factory() for _ in range(min(batch_size, count - inserted))]
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
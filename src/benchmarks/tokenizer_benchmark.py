@@ -0,0 +1,128 @@
+"""Compares the tokenization of utils.text_processing with the previous inline code of the RSS
+analyses, which tokenized every text with nltk.tokenize.wordpunct_tokenize, looked up stopwords
+in a list and filtered numbers and special characters with one lambda per step.
+
+The texts are synthetic headlines or article contents of vocabulary words mixed with stopwords,
+numbers and punctuation. Both implementations normalize them like the headline analyses, the
+report contains the latencies and the throughput in tokens per second, and tokenize_many is also
+timed across a process pool with --processes.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import nltk
+
+from utils import stopwords, text_processing
+from synthetic_data import SyntheticData
+
+PUNCTUATION = (',', '.', ':', '!', '?', '-', '"', "'s", '...', '(', ')')
+
+
+def synthetic_texts(size, min_words, max_words, seed):
+    """
+    Generates texts of vocabulary words, stopwords, numbers and punctuation
+
+    :param size: number of texts
+    :type size: int
+    :param min_words: minimum number of words of a text
+    :type min_words: int
+    :param max_words: maximum number of words of a text
+    :type max_words: int
+    :param seed: seed of the random number generator
+    :type seed: int
+    :return: texts
+    :rtype: list
+    """
+    data = SyntheticData(seed)
+    rng = data.rng
+    sws = stopwords.words('english')
+    texts = []
+    for _ in range(size):
+        words = []
+        for word in data._words(rng.randint(min_words, max_words)):
+            roll = rng.random()
+            if roll < 0.4:
+                words.append(rng.choice(sws).capitalize() if roll < 0.05 else rng.choice(sws))
+            elif roll < 0.45:
+                words.append(str(rng.randrange(10000)))
+            words.append(word + rng.choice(PUNCTUATION) if roll > 0.9 else word)
+        texts.append(' '.join(words))
+    return texts
+
+
+def legacy_normalize(texts):
+    """
+    The previous inline normalization of the headline analyses
+
+    :param texts: texts to normalize
+    :type texts: list
+    :return: normalized tokens per text
+    :rtype: list
+    """
+    sws = stopwords.words('english')
+    tokenized_titles = list(map(lambda text: nltk.tokenize.wordpunct_tokenize(text), texts))
+    cleaned_titles_tokenized = [list(filter(lambda word: word.lower() not in sws, title)) for title in tokenized_titles]
+    pattern = re.compile(r'\W+')
+    cleaned_titles_tokenized = [list(filter(lambda word: not (pattern.match(word) or word.isdigit()), title))
+                                for title in cleaned_titles_tokenized]
+    return [list(map(lambda word: word.lower(), title)) for title in cleaned_titles_tokenized]
+
+
+def run(normalize, texts, tokens, repeat):
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = normalize(texts)
+        latencies.append(time.perf_counter() - started)
+    median = statistics.median(latencies)
+    return {
+        'latency_s': {'min': min(latencies), 'median': median, 'max': max(latencies)},
+        'tokens_per_s': tokens / median if median > 0 else None
+    }, result
+
+
+def main():
+    """
+    Main Method
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100000, help='number of texts')
+    parser.add_argument('--min-words', type=int, default=4, help='minimum number of words of a text')
+    parser.add_argument('--max-words', type=int, default=14, help='maximum number of words of a text')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='worker processes of the parallel run, 0 for the number of CPUs')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per implementation')
+    parser.add_argument('--seed', type=int, default=42, help='seed of the synthetic data generator')
+    parser.add_argument('--output', default='tokenizer_benchmark.json', help='path of the JSON report')
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.size, args.min_words, args.max_words, args.seed)
+    # the throughput is measured in tokens before normalization
+    tokens = sum(len(text_processing.tokenize(text)) for text in texts)
+    report = {'size': args.size, 'tokens': tokens, 'repeat': args.repeat}
+
+    report['legacy'], expected = run(legacy_normalize, texts, tokens, args.repeat)
+    report['current'], current = run(text_processing.tokenize_many, texts, tokens, args.repeat)
+    report['parallel'], parallel = run(lambda batch: text_processing.tokenize_many(batch, processes=args.processes),
+                                       texts, tokens, args.repeat)
+    report['parallel']['used_pool'] = args.processes != 1 and args.size >= text_processing.PARALLEL_THRESHOLD
+    for implementation in ('legacy', 'current', 'parallel'):
+        result = report[implementation]
+        print(f"{implementation:<8} {result['latency_s']['median']:10.3f} s  "
+              f"{result['tokens_per_s'] or 0:14,.0f} tokens/s", file=sys.stderr)
+    if current != expected or parallel != expected:
+        print('The implementations return different tokens', file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,38 @@
 """
-Module for MongoDB aggregation pipelines on different collections
+Module for MongoDB aggregation pipelines on different collections. Pipelines returning
+aggregated results are cached with utils.result_cache and return a list instead of a
+cursor, pipelines transferring raw documents or writing results are not cached.
 """
 from datetime import datetime, timedelta
+from utils.instrumentation import traced_pipeline
+from utils.result_cache import cached_pipeline
 
+# the source catalog is refreshed at least every five minutes, and earlier when articles arrive
+SOURCE_CATALOG_TTL_SECONDS = 300
+# number of trends offered per day in the twitter analyses
+TRENDS_PER_DAY = 100
 
+# column dtypes of pipelines transferring raw documents, for utils.dataframe_loader
+RSS_CONTENT_SCHEMA = {'feed_source': 'category', 'content': 'object'}
+RSS_HEADLINES_SCHEMA = {'feed_source': 'category', 'title': 'object'}
+TWITTER_TWEETS_WITH_LIKES_SCHEMA = {'likes': 'float64', 'text': 'object'}
+RSS_SOURCE_TAG_COUNTS_SCHEMA = {'feed_source': 'category', 'tag': 'category', 'count': 'int64'}
+TWITTER_GEODATA_SCHEMA = {'created_at': 'datetime64[ns]', 'long': 'float64', 'lat': 'float64', 'user': 'object', 'trend': 'category'}
+
+# labels of _sentiment_bucket and _profanity_bucket, in the order of the sampled counts
+SENTIMENT_LABELS = ['negative', 'neutral', 'positive']
+PROFANITY_LABELS = ['(0.0, 0.25]', '(0.25, 0.5]', '(0.5, 0.75]', '(0.75, 1.0]']
+
+
+@cached_pipeline
 def reddit_comment_length_per_subreddit(collection):
     """
     Aggregation pipeline for comment_length_per_subreddit
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
@@ -45,6 +66,7 @@ def reddit_comment_length_per_subreddit(collection):
         }
     ])
 
+@cached_pipeline
 def reddit_top_posts(collection, limit):
     return collection.aggregate([
         {
@@ -82,6 +104,7 @@ def reddit_top_posts(collection, limit):
     ])
 
 
+@cached_pipeline
 def reddit_controversial_posts(collection, limit):
     return collection.aggregate([
         {
@@ -118,6 +141,7 @@ def reddit_controversial_posts(collection, limit):
         }
     ])
 
+@cached_pipeline
 def reddit_score_by_hour(collection):
     return collection.aggregate([
         {
@@ -147,6 +171,7 @@ def reddit_score_by_hour(collection):
         }
     ])
 
+@cached_pipeline
 def reddit_posts_by_hour(collection):
     return collection.aggregate([
         {
@@ -175,6 +200,7 @@ def reddit_posts_by_hour(collection):
         }
     ])
 
+@cached_pipeline
 def twitter_tweets_by_hour(collection):
     return collection.aggregate([
         {
@@ -203,6 +229,7 @@ def twitter_tweets_by_hour(collection):
         }
     ])
 
+@cached_pipeline
 def reddit_upvote_ratios(collection):
     return collection.aggregate([
         {
@@ -220,24 +247,24 @@ def reddit_upvote_ratios(collection):
         }
     ])
 
+@cached_pipeline
 def reddit_keyword_per_subreddit(collection, subreddit):
     """
     Aggregation pipeline for keyword_per_subreddit
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
-            '$project': {
-                'subreddit': '$reddit.subreddit',
-                'keyword': '$keywords'
+            '$match': {
+                'reddit.subreddit': subreddit
             }
         }, {
-            '$match': {
-                'subreddit': subreddit
+            '$project': {
+                'keyword': '$keywords'
             }
         }, {
             '$unwind': {
@@ -272,14 +299,15 @@ def reddit_keyword_per_subreddit(collection, subreddit):
     ])
 
 
+@cached_pipeline
 def reddit_distribution_number_posts_per_user(collection):
     """
     Aggregation pipeline for distribution_number_posts_per_user
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
@@ -310,14 +338,15 @@ def reddit_distribution_number_posts_per_user(collection):
     ])
 
 
+@cached_pipeline
 def reddit_distribution_number_comments_per_user(collection):
     """
     Aggregation pipeline for distribution_number_comments_per_user
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
@@ -357,26 +386,26 @@ def reddit_distribution_number_comments_per_user(collection):
     ])
 
 
+@cached_pipeline
 def reddit_frequently_used_news_sources(collection, subreddit):
     """
     Aggregation pipeline for frequently_used_news_sources
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
+            '$match': {
+                'reddit.subreddit': subreddit
+            }
+        }, {
             '$project': {
                 '_id': 0,
-                'subreddit': '$reddit.subreddit',
                 'domain': '$domain'
             }
-        }, {
-            '$match': {
-                'subreddit': subreddit
-            }
         }, {
             '$group': {
                 '_id': '$domain',
@@ -398,14 +427,15 @@ def reddit_frequently_used_news_sources(collection, subreddit):
     ])
 
 
+@cached_pipeline
 def reddit_count_posts_per_user(collection, limit):
     """
     Aggregation pipeline for count_posts_per_user
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
@@ -430,6 +460,7 @@ def reddit_count_posts_per_user(collection, limit):
         }
     ])
 
+@cached_pipeline
 def twitter_valid_dates(collection):
     return collection.aggregate([
         {
@@ -449,6 +480,7 @@ def twitter_valid_dates(collection):
         }
     ])
 
+@cached_pipeline
 def reddit_sentiment_analysis_comments(collection):
     return collection.aggregate(
         [
@@ -509,6 +541,7 @@ def reddit_sentiment_analysis_comments(collection):
     )
 
 
+@cached_pipeline
 def sentiment_analysis(collection):
     return collection.aggregate(
         [
@@ -564,6 +597,7 @@ def sentiment_analysis(collection):
         ]
     )
 
+@cached_pipeline
 def twitter_common_hashtags(collection, limit=100):
     return collection.aggregate([
         {
@@ -590,6 +624,7 @@ def twitter_common_hashtags(collection, limit=100):
         }
     ])
 
+@cached_pipeline
 def twitter_high_interaction_hashtags(collection, limit=100):
     return collection.aggregate([
         {
@@ -618,6 +653,7 @@ def twitter_high_interaction_hashtags(collection, limit=100):
     ])
 
 
+@cached_pipeline
 def twitter_most_liked_hashtags(collection, limit=100):
     return collection.aggregate([
         {
@@ -645,14 +681,15 @@ def twitter_most_liked_hashtags(collection, limit=100):
         }
     ])
 
+@cached_pipeline
 def twitter_hashtags_per_trend(collection, limit=100):
     """
     Aggregation pipeline for hashtags_per_trend
 
     :param collection: MongoDB collection for tweets
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
@@ -715,6 +752,7 @@ def twitter_hashtags_per_trend(collection, limit=100):
     ])
 
 
+@traced_pipeline
 def twitter_get_hashtags_for_specific_trend(collection, trend):
     """
     Aggregation pipeline for get_hashtags_for_specific_trend(collection, trend):
@@ -740,6 +778,7 @@ def twitter_get_hashtags_for_specific_trend(collection, trend):
         }
     ])
 
+@cached_pipeline
 def twitter_hashtag_count_per_usertype(collection, day_predicate):
     return collection.aggregate([
         {
@@ -786,33 +825,27 @@ def twitter_hashtag_count_per_usertype(collection, day_predicate):
     ])
 
 
+@cached_pipeline
 def twitter_recent_trends(collection, date):
     """
-    Aggregation pipeline for fetching current trends
+    Aggregation pipeline for fetching current trends. The day is matched as a range on
+    created_at, so the index on created_at is used.
 
     :param collection: MongoDB collection for tweets
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :param date: day to fetch the trends for
+    :type date: datetime.date
+    :return: result documents
+    :rtype: list
     """
-    # today = datetime.now()
-    # delta = timedelta(days=3)
-    # start_date = today - delta
-    _datetime = datetime.fromordinal(date.toordinal())
+    day_start = datetime.fromordinal(date.toordinal())
     return collection.aggregate([
-        {
-            '$project': {
-                'year_created': { '$year': "$created_at" },
-                'month_created': { '$month': "$created_at" },
-                'day_created': { '$dayOfMonth': "$created_at" },
-                'trend': 1
-            }
-        },
         {
             '$match': {
-                'year_created': _datetime.year,
-                'month_created': _datetime.month,
-                'day_created': _datetime.day
+                'created_at': {
+                    '$gte': day_start,
+                    '$lt': day_start + timedelta(days=1)
+                }
             }
         }, {
             '$group': {
@@ -828,7 +861,7 @@ def twitter_recent_trends(collection, date):
                 'count': -1
             }
         }, {
-            '$limit': 100
+            '$limit': TRENDS_PER_DAY
         }, {
             '$project': {
                 '_id': 0,
@@ -838,6 +871,121 @@ def twitter_recent_trends(collection, date):
     ])
 
 
+@cached_pipeline
+def twitter_catalog_dates(collection):
+    """
+    Fetches all days contained in the daily catalog of tweets
+
+    :param collection: MongoDB collection 'twitter_daily_catalog' in the analysis database
+    :type collection: pymongo.collection.Collection
+    :return: days in ascending order
+    :rtype: list
+    """
+    return [day['_id'] for day in collection.find({}, {'_id': 1}).sort('_id', 1)]
+
+
+@cached_pipeline
+def twitter_catalog_trends(collection, date):
+    """
+    Fetches the top trends of a day from the daily catalog of tweets
+
+    :param collection: MongoDB collection 'twitter_daily_catalog' in the analysis database
+    :type collection: pymongo.collection.Collection
+    :param date: day to fetch the trends for
+    :type date: datetime.date
+    :return: trends ordered by number of tweets
+    :rtype: list
+    """
+    day = collection.find_one({'_id': datetime.fromordinal(date.toordinal())}, {'trends': 1})
+    if not day:
+        return []
+    return [{'trend': trend['trend']} for trend in day['trends']]
+
+
+def upserting_twitter_daily_catalog(collection, since=None):
+    """
+    Aggregation pipeline for filling the collection 'twitter_daily_catalog' with the number of
+    tweets and the top trends of every day
+
+    :param collection: MongoDB collection for twitter tweets
+    :type collection: pymongo.collection.Collection
+    :param since: only days from this day on are recomputed, all days if None
+    :type since: datetime.datetime
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    pipeline = []
+    if since is not None:
+        pipeline.append({
+            '$match': {
+                'created_at': {
+                    '$gte': since
+                }
+            }
+        })
+    pipeline.extend([
+        {
+            '$group': {
+                '_id': {
+                    'day': {
+                        '$dateFromParts': {
+                            'year': {
+                                '$year': '$created_at'
+                            },
+                            'month': {
+                                '$month': '$created_at'
+                            },
+                            'day': {
+                                '$dayOfMonth': '$created_at'
+                            }
+                        }
+                    },
+                    'trend': '$trend'
+                },
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$sort': {
+                'count': -1
+            }
+        }, {
+            '$group': {
+                '_id': '$_id.day',
+                'count': {
+                    '$sum': '$count'
+                },
+                'trends': {
+                    '$push': {
+                        'trend': '$_id.trend',
+                        'count': '$count'
+                    }
+                }
+            }
+        }, {
+            '$project': {
+                'count': 1,
+                'trends': {
+                    '$slice': ['$trends', TRENDS_PER_DAY]
+                }
+            }
+        }, {
+            '$merge': {
+                'into': {
+                    'db': 'analysis',
+                    'coll': 'twitter_daily_catalog'
+                },
+                'on': '_id',
+                'whenMatched': 'replace',
+                'whenNotMatched': 'insert'
+            }
+        }
+    ])
+    return collection.aggregate(pipeline)
+
+
+@cached_pipeline
 def twitter_tweets_with_links(collection):
     return collection.aggregate([
         {
@@ -877,10 +1025,12 @@ def twitter_tweets_with_links(collection):
     ])
 
 
+@traced_pipeline
 def twitter_tweets_with_likes(collection):
     return collection.aggregate([
         {
             '$project': {
+                '_id': 0,
                 'likes': '$metrics.like_count',
                 'text': 1
             }
@@ -888,6 +1038,7 @@ def twitter_tweets_with_likes(collection):
     ])
 
 
+@cached_pipeline
 def twitter_tweet_sentiments(collection):
     return collection.aggregate([
         {
@@ -916,6 +1067,7 @@ def twitter_tweet_sentiments(collection):
         }
     ])
 
+@traced_pipeline
 def twitter_all_tweets_with_geodata(collection):
     return collection.aggregate([
         {
@@ -926,8 +1078,10 @@ def twitter_all_tweets_with_geodata(collection):
             }
         }, {
             '$project': {
+                '_id': 0,
                 'created_at': '$created_at',
-                'geo': '$geo',
+                'long': '$geo.long',
+                'lat': '$geo.lat',
                 'user': '$author.username',
                 'trend': 1
             }
@@ -935,31 +1089,73 @@ def twitter_all_tweets_with_geodata(collection):
     ])
 
 
-def rss_publication_stats(collection):
+@cached_pipeline(ttl=SOURCE_CATALOG_TTL_SECONDS)
+def rss_feed_sources(collection):
+    """
+    Fetches the names of all news sources with a server-side distinct, which is answered by a
+    DISTINCT_SCAN of the index on feed_source without reading any article
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :return: sorted names of the news sources
+    :rtype: list
+    """
+    return sorted(source for source in collection.distinct('feed_source') if source is not None)
+
+
+@cached_pipeline(ttl=SOURCE_CATALOG_TTL_SECONDS)
+def rss_source_catalog(collection):
+    """
+    Aggregation pipeline for the number of articles and the first and last publication date per
+    news source. The leading sort on feed_source lets the planner read the index on feed_source
+    and published instead of scanning the collection, only these two fields are projected, so
+    the scan is covered by the index.
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
+    """
     return collection.aggregate([
         {
+            '$sort': {
+                'feed_source': 1
+            }
+        }, {
             '$project': {
-                'feed_source': '$feed_source'
+                '_id': 0,
+                'feed_source': 1,
+                'published': 1
             }
-        },
-        {
+        }, {
             '$group': {
                 '_id': '$feed_source',
                 'article_count': {
                     '$sum': 1
+                },
+                'first_published': {
+                    '$min': {
+                        '$cond': [{'$eq': [{'$type': '$published'}, 'date']}, '$published', None]
+                    }
+                },
+                'last_published': {
+                    '$max': {
+                        '$cond': [{'$eq': [{'$type': '$published'}, 'date']}, '$published', None]
+                    }
                 }
             }
-        },
-        {
+        }, {
             '$project': {
                 '_id': 0,
                 'feed_source': '$_id',
-                'article_count': 1
+                'article_count': 1,
+                'first_published': 1,
+                'last_published': 1
             }
         }
-    ]
-    )
+    ])
 
+@cached_pipeline
 def twitter_user_stats(collection):
     return collection.aggregate([
         {
@@ -1030,14 +1226,51 @@ def twitter_user_stats(collection):
         }
     ])
 
+@cached_pipeline
 def rss_avg_article_length(collection):
     """
-    Aggregation pipeline for avg_article_length
+    Aggregation pipeline for avg_article_length on the lengths stored by utils.article_attributes,
+    the sort lets the group read the index on feed_source, content_length and token_count
+    instead of the documents
 
     :param collection: MongoDB collection for rss articles
     :type collection: pymongo.collection.Collection
-    :return: result cursor
-    :rtype: pymongo.command_cursor.CommandCursor
+    :return: result documents
+    :rtype: list
+    """
+    return collection.aggregate([
+        {
+            '$sort': {
+                'feed_source': 1
+            }
+        }, {
+            '$group': {
+                '_id': '$feed_source',
+                'avg_article_length': {
+                    '$avg': '$content_length'
+                },
+                'avg_token_count': {
+                    '$avg': '$token_count'
+                }
+            }
+        }, {
+            '$sort': {
+                'avg_article_length': -1
+            }
+        }
+    ])
+
+
+@cached_pipeline
+def rss_avg_article_length_from_content(collection):
+    """
+    Aggregation pipeline for avg_article_length measuring the content of every article, used
+    as long as the articles have not been enriched by update_rss_article_attributes.py
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
     """
     return collection.aggregate([
         {
@@ -1062,10 +1295,21 @@ def rss_avg_article_length(collection):
     ])
 
 
-def rss_tags(collection):
+@traced_pipeline
+def rss_source_tag_counts(collection):
+    """
+    Aggregation pipeline for the number of articles of every news source per tag, one document
+    per source and tag, so the result size is not limited by the size of a document
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :return: cursor over the documents with feed_source, tag and count
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
     return collection.aggregate([
         {
             '$project': {
+                '_id': 0,
                 'feed_source': 1,
                 'tags': 1
             }
@@ -1075,32 +1319,26 @@ def rss_tags(collection):
             }
         }, {
             '$group': {
-                '_id': '$feed_source',
-                'tags': {
-                    '$push': '$tags'
+                '_id': {
+                    'feed_source': '$feed_source',
+                    'tag': '$tags'
                 },
-                 'count': {
-                    '$sum': 1
-                }
-            }
-        },
-        {
-            '$match': {
                 'count': {
-                    '$gte': 500
+                    '$sum': 1
                 }
             }
-        },
-        {
+        }, {
             '$project': {
                 '_id': 0,
-                'feed_source': '$_id',
-                'tags': 1
+                'feed_source': '$_id.feed_source',
+                'tag': '$_id.tag',
+                'count': 1
             }
         }
-    ])
+    ], allowDiskUse=True)
 
 
+@cached_pipeline
 def rss_tag_count(collection, source):
     return collection.aggregate([
         {
@@ -1135,10 +1373,12 @@ def rss_tag_count(collection, source):
     ])
 
 
+@traced_pipeline
 def rss_content(collection):
     return collection.aggregate([
         {
             '$project': {
+                '_id': 0,
                 'feed_source': 1,
                 'content': 1
             }
@@ -1146,7 +1386,36 @@ def rss_content(collection):
     ])
 
 
+@cached_pipeline
 def rss_published_distribution_per_weekday(collection):
+    """
+    Aggregation pipeline for published_dist_day on the weekdays stored by
+    utils.article_attributes, covered by the index on published_weekday
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
+    """
+    return collection.aggregate([
+        {
+            '$match': {
+                'published_weekday': {
+                    '$gte': 1
+                }
+            }
+        }, {
+            '$group': {
+                '_id': '$published_weekday',
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }
+    ])
+
+@cached_pipeline
+def rss_published_distribution_per_weekday_from_published(collection):
     return collection.aggregate([
         {
             '$match': {
@@ -1170,6 +1439,7 @@ def rss_published_distribution_per_weekday(collection):
         }
     ])
 
+@cached_pipeline
 def reddit_activity_per_weekday(collection):
     return collection.aggregate([
         {
@@ -1188,6 +1458,7 @@ def reddit_activity_per_weekday(collection):
         }
     ])
 
+@cached_pipeline
 def twitter_activity_per_weekday(collection):
     return collection.aggregate([
         {
@@ -1206,7 +1477,40 @@ def twitter_activity_per_weekday(collection):
         }
     ])
 
+@cached_pipeline
 def rss_published_distribution_per_hour(collection):
+    """
+    Aggregation pipeline for published_dist_hour on the hours stored by
+    utils.article_attributes, covered by the index on published_hour
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
+    """
+    return collection.aggregate([
+        {
+            '$match': {
+                'published_hour': {
+                    '$gte': 0
+                }
+            }
+        }, {
+            '$group': {
+                '_id': '$published_hour',
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$sort': {
+                '_id': 1
+            }
+        }
+    ])
+
+@cached_pipeline
+def rss_published_distribution_per_hour_from_published(collection):
     return collection.aggregate([
         {
             '$match': {
@@ -1235,264 +1539,857 @@ def rss_published_distribution_per_hour(collection):
     ])
 
 
-def rss_headlines(collection):
-    return collection.aggregate([
+@traced_pipeline
+def rss_headline_term_counts(collection, source, limit=None):
+    """
+    Aggregation pipeline for the most frequent headline terms of a news source, read from the
+    headline term index on the counts of the source. Not cached, update_rss_headline_terms.py
+    increments the counts in place, which changes neither the number of documents nor the newest
+    `_id` of the collection token, and the read is a single indexed query anyway.
+
+    :param collection: collection 'rss_headline_terms' filled by utils.headline_terms
+    :type collection: pymongo.collection.Collection
+    :param source: name of the news source
+    :type source: str
+    :param limit: maximum number of terms, all terms if None
+    :type limit: int
+    :return: cursor over the documents with term and count, most frequent first
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    stages = [
         {
-            '$project': {
-                'title': 1,
-                'feed_source': 1
+            '$match': {
+                'feed_source': source
+            }
+        }, {
+            '$sort': {
+                'count': -1
             }
         }
-    ])
+    ]
+    if limit is not None:
+        stages.append({'$limit': limit})
+    stages.append({
+        '$project': {
+            '_id': 0,
+            'term': 1,
+            'count': 1
+        }
+    })
+    return collection.aggregate(stages)
+
 
-def upserting_combined_analysis_for_twitter(collection):
+@traced_pipeline
+def rss_headline_term_totals(collection, min_count=0):
     """
-    Aggregation pipeline for filling the collection 'combined_keyword_analysis' from Twitter
+    Aggregation pipeline for the headline terms occurring more often than a threshold across
+    all news sources. Not cached for the same reason as rss_headline_term_counts.
 
-    :param collection: MongoDB collection for twitter tweets
+    :param collection: collection 'rss_headline_term_totals' filled by utils.headline_terms
     :type collection: pymongo.collection.Collection
-    :return: result cursor
+    :param min_count: terms with at most this many occurrences are left out
+    :type min_count: int
+    :return: cursor over the documents with term and count
     :rtype: pymongo.command_cursor.CommandCursor
     """
-    return collection.aggregate(
-        [
-            {
-                '$addFields': {
-                    'trend_and_hashtags': {
-                        '$concatArrays': [
-                            [
-                                {
-                                    '$ltrim': {
-                                        'input': '$trend', 
-                                        'chars': '#'
-                                    }
-                                }
-                            ], '$hashtags'
-                        ]
-                    }
+    return collection.aggregate([
+        {
+            '$match': {
+                'count': {
+                    '$gt': min_count
                 }
-            }, {
-                '$project': {
-                    'created_at_trunc': {
-                        '$dateFromParts': {
-                            'year': {
-                                '$year': '$created_at'
-                            }, 
-                            'month': {
-                                '$month': '$created_at'
-                            }, 
-                            'day': {
-                                '$dayOfMonth': '$created_at'
-                            }
-                        }
-                    }, 
-                    'trend_and_hashtags': 1
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'term': '$_id',
+                'count': 1
+            }
+        }
+    ])
+
+
+@traced_pipeline
+def rss_headlines(collection):
+    return collection.aggregate([
+        {
+            '$project': {
+                '_id': 0,
+                'title': 1,
+                'feed_source': 1
+            }
+        }
+    ])
+
+def _match_days(date_field, days):
+    """
+    Returns a $match stage selecting the documents of the given days
+
+    :param date_field: field holding the date of a document
+    :type date_field: str
+    :param days: days at midnight (UTC)
+    :type days: list
+    :return: $match stage
+    :rtype: dict
+    """
+    return {
+        '$match': {
+            '$or': [{date_field: {'$gte': day, '$lt': day + timedelta(days=1)}} for day in days]
+        }
+    }
+
+
+def days_with_new_documents(collection, date_field, after_id=None):
+    """
+    Aggregation pipeline for the days of the documents inserted after a watermark, these are
+    the day partitions an incremental batch script has to recompute
+
+    :param collection: source collection
+    :type collection: pymongo.collection.Collection
+    :param date_field: field holding the date of a document
+    :type date_field: str
+    :param after_id: watermark, only documents with a greater `_id` are considered
+    :type after_id: bson.objectid.ObjectId
+    :return: days at midnight (UTC) in ascending order
+    :rtype: list
+    """
+    pipeline = []
+    if after_id is not None:
+        pipeline.append({
+            '$match': {
+                '_id': {
+                    '$gt': after_id
                 }
-            }, {
-                '$unwind': {
-                    'path': '$trend_and_hashtags'
+            }
+        })
+    pipeline.extend([
+        {
+            '$match': {
+                date_field: {
+                    '$type': 'date'
                 }
-            }, {
-                '$group': {
-                    '_id': {
-                        'keyword': {
-                            '$toLower': '$trend_and_hashtags'
-                        }, 
-                        'date': '$created_at_trunc', 
-                        'source': 'twitter'
-                    }, 
-                    'ids': {
-                        '$addToSet': '$_id'
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    '$dateFromParts': {
+                        'year': {
+                            '$year': f'${date_field}'
+                        },
+                        'month': {
+                            '$month': f'${date_field}'
+                        },
+                        'day': {
+                            '$dayOfMonth': f'${date_field}'
+                        }
                     }
                 }
-            }, {
-                '$project': {
-                    'count': {
-                        '$size': '$ids'
+            }
+        }, {
+            '$sort': {
+                '_id': 1
+            }
+        }
+    ])
+    return [day['_id'] for day in collection.aggregate(pipeline)]
+
+
+def upserting_combined_analysis_for_twitter(collection, days=None):
+    """
+    Aggregation pipeline for filling the collection 'combined_keyword_analysis' from Twitter
+
+    :param collection: MongoDB collection for twitter tweets
+    :type collection: pymongo.collection.Collection
+    :param days: only the keywords of these days are recomputed, all days if None
+    :type days: list
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    pipeline = []
+    if days is not None:
+        pipeline.append(_match_days('created_at', days))
+    pipeline.extend([
+        {
+            '$project': {
+                'created_at_trunc': {
+                    '$dateFromParts': {
+                        'year': {
+                            '$year': '$created_at'
+                        },
+                        'month': {
+                            '$month': '$created_at'
+                        },
+                        'day': {
+                            '$dayOfMonth': '$created_at'
+                        }
                     }
+                },
+                # the keywords of a tweet are deduplicated before unwinding, so every tweet is
+                # counted once per keyword without collecting the ids of the tweets per group
+                'keywords': {
+                    '$setUnion': [{
+                        '$map': {
+                            'input': {
+                                '$concatArrays': [
+                                    [
+                                        {
+                                            '$ltrim': {
+                                                'input': '$trend',
+                                                'chars': '#'
+                                            }
+                                        }
+                                    ], '$hashtags'
+                                ]
+                            },
+                            'in': {
+                                '$toLower': '$$this'
+                            }
+                        }
+                    }]
                 }
-            }, {
-                '$match': {
-                    'count': {
-                        '$gte': 10
-                    }
+            }
+        }, {
+            '$unwind': {
+                'path': '$keywords'
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    'keyword': '$keywords',
+                    'date': '$created_at_trunc',
+                    'source': 'twitter'
+                },
+                'count': {
+                    '$sum': 1
                 }
-            }, {
-                '$merge': {
-                    'into': {
-                        'db': 'analysis',
-                        'coll': 'combined_keyword_analysis'
-                    },
-                    'on': '_id', 
-                    'whenMatched': 'replace', 
-                    'whenNotMatched': 'insert'
+            }
+        }, {
+            '$match': {
+                'count': {
+                    '$gte': 10
                 }
             }
-        ]
-    )
+        }, {
+            '$merge': {
+                'into': {
+                    'db': 'analysis',
+                    'coll': 'combined_keyword_analysis'
+                },
+                'on': '_id', 
+                'whenMatched': 'replace', 
+                'whenNotMatched': 'insert'
+            }
+        }
+    ])
+    return collection.aggregate(pipeline)
 
-def upserting_combined_analysis_for_reddit(collection):
+def upserting_combined_analysis_for_reddit(collection, days=None):
     """
     Aggregation pipeline for filling the collection 'combined_keyword_analysis' from Reddit
 
     :param collection: MongoDB collection for reddit posts
     :type collection: pymongo.collection.Collection
+    :param days: only the keywords of these days are recomputed, all days if None
+    :type days: list
     :return: result cursor
     :rtype: pymongo.command_cursor.CommandCursor
     """
-    return collection.aggregate(
-        [
-            {
-                '$project': {
-                    'created_trunc': {
-                        '$dateFromParts': {
-                            'year': {
-                                '$year': '$created'
-                            }, 
-                            'month': {
-                                '$month': '$created'
-                            }, 
-                            'day': {
-                                '$dayOfMonth': '$created'
-                            }
+    pipeline = []
+    if days is not None:
+        pipeline.append(_match_days('created', days))
+    pipeline.extend([
+        {
+            '$project': {
+                'created_trunc': {
+                    '$dateFromParts': {
+                        'year': {
+                            '$year': '$created'
+                        }, 
+                        'month': {
+                            '$month': '$created'
+                        }, 
+                        'day': {
+                            '$dayOfMonth': '$created'
                         }
-                    }, 
-                    'keywords': 1
-                }
-            }, {
-                '$unwind': {
-                    'path': '$keywords'
-                }
-            }, {
-                '$match': {
-                    'keywords': {
-                        '$ne': ''
                     }
+                }, 
+                'keywords': 1
+            }
+        }, {
+            '$unwind': {
+                'path': '$keywords'
+            }
+        }, {
+            '$match': {
+                'keywords': {
+                    '$ne': ''
                 }
-            }, {
-                '$group': {
-                    '_id': {
-                        'keyword': {
-                            '$toLower': '$keywords'
-                        }, 
-                        'date': '$created_trunc', 
-                        'source': 'reddit'
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    'keyword': {
+                        '$toLower': '$keywords'
                     }, 
-                    'count': {
-                        '$sum': 1
-                    }
-                }
-            }, {
-                '$match': {
-                    'count': {
-                        '$gte': 3
-                    }
+                    'date': '$created_trunc', 
+                    'source': 'reddit'
+                }, 
+                'count': {
+                    '$sum': 1
                 }
-            }, {
-                '$merge': {
-                    'into': {
-                        'db': 'analysis',
-                        'coll': 'combined_keyword_analysis'
-                    }, 
-                    'on': '_id', 
-                    'whenMatched': 'replace', 
-                    'whenNotMatched': 'insert'
+            }
+        }, {
+            '$match': {
+                'count': {
+                    '$gte': 3
                 }
             }
-        ]
-    )
+        }, {
+            '$merge': {
+                'into': {
+                    'db': 'analysis',
+                    'coll': 'combined_keyword_analysis'
+                }, 
+                'on': '_id', 
+                'whenMatched': 'replace', 
+                'whenNotMatched': 'insert'
+            }
+        }
+    ])
+    return collection.aggregate(pipeline)
 
-def upserting_combined_analysis_for_rss(collection):
+def upserting_combined_analysis_for_rss(collection, days=None):
     """
     Aggregation pipeline for filling the collection 'combined_keyword_analysis' from RSS
 
     :param collection: MongoDB collection for rss articles
     :type collection: pymongo.collection.Collection
+    :param days: only the keywords of these days are recomputed, all days if None
+    :type days: list
     :return: result cursor
     :rtype: pymongo.command_cursor.CommandCursor
     """
-    return collection.aggregate(
-        [
-            {
-                '$project': {
-                    'published': 1, 
-                    'type': {
-                        '$type': '$published'
+    pipeline = []
+    if days is not None:
+        pipeline.append(_match_days('published', days))
+    pipeline.extend([
+        {
+            '$project': {
+                'published': 1, 
+                'type': {
+                    '$type': '$published'
+                }, 
+                'tags': 1
+            }
+        }, {
+            '$match': {
+                'published': {
+                    '$ne': None
+                }, 
+                'type': 'date'
+            }
+        }, {
+            '$project': {
+                'published_trunc': {
+                    '$dateFromParts': {
+                        'year': {
+                            '$year': '$published'
+                        }, 
+                        'month': {
+                            '$month': '$published'
+                        }, 
+                        'day': {
+                            '$dayOfMonth': '$published'
+                        }
+                    }
+                }, 
+                'tags': 1
+            }
+        }, {
+            '$unwind': {
+                'path': '$tags'
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    'keyword': {
+                        '$toLower': '$tags'
                     }, 
-                    'tags': 1
+                    'date': '$published_trunc', 
+                    'source': 'rss'
+                }, 
+                'count': {
+                    '$sum': 1
                 }
-            }, {
-                '$match': {
-                    'published': {
-                        '$ne': None
-                    }, 
-                    'type': 'date'
+            }
+        }, {
+            '$match': {
+                'count': {
+                    '$gte': 3
                 }
-            }, {
-                '$project': {
-                    'published_trunc': {
+            }
+        }, {
+            '$merge': {
+                'into': {
+                    'db': 'analysis',
+                    'coll': 'combined_keyword_analysis'
+                }, 
+                'on': '_id', 
+                'whenMatched': 'replace', 
+                'whenNotMatched': 'insert'
+            }
+        }
+    ])
+    return collection.aggregate(pipeline)
+
+
+def _upserting_activity_cube(collection, source, date_field, score_field=None, days=None):
+    """
+    Aggregation pipeline for filling the collection 'activity_cube' with the number of documents
+    of a source per day and hour (UTC) and the sum of their scores. Every cell of a recomputed day
+    is replaced, so recomputing a day twice does not count its documents twice.
+
+    :param collection: source collection
+    :type collection: pymongo.collection.Collection
+    :param source: name of the source, e.g. 'twitter'
+    :type source: str
+    :param date_field: field holding the date of a document
+    :type date_field: str
+    :param score_field: field holding the score of a document, the source has no scores if None
+    :type score_field: str
+    :param days: only the cells of these days are recomputed, all days if None
+    :type days: list
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    score = f'${score_field}' if score_field else None
+    pipeline = []
+    if days is not None:
+        pipeline.append(_match_days(date_field, days))
+    pipeline.extend([
+        {
+            '$match': {
+                date_field: {
+                    '$type': 'date'
+                }
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    'source': source,
+                    'day': {
                         '$dateFromParts': {
                             'year': {
-                                '$year': '$published'
-                            }, 
+                                '$year': f'${date_field}'
+                            },
                             'month': {
-                                '$month': '$published'
-                            }, 
+                                '$month': f'${date_field}'
+                            },
                             'day': {
-                                '$dayOfMonth': '$published'
+                                '$dayOfMonth': f'${date_field}'
                             }
                         }
-                    }, 
-                    'tags': 1
-                }
-            }, {
-                '$unwind': {
-                    'path': '$tags'
+                    },
+                    'hour': {
+                        '$hour': f'${date_field}'
+                    }
+                },
+                'count': {
+                    '$sum': 1
+                },
+                'score_sum': {
+                    '$sum': score if score else 0
+                },
+                'score_count': {
+                    '$sum': {'$cond': [{'$isNumber': score}, 1, 0]} if score else 0
                 }
-            }, {
-                '$group': {
-                    '_id': {
-                        'keyword': {
-                            '$toLower': '$tags'
-                        }, 
-                        'date': '$published_trunc', 
-                        'source': 'rss'
-                    }, 
-                    'count': {
-                        '$sum': 1
+            }
+        }, {
+            '$project': {
+                'source': '$_id.source',
+                'day': '$_id.day',
+                'hour': '$_id.hour',
+                'weekday': {
+                    '$isoDayOfWeek': '$_id.day'
+                },
+                'count': 1,
+                'score_sum': 1,
+                'score_count': 1
+            }
+        }, {
+            '$merge': {
+                'into': {
+                    'db': 'analysis',
+                    'coll': 'activity_cube'
+                },
+                'on': '_id',
+                'whenMatched': 'replace',
+                'whenNotMatched': 'insert'
+            }
+        }
+    ])
+    return collection.aggregate(pipeline)
+
+
+def upserting_activity_cube_for_twitter(collection, days=None):
+    """
+    Aggregation pipeline for filling the collection 'activity_cube' from Twitter, the score of a
+    tweet is its number of likes
+
+    :param collection: MongoDB collection for tweets
+    :type collection: pymongo.collection.Collection
+    :param days: only the cells of these days are recomputed, all days if None
+    :type days: list
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    return _upserting_activity_cube(collection, 'twitter', 'created_at', 'metrics.like_count', days)
+
+
+def upserting_activity_cube_for_reddit(collection, days=None):
+    """
+    Aggregation pipeline for filling the collection 'activity_cube' from Reddit, the score of a
+    post is its Reddit score
+
+    :param collection: MongoDB collection for reddit posts
+    :type collection: pymongo.collection.Collection
+    :param days: only the cells of these days are recomputed, all days if None
+    :type days: list
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    return _upserting_activity_cube(collection, 'reddit', 'created', 'score', days)
+
+
+def upserting_activity_cube_for_rss(collection, days=None):
+    """
+    Aggregation pipeline for filling the collection 'activity_cube' from RSS by the publication
+    date, articles have no score
+
+    :param collection: MongoDB collection for rss articles
+    :type collection: pymongo.collection.Collection
+    :param days: only the cells of these days are recomputed, all days if None
+    :type days: list
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    return _upserting_activity_cube(collection, 'rss', 'published', days=days)
+
+
+@traced_pipeline
+def activity_cube_counts(collection, dimensions, source=None):
+    """
+    Aggregation pipeline summing up the cells of the activity cube per source and the given
+    dimensions, e.g. the number of documents of every source per hour. Not cached,
+    upsert_activity_cube.py replaces existing cells with $merge, which changes neither the number
+    of documents nor the newest `_id` of the collection token, and the cube is small.
+
+    :param collection: MongoDB collection 'activity_cube'
+    :type collection: pymongo.collection.Collection
+    :param dimensions: fields of the cells to group by, out of 'day', 'hour' and 'weekday'
+    :type dimensions: list
+    :param source: only the cells of this source, all sources if None
+    :type source: str
+    :return: cursor over the documents with the source, the dimensions, count, score_sum and score_count
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    pipeline = []
+    if source is not None:
+        pipeline.append({
+            '$match': {
+                'source': source
+            }
+        })
+    group_key = {'source': '$source'}
+    group_key.update({dimension: f'${dimension}' for dimension in dimensions})
+    pipeline.extend([
+        {
+            '$group': {
+                '_id': group_key,
+                'count': {
+                    '$sum': '$count'
+                },
+                'score_sum': {
+                    '$sum': '$score_sum'
+                },
+                'score_count': {
+                    '$sum': '$score_count'
+                }
+            }
+        }, {
+            '$replaceWith': {
+                '$mergeObjects': ['$_id', {'count': '$count', 'score_sum': '$score_sum', 'score_count': '$score_count'}]
+            }
+        }, {
+            '$sort': {key: 1 for key in group_key}
+        }
+    ])
+    return collection.aggregate(pipeline)
+
+
+def _profanity_bucket(score):
+    """
+    Returns the expression assigning a profanity score to one of the intervals
+    (0, 0.25], (0.25, 0.5], (0.5, 0.75] and (0.75, 1], labeled like the intervals of pandas.cut
+
+    :param score: field path of the score
+    :type score: str
+    :return: aggregation expression
+    :rtype: dict
+    """
+    return {
+        '$switch': {
+            'branches': [
+                {
+                    'case': {
+                        '$lte': [score, upper]
+                    },
+                    'then': label
+                } for upper, label in ((0.25, '(0.0, 0.25]'), (0.5, '(0.25, 0.5]'), (0.75, '(0.5, 0.75]'))
+            ],
+            'default': '(0.75, 1.0]'
+        }
+    }
+
+
+@traced_pipeline
+def profanity_distribution(collection, field='profanity'):
+    """
+    Aggregation pipeline for the number of documents per interval of their stored profanity score.
+    Not cached, utils.profanity_store sets the scores in place, which changes neither the number
+    of documents nor the newest `_id` of the collection token.
+
+    :param collection: MongoDB collection with profanity scores stored by utils.profanity_store
+    :type collection: pymongo.collection.Collection
+    :param field: field holding the score
+    :type field: str
+    :return: cursor over the documents with bucket and count
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    return collection.aggregate([
+        {
+            '$match': {
+                field: {
+                    '$gt': 0
+                }
+            }
+        }, {
+            '$group': {
+                '_id': _profanity_bucket(f'${field}'),
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'bucket': '$_id',
+                'count': 1
+            }
+        }, {
+            '$sort': {
+                'bucket': 1
+            }
+        }
+    ])
+
+
+@traced_pipeline
+def twitter_profanity_likes(collection):
+    """
+    Aggregation pipeline for the average likes of tweets per interval of their stored profanity
+    score, with the number of averaged tweets to add the tweets scored on the client. Not cached
+    for the same reason as profanity_distribution.
+
+    :param collection: MongoDB collection for twitter tweets
+    :type collection: pymongo.collection.Collection
+    :return: cursor over the documents with bucket, likes and count
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    return collection.aggregate([
+        {
+            '$match': {
+                'profanity': {
+                    '$gt': 0
+                }
+            }
+        }, {
+            '$group': {
+                '_id': _profanity_bucket('$profanity'),
+                'likes': {
+                    '$avg': '$metrics.like_count'
+                },
+                # $avg skips tweets without a like count
+                'count': {
+                    '$sum': {
+                        '$cond': [
+                            {
+                                '$isNumber': '$metrics.like_count'
+                            }, 1, 0
+                        ]
                     }
                 }
-            }, {
-                '$match': {
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'bucket': '$_id',
+                'likes': 1,
+                'count': 1
+            }
+        }, {
+            '$sort': {
+                'bucket': 1
+            }
+        }
+    ])
+
+
+def _sampled_bucket_counts(collection, windows, bucket, labels, match=None, unwind=None):
+    """
+    Runs the aggregation counting the documents per label in every window of a sample drawn by
+    utils.sampling, the input of utils.sampling.estimate_shares
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param windows: sorted pairs of inclusive lower and exclusive upper `_id`
+    :type windows: list
+    :param bucket: expression labeling a document, e.g. _sentiment_bucket
+    :type bucket: dict
+    :param labels: possible labels
+    :type labels: list
+    :param match: filter applied to the sampled (and unwound) documents
+    :type match: dict
+    :param unwind: field path of an array whose elements are labeled instead of the documents
+    :type unwind: str
+    :return: cursor over the lower bound, the number of documents and of documents per label of
+        every window
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    stages = [
+        {
+            '$match': {
+                '$or': [
+                    {
+                        '_id': {
+                            '$gte': lower,
+                            '$lt': upper
+                        }
+                    } for lower, upper in windows
+                ]
+            }
+        }
+    ]
+    if unwind:
+        stages.append({'$unwind': {'path': unwind}})
+    if match:
+        stages.append({'$match': match})
+    # adjacent windows share a boundary, every window is one bucket
+    boundaries = sorted({bound for window in windows for bound in window})
+    output = {
+        f'label_{index}': {
+            '$sum': {
+                '$cond': [
+                    {
+                        '$eq': [bucket, label]
+                    }, 1, 0
+                ]
+            }
+        } for index, label in enumerate(labels)
+    }
+    stages += [
+        {
+            '$bucket': {
+                'groupBy': '$_id',
+                'boundaries': boundaries,
+                'default': 'outside',
+                'output': {
                     'count': {
-                        '$gte': 3
-                    }
+                        '$sum': 1
+                    },
+                    **output
                 }
-            }, {
-                '$merge': {
-                    'into': {
-                        'db': 'analysis',
-                        'coll': 'combined_keyword_analysis'
-                    }, 
-                    'on': '_id', 
-                    'whenMatched': 'replace', 
-                    'whenNotMatched': 'insert'
+            }
+        }, {
+            '$match': {
+                '_id': {
+                    '$ne': 'outside'
                 }
             }
-        ]
-    )
+        }, {
+            '$project': {
+                '_id': 0,
+                'window': '$_id',
+                'count': 1,
+                'labels': [f'$label_{index}' for index in range(len(labels))]
+            }
+        }
+    ]
+    return collection.aggregate(stages)
+
+
+@cached_pipeline
+def sampled_sentiment_counts(collection, windows, compound='$sentiment.compound', unwind=None):
+    """
+    Aggregation pipeline for the number of negative, neutral and positive documents in every
+    window of a sample
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param windows: sorted pairs of inclusive lower and exclusive upper `_id`
+    :type windows: list
+    :param compound: field path of the compound sentiment score
+    :type compound: str
+    :param unwind: field path of an array whose elements are labeled, e.g. '$comments'
+    :type unwind: str
+    :return: result documents with the number of documents and of documents per SENTIMENT_LABELS
+    :rtype: list
+    """
+    match = {compound[1:]: {'$exists': True}}
+    return _sampled_bucket_counts(collection, windows, _sentiment_bucket(compound), SENTIMENT_LABELS, match, unwind)
+
+
+@traced_pipeline
+def sampled_profanity_counts(collection, windows, field='profanity'):
+    """
+    Aggregation pipeline for the number of documents per interval of their stored profanity score
+    in every window of a sample. Not cached for the same reason as profanity_distribution.
+
+    :param collection: MongoDB collection with profanity scores stored by utils.profanity_store
+    :type collection: pymongo.collection.Collection
+    :param windows: sorted pairs of inclusive lower and exclusive upper `_id`
+    :type windows: list
+    :param field: field holding the score
+    :type field: str
+    :return: cursor over the documents with the number of documents and of documents per PROFANITY_LABELS
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    match = {field: {'$gt': 0}}
+    return _sampled_bucket_counts(collection, windows, _profanity_bucket(f'${field}'), PROFANITY_LABELS, match)
 
 
-def get_all_reddit_comments(collection):
+@traced_pipeline
+def get_all_reddit_comments(collection, after_id=None):
     """
     Aggregation pipeline for filling the collection 'reddit_comments' in the analysis database
 
     :param collection: MongoDB collection for Reddit posts
     :type collection: pymongo.collection.Collection
+    :param after_id: watermark, only the comments of posts with a greater `_id` are returned
+    :type after_id: bson.objectid.ObjectId
     :return: result cursor
     :rtype: pymongo.command_cursor.CommandCursor
     """
-    return collection.aggregate([
+    pipeline = []
+    if after_id is not None:
+        pipeline.append({
+            '$match': {
+                '_id': {
+                    '$gt': after_id
+                }
+            }
+        })
+    pipeline.extend([
         {
             '$unwind': {
                 'path': '$comments'
@@ -1504,8 +2401,241 @@ def get_all_reddit_comments(collection):
             }
         }
     ])
+    return collection.aggregate(pipeline)
+
+
+def _sentiment_bucket(compound):
+    """
+    Returns the expression classifying a compound sentiment score as negative, neutral or
+    positive, missing scores are classified as None
+
+    :param compound: field path of the compound score
+    :type compound: str
+    :return: aggregation expression
+    :rtype: dict
+    """
+    return {
+        '$switch': {
+            'branches': [
+                {
+                    'case': {
+                        '$eq': [
+                            {
+                                '$type': compound
+                            }, 'missing'
+                        ]
+                    },
+                    'then': None
+                }, {
+                    'case': {
+                        '$lt': [
+                            compound, -0.05
+                        ]
+                    },
+                    'then': 'negative'
+                }, {
+                    'case': {
+                        '$gt': [
+                            compound, 0.05
+                        ]
+                    },
+                    'then': 'positive'
+                }
+            ],
+            'default': 'neutral'
+        }
+    }
+
+
+def upserting_reddit_comment_facts(collection, after_id=None):
+    """
+    Aggregation pipeline for filling the collection 'reddit_comment_facts' with one document per
+    comment of a Reddit post. Existing facts are updated field by field, so fields set by other
+    jobs, like the profanity score, are kept.
+
+    :param collection: MongoDB collection for Reddit posts
+    :type collection: pymongo.collection.Collection
+    :param after_id: watermark, only the comments of posts with a greater `_id` are upserted
+    :type after_id: bson.objectid.ObjectId
+    :return: result cursor
+    :rtype: pymongo.command_cursor.CommandCursor
+    """
+    pipeline = []
+    if after_id is not None:
+        pipeline.append({
+            '$match': {
+                '_id': {
+                    '$gt': after_id
+                }
+            }
+        })
+    pipeline.extend([
+        {
+            '$project': {
+                'subreddit': '$reddit.subreddit',
+                'comments': 1
+            }
+        }, {
+            '$unwind': {
+                'path': '$comments',
+                'includeArrayIndex': 'comment_index'
+            }
+        }, {
+            '$project': {
+                '_id': {
+                    'post_id': '$_id',
+                    'comment_index': '$comment_index'
+                },
+                'subreddit': 1,
+                'author': '$comments.author.name',
+                'created': '$comments.created',
+                'text_length': {
+                    '$cond': [
+                        {
+                            '$eq': [
+                                {
+                                    '$type': '$comments.text'
+                                }, 'string'
+                            ]
+                        }, {
+                            '$strLenCP': '$comments.text'
+                        }, None
+                    ]
+                },
+                'sentiment_compound': '$comments.sentiment.compound',
+                'sentiment_bucket': _sentiment_bucket('$comments.sentiment.compound')
+            }
+        }, {
+            '$merge': {
+                'into': {
+                    'db': 'analysis',
+                    'coll': 'reddit_comment_facts'
+                },
+                'on': '_id',
+                'whenMatched': 'merge',
+                'whenNotMatched': 'insert'
+            }
+        }
+    ])
+    return collection.aggregate(pipeline)
+
+
+@cached_pipeline
+def reddit_comment_facts_length_per_subreddit(collection):
+    """
+    Aggregation pipeline for comment_length_per_subreddit on the comment facts, the sort lets
+    the group read the index on subreddit and text length instead of the documents
+
+    :param collection: MongoDB collection 'reddit_comment_facts'
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
+    """
+    return collection.aggregate([
+        {
+            '$sort': {
+                'subreddit': 1
+            }
+        }, {
+            '$group': {
+                '_id': '$subreddit',
+                'average_comment_length': {
+                    '$avg': '$text_length'
+                }
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'subreddit': '$_id',
+                'average_comment_length': '$average_comment_length'
+            }
+        }
+    ])
+
+
+@cached_pipeline
+def reddit_comment_facts_distribution_number_comments_per_user(collection):
+    """
+    Aggregation pipeline for distribution_number_comments_per_user on the comment facts
+
+    :param collection: MongoDB collection 'reddit_comment_facts'
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
+    """
+    return collection.aggregate([
+        {
+            '$sort': {
+                'author': 1
+            }
+        }, {
+            '$group': {
+                '_id': '$author',
+                'number_of_comments': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$bucket': {
+                'groupBy': '$number_of_comments',
+                'boundaries': [1, 2, 5, 10, 20, 100, 200, 500, 1000, 2000],
+                'default': 'More',
+                'output': {
+                    'number_of_users': {
+                        '$sum': 1
+                    }
+                }
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'min_number_of_comments': '$_id',
+                'number_of_users': 1
+            }
+        }
+    ])
+
+
+@cached_pipeline
+def reddit_comment_facts_sentiment(collection):
+    """
+    Aggregation pipeline for the sentiment buckets of all comments on the comment facts, the
+    result has the shape of sentiment_analysis_comments
+
+    :param collection: MongoDB collection 'reddit_comment_facts'
+    :type collection: pymongo.collection.Collection
+    :return: result documents
+    :rtype: list
+    """
+    return collection.aggregate([
+        {
+            '$match': {
+                'sentiment_bucket': {
+                    '$ne': None
+                }
+            }
+        }, {
+            '$group': {
+                '_id': '$sentiment_bucket',
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$project': {
+                '_id': 0,
+                'bucket': '$_id',
+                'count': '$count'
+            }
+        }, {
+            '$sort': {
+                'bucket': 1
+            }
+        }
+    ])
 
 
+@cached_pipeline
 def keywords_in_news_article(collection, source):
     assert source in ['twitter', 'reddit']
     return collection.aggregate(
@@ -1558,6 +2688,7 @@ def keywords_in_news_article(collection, source):
         ]
     )
 
+@cached_pipeline
 def keyword_frequency_in_news_article(collection, keyword, source):
     assert source in ['twitter', 'reddit']
     return collection.aggregate(
@@ -1578,6 +2709,7 @@ def keyword_frequency_in_news_article(collection, keyword, source):
         ]
     )
 
+@cached_pipeline
 def sentiment_analysis(collection):
     return collection.aggregate(
         [
@@ -1633,6 +2765,7 @@ def sentiment_analysis(collection):
         ]
     )
 
+@cached_pipeline
 def sentiment_analysis_comments(collection):
     return collection.aggregate(
         [
@@ -0,0 +1,101 @@
+"""
+Module for the derived attributes stored on every RSS article: the length of the content in
+characters, its number of tokens and the hour and ISO weekday of the publication date (UTC).
+They are computed once when an article is enriched instead of with $strLenCP, $hour and
+$isoDayOfWeek on every request, so the RSS analyses group the stored values on covered indexes.
+
+Articles are enriched by update_rss_article_attributes.py, an ingesting scraper can set the same
+fields with article_attributes before inserting an article. An article without the field
+'content_length' has not been enriched yet.
+"""
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from utils import text_processing
+
+FIELDS = ('content_length', 'token_count', 'published_hour', 'published_weekday')
+DEFAULT_BATCH_SIZE = 1000
+
+
+def article_attributes(article):
+    """
+    Computes the derived attributes of an article. Articles without a string content get no
+    length and token count, articles whose publication is not a date get no publication buckets.
+
+    :param article: document with content and published
+    :type article: dict
+    :return: value per field of FIELDS
+    :rtype: dict
+    """
+    content = article.get('content')
+    published = article.get('published')
+    attributes = dict.fromkeys(FIELDS)
+    if isinstance(content, str):
+        # len counts code points like $strLenCP
+        attributes['content_length'] = len(content)
+        attributes['token_count'] = len(text_processing.tokenize(content))
+    if isinstance(published, datetime):
+        if published.tzinfo is not None:
+            published = published.astimezone(timezone.utc).replace(tzinfo=None)
+        attributes['published_hour'] = published.hour
+        attributes['published_weekday'] = published.isoweekday()
+    return attributes
+
+
+def enrich_articles(collection, batch):
+    """
+    Stores the derived attributes of a batch of articles
+
+    :param collection: collection of RSS articles
+    :type collection: pymongo.collection.Collection
+    :param batch: documents with `_id`, content and published
+    :type batch: list
+    """
+    if batch:
+        collection.bulk_write([UpdateOne({'_id': article['_id']}, {'$set': article_attributes(article)})
+                               for article in batch], ordered=False)
+
+
+def update_attributes(collection, after_id=None, batch_size=DEFAULT_BATCH_SIZE, full=False):
+    """
+    Enriches all articles which have not been enriched yet
+
+    :param collection: collection of RSS articles
+    :type collection: pymongo.collection.Collection
+    :param after_id: only articles with a greater `_id` are considered, all if None
+    :type after_id: bson.objectid.ObjectId
+    :param batch_size: number of articles written at once
+    :type batch_size: int
+    :param full: whether to recompute the attributes of enriched articles as well
+    :type full: bool
+    :return: number of enriched articles
+    :rtype: int
+    """
+    query = {} if full else {'content_length': {'$exists': False}}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+    enriched = 0
+    batch = []
+    for article in collection.find(query, {'content': 1, 'published': 1}).batch_size(batch_size):
+        batch.append(article)
+        if len(batch) == batch_size:
+            enrich_articles(collection, batch)
+            enriched += len(batch)
+            batch = []
+    enrich_articles(collection, batch)
+    return enriched + len(batch)
+
+
+def has_attributes(collection):
+    """
+    Checks whether the articles have been enriched, i.e. whether the RSS analyses can read the
+    stored attributes. Looks for an enriched article with a publication date, which is one key
+    of the index on the publication hour instead of a collection scan.
+
+    :param collection: collection of RSS articles
+    :type collection: pymongo.collection.Collection
+    :return: True if any article is enriched
+    :rtype: bool
+    """
+    return collection.find_one({'published_hour': {'$gte': 0}}, {'_id': 1}) is not None
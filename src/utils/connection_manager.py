@@ -0,0 +1,81 @@
+"""
+Module owning the process-wide MongoDB client. Streamlit reruns the app script on every
+widget interaction, but imported modules stay loaded, so the client created here is shared
+across reruns and sessions instead of being rebuilt on every click.
+
+The connection is configured with the following environment variables:
+
+* MONGO_HOST, MONGO_INITDB_ROOT_USERNAME, MONGO_INITDB_ROOT_PASSWORD (required)
+* MONGO_MAX_POOL_SIZE (maximum number of pooled connections, default 100)
+* MONGO_MIN_POOL_SIZE (connections kept open while idle, default 0)
+* MONGO_MAX_IDLE_TIME_MS (idle time after which pooled connections are closed, default 300000)
+* MONGO_COMPRESSORS (comma separated wire protocol compressors, default 'zlib')
+* MONGO_READ_PREFERENCE (read preference mode, default 'primary')
+"""
+import logging
+import os
+import threading
+
+from pymongo import MongoClient
+
+_client = None
+_client_lock = threading.Lock()
+
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+DEFAULT_MAX_IDLE_TIME_MS = 300000
+DEFAULT_COMPRESSORS = 'zlib'
+DEFAULT_READ_PREFERENCE = 'primary'
+
+
+def client_options():
+    """
+    Collects the pool, compression and read preference options from the environment
+
+    :return: keyword arguments for pymongo.MongoClient
+    :rtype: dict
+    """
+    options = {
+        'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', DEFAULT_MAX_POOL_SIZE)),
+        'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', DEFAULT_MIN_POOL_SIZE)),
+        'maxIdleTimeMS': int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', DEFAULT_MAX_IDLE_TIME_MS)),
+        'readPreference': os.environ.get('MONGO_READ_PREFERENCE', DEFAULT_READ_PREFERENCE),
+        'appname': 'analysis'
+    }
+    compressors = os.environ.get('MONGO_COMPRESSORS', DEFAULT_COMPRESSORS)
+    if compressors:
+        options['compressors'] = compressors
+    return options
+
+
+def get_client():
+    """
+    Returns the MongoDB client of this process and creates it on first use
+
+    :raises KeyError: if the environment variables for connecting to MongoDB are not set
+    :return: MongoDB connection client
+    :rtype: pymongo.MongoClient
+    """
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            user = os.environ["MONGO_INITDB_ROOT_USERNAME"]
+            pw = os.environ["MONGO_INITDB_ROOT_PASSWORD"]
+            mongo_host = os.environ["MONGO_HOST"]
+            options = client_options()
+            logging.info(f'Creating MongoDB client for {mongo_host} with options {options}')
+            _client = MongoClient(mongo_host, 27017, username=user, password=pw, **options)
+    return _client
+
+
+def close_client():
+    """
+    Closes the MongoDB client of this process, the next call of get_client creates a new one
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
@@ -57,7 +57,8 @@ ANALYSES_BY_DATA_SOURCE = {
         'sentiment_analysis': 'Comparison of sentiment in posts and tweets among Reddit and Twitter',
         'compare_profanity_score_reddit_twitter': 'Compare profanity scores between Reddit and Twitter',
         'activity_by_hour': 'Activity of data sources by hour',
-        'activity_by_weekday': 'Activity of data sources by weekday'
+        'activity_by_weekday': 'Activity of data sources by weekday',
+        'activity_heatmap': 'Activity of data sources by weekday and hour'
     }
 }
 
@@ -0,0 +1,189 @@
+"""
+Module for the content embeddings of the news sources. The content of every article is hashed
+into a sparse vector with a fixed number of features, the store keeps the running sum of the
+vectors and the number of articles per news source and number of features in the collection
+'rss_content_embeddings' of the analysis database. New articles are added with $inc, so the store
+grows with the number of sources and features, not with the number of articles, and the
+similarity of the sources is computed from the sums without reading any article.
+
+An article is marked as added by the number of features in its field 'embedded_features'. The
+sums are incremented before the articles of a batch are marked, an interrupted update may count
+the articles of one batch twice; rebuild the store to correct this.
+"""
+import numpy as np
+from pymongo import UpdateOne
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+
+from utils import text_processing
+
+EMBEDDINGS = ('analysis', 'rss_content_embeddings')
+DEFAULT_FEATURES = 100
+DEFAULT_BATCH_SIZE = 1000
+MARKER_FIELD = 'embedded_features'
+
+
+def get_collection(client):
+    """
+    Returns the collection storing the content embeddings
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :return: embedding collection
+    :rtype: pymongo.collection.Collection
+    """
+    database, collection = EMBEDDINGS
+    return client[database][collection]
+
+
+def embed_texts(texts, features=DEFAULT_FEATURES):
+    """
+    Hashes texts into sparse vectors, the words are tokenized like in the other RSS analyses and
+    stopwords are left out
+
+    :param texts: texts to embed
+    :type texts: list
+    :param features: number of features of a vector
+    :type features: int
+    :return: one normalized row per text
+    :rtype: scipy.sparse.csr_matrix
+    """
+    tokens = text_processing.tokenize_many(texts, remove_stopwords=True, words_only=False, lowercase=False)
+    cleaned = [' '.join(words) for words in tokens]
+    return HashingVectorizer(n_features=features).transform(cleaned)
+
+
+def unembedded_articles(collection, features=DEFAULT_FEATURES, after_id=None):
+    """
+    Yields the articles whose content has not been added to the sums of their source yet
+
+    :param collection: collection of RSS articles
+    :type collection: pymongo.collection.Collection
+    :param features: number of features of the embeddings
+    :type features: int
+    :param after_id: only articles with a greater `_id` are considered, all if None
+    :type after_id: bson.objectid.ObjectId
+    :return: documents with `_id`, feed_source and content
+    :rtype: generator
+    """
+    query = {MARKER_FIELD: {'$ne': features}}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+    yield from collection.find(query, {'feed_source': 1, 'content': 1}).batch_size(DEFAULT_BATCH_SIZE)
+
+
+def add_articles(store, articles, batch, features=DEFAULT_FEATURES):
+    """
+    Adds the embeddings of a batch of articles to the sums of their sources and marks the
+    articles as added
+
+    :param store: collection 'rss_content_embeddings'
+    :type store: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    :param batch: documents with `_id`, feed_source and content
+    :type batch: list
+    :param features: number of features of the embeddings
+    :type features: int
+    """
+    vectors = embed_texts([article.get('content') for article in batch], features)
+    sources = sorted({article.get('feed_source') for article in batch}, key=str)
+    rows = {source: index for index, source in enumerate(sources)}
+    # sums up the rows of every source with one sparse product
+    membership = sparse.csr_matrix(
+        (np.ones(len(batch)), ([rows[article.get('feed_source')] for article in batch], np.arange(len(batch)))),
+        shape=(len(sources), len(batch))
+    )
+    sums = (membership @ vectors).tocsr()
+    counts = np.asarray(membership.sum(axis=1)).ravel()
+    requests = []
+    for index, source in enumerate(sources):
+        row = sums.getrow(index)
+        increments = {f'sums.{feature}': float(value) for feature, value in zip(row.indices, row.data)}
+        increments['count'] = int(counts[index])
+        requests.append(UpdateOne({'features': features, 'feed_source': source}, {'$inc': increments}, upsert=True))
+    store.bulk_write(requests, ordered=False)
+    articles.update_many({'_id': {'$in': [article['_id'] for article in batch]}}, {'$addToSet': {MARKER_FIELD: features}})
+
+
+def update_embeddings(store, articles, features=DEFAULT_FEATURES, after_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Adds all articles which have not been added yet to the store
+
+    :param store: collection 'rss_content_embeddings'
+    :type store: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    :param features: number of features of the embeddings
+    :type features: int
+    :param after_id: only articles with a greater `_id` are considered, all if None
+    :type after_id: bson.objectid.ObjectId
+    :param batch_size: number of articles embedded at once
+    :type batch_size: int
+    :return: number of added articles
+    :rtype: int
+    """
+    added = 0
+    batch = []
+    for article in unembedded_articles(articles, features, after_id):
+        batch.append(article)
+        if len(batch) == batch_size:
+            add_articles(store, articles, batch, features)
+            added += len(batch)
+            batch = []
+    if batch:
+        add_articles(store, articles, batch, features)
+        added += len(batch)
+    return added
+
+
+def reset_embeddings(store, articles, features=DEFAULT_FEATURES):
+    """
+    Removes the sums of all sources and the marks of all articles for a number of features
+
+    :param store: collection 'rss_content_embeddings'
+    :type store: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    :param features: number of features of the embeddings
+    :type features: int
+    """
+    store.delete_many({'features': features})
+    articles.update_many({MARKER_FIELD: features}, {'$pull': {MARKER_FIELD: features}})
+
+
+def source_embeddings(store, features=DEFAULT_FEATURES):
+    """
+    Returns the average embedding of every news source
+
+    :param store: collection 'rss_content_embeddings'
+    :type store: pymongo.collection.Collection
+    :param features: number of features of the embeddings
+    :type features: int
+    :return: sources and one average embedding per source, no sources if the store is empty
+    :rtype: (list, numpy.ndarray)
+    """
+    documents = list(store.find({'features': features, 'count': {'$gt': 0}}, {'_id': 0, 'feed_source': 1, 'count': 1, 'sums': 1}))
+    embeddings = np.zeros((len(documents), features))
+    for row, document in enumerate(documents):
+        for feature, value in document.get('sums', {}).items():
+            embeddings[row, int(feature)] = value
+        embeddings[row] /= document['count']
+    return [document['feed_source'] for document in documents], embeddings
+
+
+def source_similarity(store, features=DEFAULT_FEATURES):
+    """
+    Computes the cosine similarity of the average embeddings of all pairs of news sources
+
+    :param store: collection 'rss_content_embeddings'
+    :type store: pymongo.collection.Collection
+    :param features: number of features of the embeddings
+    :type features: int
+    :return: sources and the symmetric source by source similarity matrix
+    :rtype: (list, numpy.ndarray)
+    """
+    sources, embeddings = source_embeddings(store, features)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = np.divide(embeddings, norms, out=np.zeros_like(embeddings), where=norms > 0)
+    return sources, normalized @ normalized.T
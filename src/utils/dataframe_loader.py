@@ -0,0 +1,112 @@
+"""
+Module for loading the documents of a cursor into a DataFrame or an Arrow table. The documents
+are consumed in batches and each batch is converted into typed columns right away, so at most one
+batch of documents is held as Python objects besides the columnar result. Columns with repeated
+strings like sources, trends and subreddits are stored as categoricals.
+
+A schema maps every column to a pandas dtype, e.g. {'feed_source': 'category', 'likes': 'float64'}.
+Use 'Int64' instead of 'int64' for integer columns with missing values.
+"""
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+DEFAULT_BATCH_SIZE = 10000
+
+CATEGORY = 'category'
+
+
+def _batches(cursor, columns, batch_size):
+    """
+    Yields the values of the given columns for batches of documents
+    """
+    if hasattr(cursor, 'batch_size'):
+        # documents are fetched from the server in batches of the same size
+        cursor.batch_size(batch_size)
+    batch = {column: [] for column in columns}
+    size = 0
+    for document in cursor:
+        for column in columns:
+            batch[column].append(document.get(column))
+        size += 1
+        if size == batch_size:
+            yield batch
+            batch = {column: [] for column in columns}
+            size = 0
+    if size:
+        yield batch
+
+
+def _to_array(values, dtype):
+    """
+    Converts the values of a column in one batch into a typed array, values of object columns
+    may be lists like the hashtags of a tweet
+    """
+    if dtype == CATEGORY:
+        return pd.Categorical(values)
+    return pd.Series(values, dtype=dtype)
+
+
+def _concat(chunks, dtype):
+    """
+    Concatenates the typed arrays of a column
+    """
+    if not chunks:
+        return pd.Series([], dtype=dtype)
+    if dtype == CATEGORY:
+        # unions the categories of the batches instead of falling back to object
+        return pd.Series(union_categoricals(chunks))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def cursor_to_dataframe(cursor, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Loads the documents of a cursor into a DataFrame with the columns and dtypes of a schema.
+    Fields which are not in the schema are dropped, missing fields become missing values.
+
+    :param cursor: cursor or any iterable of documents
+    :type cursor: pymongo.command_cursor.CommandCursor
+    :param schema: pandas dtype per column
+    :type schema: dict
+    :param batch_size: number of documents converted at once
+    :type batch_size: int
+    :return: DataFrame with one column per schema entry
+    :rtype: pandas.DataFrame
+    """
+    chunks = {column: [] for column in schema}
+    for batch in _batches(cursor, list(schema), batch_size):
+        for column, dtype in schema.items():
+            chunks[column].append(_to_array(batch.pop(column), dtype))
+    return pd.DataFrame({column: _concat(chunks.pop(column), dtype) for column, dtype in schema.items()})
+
+
+def cursor_to_arrow(cursor, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Loads the documents of a cursor into an Arrow table with the columns of a schema. Categorical
+    columns become dictionary encoded string columns.
+
+    :param cursor: cursor or any iterable of documents
+    :type cursor: pymongo.command_cursor.CommandCursor
+    :param schema: pandas dtype per column
+    :type schema: dict
+    :param batch_size: number of documents converted at once
+    :type batch_size: int
+    :return: table with one column per schema entry
+    :rtype: pyarrow.Table
+    """
+    # pyarrow is only needed by callers which want Arrow tables
+    import pyarrow as pa
+
+    tables = []
+    for batch in _batches(cursor, list(schema), batch_size):
+        arrays = []
+        for column, dtype in schema.items():
+            values = batch.pop(column)
+            if dtype == CATEGORY:
+                arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+            else:
+                arrays.append(pa.array(_to_array(values, dtype), from_pandas=True))
+        tables.append(pa.Table.from_arrays(arrays, names=list(schema)))
+    if not tables:
+        return pa.Table.from_pandas(cursor_to_dataframe([], schema), preserve_index=False)
+    # columns of batches without any value have the null type and are promoted
+    return pa.concat_tables(tables, promote=True).unify_dictionaries()
@@ -0,0 +1,202 @@
+"""
+Module for a result cache on a directory shared by several dashboard replicas, e.g. a mounted
+volume. Entries are written atomically, a lock file per key makes sure only one replica
+computes a missing entry while the others wait for its result, and the directory is kept
+below a size cap by evicting the least recently used entries.
+
+A lock file holds a random token of its owner and is touched periodically while the owner
+computes, so only locks of crashed replicas become stale, and a replica only removes a lock
+which still holds its own token (or the token it found stale).
+"""
+import errno
+import hashlib
+import logging
+import os
+import pickle
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_LOCK_TIMEOUT_SECONDS = 900
+LOCK_POLL_INTERVAL_SECONDS = 0.2
+ENTRY_SUFFIX = '.pkl'
+LOCK_SUFFIX = '.lock'
+
+
+class DiskCache:
+    """
+    Result cache storing one pickle file per entry in a shared directory
+
+    :param directory: directory holding the cache entries
+    :type directory: str
+    :param max_bytes: maximum summed size of all entry files
+    :type max_bytes: int
+    :param lock_timeout: seconds without a refresh after which the lock of a crashed replica is considered stale
+    :type lock_timeout: int
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, lock_timeout=DEFAULT_LOCK_TIMEOUT_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock_timeout = lock_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + suffix)
+
+    def get(self, key, token):
+        """
+        Looks up a cached value
+
+        :param key: cache key
+        :type key: str
+        :param token: current state of the source collection, entries with another token are stale
+        :type token: tuple
+        :return: whether the key was found and the cached value
+        :rtype: (bool, object)
+        """
+        path = self._path(key, ENTRY_SUFFIX)
+        try:
+            with open(path, 'rb') as entry_file:
+                entry_token, expires, value = pickle.load(entry_file)
+        except FileNotFoundError:
+            return False, None
+        except (OSError, EOFError, pickle.UnpicklingError):
+            logging.warning(f'Discarding unreadable cache entry {path}')
+            self._discard(path)
+            return False, None
+        if entry_token != token or expires <= time.time():
+            return False, None
+        try:
+            # the modification time is used as last access time for the LRU eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return True, value
+
+    def put(self, key, value, token, ttl):
+        """
+        Stores a value atomically by writing a temporary file and renaming it
+
+        :param key: cache key
+        :type key: str
+        :param value: value to cache
+        :type value: object
+        :param token: current state of the source collection
+        :type token: tuple
+        :param ttl: number of seconds the entry stays valid
+        :type ttl: int
+        """
+        if ttl <= 0:
+            return
+        file_descriptor, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as tmp_file:
+                pickle.dump((token, time.time() + ttl, value), tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key, ENTRY_SUFFIX))
+        except Exception:
+            self._discard(tmp_path)
+            raise
+        self.evict()
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Context manager holding the lock of a key across all replicas sharing the directory.
+        The lock file is created exclusively, so this also works on network file systems
+        without support for advisory locks.
+
+        :param key: cache key
+        :type key: str
+        """
+        path = self._path(key, LOCK_SUFFIX)
+        token = secrets.token_hex(16)
+        while True:
+            try:
+                file_descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+            else:
+                with os.fdopen(file_descriptor, 'w') as lock_file:
+                    lock_file.write(token)
+                break
+            try:
+                owner = self._lock_owner(path)
+                if time.time() - os.path.getmtime(path) > self.lock_timeout:
+                    logging.warning(f'Removing stale cache lock {path}')
+                    self._discard_lock(path, owner)
+                    continue
+            except OSError:
+                continue
+            time.sleep(LOCK_POLL_INTERVAL_SECONDS)
+        released = threading.Event()
+        heartbeat = threading.Thread(target=self._touch_lock, args=(path, token, released), daemon=True)
+        heartbeat.start()
+        try:
+            yield
+        finally:
+            released.set()
+            heartbeat.join()
+            self._discard_lock(path, token)
+
+    def _touch_lock(self, path, token, released):
+        """
+        Refreshes the modification time of a held lock until it is released, so a long computation
+        is not mistaken for a crashed replica
+        """
+        while not released.wait(self.lock_timeout / 3):
+            try:
+                if self._lock_owner(path) != token:
+                    return
+                os.utime(path)
+            except OSError:
+                return
+
+    @staticmethod
+    def _lock_owner(path):
+        with open(path, 'r') as lock_file:
+            return lock_file.read()
+
+    def _discard_lock(self, path, token):
+        """
+        Removes a lock only if it still holds the given owner token, so the lock of another
+        replica which has taken over in the meantime is left untouched
+        """
+        try:
+            if self._lock_owner(path) == token:
+                self._discard(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the directory is below the size cap
+        """
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(ENTRY_SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+        if total_size <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            self._discard(path)
+            total_size -= size
+            if total_size <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
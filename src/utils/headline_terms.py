@@ -0,0 +1,112 @@
+"""
+Module for the headline term index of the news sources. The headlines are tokenized once, the
+number of occurrences per source and term is kept in the collection 'rss_headline_terms' and
+the number of occurrences per term across all sources in 'rss_headline_term_totals' of the
+analysis database. New articles are added with $inc, the headline analyses read the counts of one
+source on an index instead of tokenizing every headline on every request.
+
+An article is marked as added by its field 'headline_terms_indexed'. The counts are incremented
+before the articles of a batch are marked, an interrupted update may count the headlines of one
+batch twice; rebuild the index to correct this.
+"""
+from collections import Counter
+
+from pymongo import UpdateOne
+
+from utils import text_processing
+
+TERMS = ('analysis', 'rss_headline_terms')
+TOTALS = ('analysis', 'rss_headline_term_totals')
+MARKER_FIELD = 'headline_terms_indexed'
+DEFAULT_BATCH_SIZE = 5000
+
+
+def get_collections(client):
+    """
+    Returns the collections storing the counts per source and term and the totals per term
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :return: term collection and total collection
+    :rtype: (pymongo.collection.Collection, pymongo.collection.Collection)
+    """
+    return client[TERMS[0]][TERMS[1]], client[TOTALS[0]][TOTALS[1]]
+
+
+def add_articles(terms, totals, articles, batch):
+    """
+    Adds the headline terms of a batch of articles to the counts and marks the articles as added
+
+    :param terms: collection 'rss_headline_terms'
+    :type terms: pymongo.collection.Collection
+    :param totals: collection 'rss_headline_term_totals'
+    :type totals: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    :param batch: documents with `_id`, feed_source and title
+    :type batch: list
+    """
+    counts = Counter()
+    # normalized like the headline analyses, without stopwords, numbers and punctuation
+    for article, terms_of_article in zip(batch, text_processing.tokenize_many(article.get('title') for article in batch)):
+        for term in terms_of_article:
+            counts[(article.get('feed_source'), term)] += 1
+    term_totals = Counter()
+    for (_, term), count in counts.items():
+        term_totals[term] += count
+    if counts:
+        terms.bulk_write([UpdateOne({'feed_source': source, 'term': term}, {'$inc': {'count': count}}, upsert=True)
+                          for (source, term), count in counts.items()], ordered=False)
+        totals.bulk_write([UpdateOne({'_id': term}, {'$inc': {'count': count}}, upsert=True)
+                           for term, count in term_totals.items()], ordered=False)
+    articles.update_many({'_id': {'$in': [article['_id'] for article in batch]}}, {'$set': {MARKER_FIELD: True}})
+
+
+def update_index(terms, totals, articles, after_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Adds all articles which have not been added yet to the index
+
+    :param terms: collection 'rss_headline_terms'
+    :type terms: pymongo.collection.Collection
+    :param totals: collection 'rss_headline_term_totals'
+    :type totals: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    :param after_id: only articles with a greater `_id` are considered, all if None
+    :type after_id: bson.objectid.ObjectId
+    :param batch_size: number of articles added at once
+    :type batch_size: int
+    :return: number of added articles
+    :rtype: int
+    """
+    query = {MARKER_FIELD: {'$ne': True}}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+    added = 0
+    batch = []
+    for article in articles.find(query, {'feed_source': 1, 'title': 1}).batch_size(batch_size):
+        batch.append(article)
+        if len(batch) == batch_size:
+            add_articles(terms, totals, articles, batch)
+            added += len(batch)
+            batch = []
+    if batch:
+        add_articles(terms, totals, articles, batch)
+        added += len(batch)
+    return added
+
+
+def reset_index(terms, totals, articles):
+    """
+    Removes all counts and the marks of all articles
+
+    :param terms: collection 'rss_headline_terms'
+    :type terms: pymongo.collection.Collection
+    :param totals: collection 'rss_headline_term_totals'
+    :type totals: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    """
+    terms.delete_many({})
+    totals.delete_many({})
+    articles.update_many({MARKER_FIELD: True}, {'$unset': {MARKER_FIELD: ''}})
@@ -4,9 +4,105 @@ Module containing helper functions for the analyzers
 from profanity_check import predict_prob
 import pandas as pd
 
+from utils.dataframe_loader import cursor_to_dataframe
+from utils.instrumentation import span
+
+
+PROFANITY_BINS = [0, 0.25, 0.5, 0.75, 1]
 
 def get_profanity_distribution(data):
-    data['profanity'] = predict_prob(data['text'])
+    with span('profanity'):
+        data['profanity'] = predict_prob(data['text'])
     data.drop('text', axis=1, inplace=True)
-    data['category'] = pd.cut(data['profanity'] ,[0, 0.25, 0.5, 0.75, 1])
-    return data['category'].value_counts(normalize=True)
\ No newline at end of file
+    data['category'] = pd.cut(data['profanity'] ,PROFANITY_BINS)
+    return data['category'].value_counts(normalize=True).sort_index()
+
+def get_profanity_categories(texts):
+    """
+    Scores the profanity of texts and assigns every score to its interval
+
+    :param texts: texts to score
+    :type texts: list
+    :return: interval per text, labeled like '(0.0, 0.25]', 'nan' for a score of zero
+    :rtype: list
+    """
+    if len(texts) == 0:
+        return []
+    with span('profanity'):
+        scores = predict_prob(texts)
+    return list(pd.cut(scores, PROFANITY_BINS).astype(str))
+
+def has_profanity_scores(collection, field='profanity'):
+    """
+    Checks whether utils.profanity_store has stored profanity scores in a collection
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param field: field holding the score
+    :type field: str
+    :return: True if any document has a score
+    :rtype: bool
+    """
+    return collection.find_one({field: {'$exists': True}}, {'_id': 1}) is not None
+
+def has_unscored_documents(collection, field='profanity', query=None):
+    """
+    Checks whether a collection contains documents without a stored profanity score, e.g.
+    documents inserted since the last run of score_profanity.py
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param field: field holding the score
+    :type field: str
+    :param query: only documents matching this filter are considered
+    :type query: dict
+    :return: True if any (matching) document has no score
+    :rtype: bool
+    """
+    return collection.find_one(_unscored_query(field, query), {'_id': 1}) is not None
+
+def _unscored_query(field, query=None):
+    unscored = {field: {'$exists': False}}
+    return {'$and': [query, unscored]} if query else unscored
+
+def score_unscored_documents(collection, field='profanity', text_field='text', fields=None, query=None):
+    """
+    Scores the texts of the documents without a stored profanity score, so the analyses of the
+    stored scores also cover the documents inserted since the last run of score_profanity.py
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param field: field holding the score
+    :type field: str
+    :param text_field: field holding the text
+    :type text_field: str
+    :param fields: further columns by the projected field path, e.g. {'likes': '$metrics.like_count'}
+    :type fields: dict
+    :param query: only documents matching this filter are scored, e.g. the windows of a sample
+    :type query: dict
+    :return: the further columns and the interval of the score as 'category' per unscored
+        document, labeled like '(0.0, 0.25]', 'nan' for a score of zero
+    :rtype: pandas.DataFrame
+    """
+    fields = fields or {}
+    if not has_unscored_documents(collection, field, query):
+        return pd.DataFrame({**{column: [] for column in fields}, 'category': []})
+    projection = {'_id': 0, 'text': f'${text_field}', **fields}
+    with span('transform'):
+        data = cursor_to_dataframe(collection.find(_unscored_query(field, query), projection),
+                                   {'text': 'object', **{column: 'object' for column in fields}})
+    data['category'] = get_profanity_categories(data['text'].astype('U').values)
+    return data.drop(columns='text')
+
+def has_documents(collection, query=None):
+    """
+    Checks whether a collection contains any document, e.g. whether a batch script has filled it
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param query: only documents matching this filter are considered, e.g. the documents of one source
+    :type query: dict
+    :return: True if the collection contains a (matching) document
+    :rtype: bool
+    """
+    return collection.find_one(query or {}, {'_id': 1}) is not None
@@ -0,0 +1,270 @@
+"""
+Module declaring the indexes required by the aggregation pipelines and tooling for checking
+the query plans of the pipelines with explain
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+import utils.aggregation_pipelines as ap
+import utils.pipeline_catalog as catalog
+
+# indexes per (database, collection), the comment names the pipelines relying on them
+REQUIRED_INDEXES = {
+    catalog.REDDIT_POSTS: [
+        # reddit_keyword_per_subreddit, reddit_frequently_used_news_sources
+        IndexModel([('reddit.subreddit', ASCENDING)]),
+        # reddit_score_by_hour, reddit_posts_by_hour, upserting_combined_analysis_for_reddit with days
+        IndexModel([('created', ASCENDING)]),
+        # reddit_count_posts_per_user, reddit_distribution_number_posts_per_user
+        IndexModel([('author.name', ASCENDING)]),
+        # sentiment_analysis
+        IndexModel([('sentiment.compound', ASCENDING)]),
+        # profanity_distribution of the titles, finding unscored posts
+        IndexModel([('title_profanity', ASCENDING)])
+    ],
+    catalog.TWITTER_TWEETS: [
+        # twitter_get_hashtags_for_specific_trend
+        IndexModel([('trend', ASCENDING)]),
+        # twitter_recent_trends, upserting_twitter_daily_catalog, upserting_combined_analysis_for_twitter with days
+        IndexModel([('created_at', ASCENDING)]),
+        # sentiment_analysis, twitter_tweet_sentiments
+        IndexModel([('sentiment.compound', ASCENDING)]),
+        # twitter_all_tweets_with_geodata
+        IndexModel([('geo', ASCENDING)], sparse=True),
+        # profanity_distribution, twitter_profanity_likes, finding unscored tweets
+        IndexModel([('profanity', ASCENDING), ('metrics.like_count', ASCENDING)])
+    ],
+    catalog.RSS_ARTICLES: [
+        # rss_feed_sources, rss_source_catalog, rss_tag_count
+        IndexModel([('feed_source', ASCENDING), ('published', ASCENDING)]),
+        # rss_published_distribution_per_weekday_from_published, rss_published_distribution_per_hour_from_published,
+        # upserting_combined_analysis_for_rss with days
+        IndexModel([('published', ASCENDING)]),
+        # rss_avg_article_length, covers the group by source on the attributes of utils.article_attributes
+        IndexModel([('feed_source', ASCENDING), ('content_length', ASCENDING), ('token_count', ASCENDING)]),
+        # rss_published_distribution_per_hour, utils.article_attributes.has_attributes
+        IndexModel([('published_hour', ASCENDING)]),
+        # rss_published_distribution_per_weekday
+        IndexModel([('published_weekday', ASCENDING)])
+    ],
+    catalog.RSS_CONTENT_EMBEDDINGS: [
+        # utils.content_embeddings, one document per number of features and source
+        IndexModel([('features', ASCENDING), ('feed_source', ASCENDING)], unique=True)
+    ],
+    catalog.RSS_HEADLINE_TERMS: [
+        # utils.headline_terms, one document per source and term
+        IndexModel([('feed_source', ASCENDING), ('term', ASCENDING)], unique=True),
+        # rss_headline_term_counts, sorted by the index
+        IndexModel([('feed_source', ASCENDING), ('count', DESCENDING)])
+    ],
+    catalog.RSS_HEADLINE_TERM_TOTALS: [
+        # rss_headline_term_totals
+        IndexModel([('count', ASCENDING)])
+    ],
+    catalog.RSS_TAG_SKETCHES: [
+        # utils.minhash.similar_sources, multikey index on the LSH band keys of the sketches
+        IndexModel([('bands', ASCENDING)])
+    ],
+    catalog.REDDIT_COMMENT_FACTS: [
+        # reddit_comment_facts_length_per_subreddit, covers the group by subreddit
+        IndexModel([('subreddit', ASCENDING), ('text_length', ASCENDING)]),
+        # reddit_comment_facts_distribution_number_comments_per_user, covers the group by author
+        IndexModel([('author', ASCENDING)]),
+        # reddit_comment_facts_sentiment
+        IndexModel([('sentiment_bucket', ASCENDING)]),
+        # finding unscored comment facts
+        IndexModel([('profanity', ASCENDING)])
+    ],
+    catalog.REDDIT_COMMENTS: [
+        # profanity_distribution, finding unscored comments
+        IndexModel([('profanity', ASCENDING)])
+    ],
+    catalog.ACTIVITY_CUBE: [
+        # activity_cube_counts with a source, checking whether a source has cells
+        IndexModel([('source', ASCENDING), ('day', ASCENDING)])
+    ],
+    catalog.COMBINED_KEYWORD_ANALYSIS: [
+        # keyword_frequency_in_news_article
+        IndexModel([('_id.keyword', ASCENDING), ('_id.source', ASCENDING)]),
+        # keywords_in_news_article
+        IndexModel([('_id.source', ASCENDING)])
+    ]
+}
+
+SCAN_STAGES = ('COLLSCAN', 'IXSCAN', 'DISTINCT_SCAN', 'COUNT_SCAN', 'IDHACK', 'EXPRESS_IXSCAN', 'EOF')
+
+
+def ensure_indexes(client):
+    """
+    Creates all required indexes. Existing indexes with the same keys are left untouched, so this
+    can be run repeatedly.
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :return: names of the indexes per collection
+    :rtype: dict
+    """
+    created = {}
+    for (database, collection), indexes in REQUIRED_INDEXES.items():
+        logging.info(f'Ensuring {len(indexes)} indexes on {database}.{collection}')
+        created[f'{database}.{collection}'] = client[database][collection].create_indexes(indexes)
+    return created
+
+
+class PipelineRecorder:
+    """
+    Stand-in for a collection that records the commands a pipeline function issues instead of
+    executing them, so they can be explained on the real collection
+
+    :param collection: collection the recorded commands belong to
+    :type collection: pymongo.collection.Collection
+    """
+    def __init__(self, collection):
+        self.name = collection.name
+        self.full_name = collection.full_name
+        self.database = collection.database
+        self.commands = []
+
+    def aggregate(self, pipeline, **kwargs):
+        self.commands.append({'aggregate': self.name, 'pipeline': pipeline, 'cursor': {}})
+        return iter([])
+
+    def find(self, filter=None, projection=None, **kwargs):
+        command = {'find': self.name, 'filter': filter or {}}
+        if projection:
+            command['projection'] = projection
+        self.commands.append(command)
+        return _RecordedCursor(command)
+
+    def find_one(self, filter=None, projection=None, sort=None, **kwargs):
+        command = {'find': self.name, 'filter': filter or {}, 'limit': 1}
+        if projection:
+            command['projection'] = projection
+        if sort:
+            command['sort'] = dict(sort)
+        self.commands.append(command)
+        return None
+
+    def distinct(self, key, filter=None, **kwargs):
+        self.commands.append({'distinct': self.name, 'key': key, 'query': filter or {}})
+        return []
+
+
+class _RecordedCursor:
+
+    def __init__(self, command):
+        self._command = command
+
+    def sort(self, key, direction=ASCENDING):
+        self._command['sort'] = dict(key) if isinstance(key, list) else {key: direction}
+        return self
+
+    def limit(self, limit):
+        self._command['limit'] = limit
+        return self
+
+    def __iter__(self):
+        return iter([])
+
+
+def record_commands(pipeline, collection):
+    """
+    Records the commands a cataloged pipeline function issues, bypassing the result cache
+
+    :param pipeline: entry of utils.pipeline_catalog.PIPELINES
+    :type pipeline: dict
+    :param collection: collection the pipeline runs on
+    :type collection: pymongo.collection.Collection
+    :return: recorded database commands
+    :rtype: list
+    """
+    func = getattr(ap, pipeline['name'])
+    func = getattr(func, '__wrapped__', func)
+    recorder = PipelineRecorder(collection)
+    result = func(recorder, **pipeline['kwargs'])
+    if result is not None:
+        # exhausts generators, so lazily issued commands are recorded as well
+        list(result)
+    return recorder.commands
+
+
+def _find_all(document, key):
+    """
+    Yields all values of a key in a nested explain document
+    """
+    if isinstance(document, dict):
+        for name, value in document.items():
+            if name == key:
+                yield value
+            yield from _find_all(value, key)
+    elif isinstance(document, list):
+        for value in document:
+            yield from _find_all(value, key)
+
+
+def summarize_explain(explain):
+    """
+    Summarizes the winning plans and execution statistics of an explain result
+
+    :param explain: result of the explain command
+    :type explain: dict
+    :return: scan stages, documents examined, keys examined and documents returned by the query layer
+    :rtype: dict
+    """
+    stages = set()
+    for plan in _find_all(explain, 'winningPlan'):
+        stages.update(stage for stage in _find_all(plan, 'stage') if stage in SCAN_STAGES)
+    execution_stats = [stats for stats in _find_all(explain, 'executionStats') if isinstance(stats, dict)]
+    return {
+        'stages': sorted(stages),
+        'collscan': 'COLLSCAN' in stages,
+        'docs_examined': sum(stats.get('totalDocsExamined', 0) for stats in execution_stats),
+        'keys_examined': sum(stats.get('totalKeysExamined', 0) for stats in execution_stats),
+        'docs_returned': sum(stats.get('nReturned', 0) for stats in execution_stats),
+        'execution_time_ms': sum(stats.get('executionTimeMillis', 0) for stats in execution_stats)
+    }
+
+
+def explain_pipeline(client, pipeline):
+    """
+    Explains all commands a cataloged pipeline function issues. Pipelines writing with $merge are
+    only planned, all others are executed to collect execution statistics.
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param pipeline: entry of utils.pipeline_catalog.PIPELINES
+    :type pipeline: dict
+    :return: summaries of the explained commands
+    :rtype: list
+    """
+    collection = catalog.get_collection(client, pipeline)
+    verbosity = 'queryPlanner' if pipeline.get('writes') else 'executionStats'
+    summaries = []
+    for command in record_commands(pipeline, collection):
+        explain = collection.database.command('explain', command, verbosity=verbosity)
+        summary = summarize_explain(explain)
+        summary['command'] = next(iter(command))
+        summaries.append(summary)
+    return summaries
+
+
+def explain_all(client, names=None):
+    """
+    Explains every cataloged pipeline
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param names: restricts the report to these pipeline functions
+    :type names: list
+    :return: report rows with the pipeline name, its collection and the explain summary
+    :rtype: list
+    """
+    rows = []
+    for pipeline in catalog.PIPELINES:
+        if names and pipeline['name'] not in names:
+            continue
+        database, collection = pipeline['collection']
+        for summary in explain_pipeline(client, pipeline):
+            rows.append({'pipeline': pipeline['name'], 'collection': f'{database}.{collection}', **summary})
+    return rows
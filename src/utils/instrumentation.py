@@ -0,0 +1,306 @@
+"""
+Module for instrumenting the hot paths of an analysis. While an analysis runs, timing spans
+(query, transfer, transform, tokenize, profanity, ...) and counters (documents returned, cache
+hits) are collected in a trace. Finished traces are kept in memory for the debug panel of the
+dashboard and written as JSON lines to the logger 'analysis.instrumentation' and, if the
+environment variable ANALYSIS_TRACE_LOG is set, to that file. If the environment variable
+ANALYSIS_TRACE_MEMORY is set to 1, tracemalloc runs for the whole process and every trace records
+the peak memory while it runs.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+MAX_RECENT_TRACES = 100
+
+logger = logging.getLogger('analysis.instrumentation')
+
+_current_trace = contextvars.ContextVar('analysis_trace', default=None)
+# time spent in nested spans of the innermost open span, subtracted from its own time
+_current_span_children = contextvars.ContextVar('analysis_span_children', default=None)
+_recent_traces = deque(maxlen=MAX_RECENT_TRACES)
+_log_lock = threading.Lock()
+# number of running traces recording the peak memory, the peak is only reset when none is running
+_memory_traces = 0
+_memory_lock = threading.Lock()
+
+
+class AnalysisTrace:
+    """
+    Timing spans and counters collected while an analysis runs
+
+    :param analysis: name of the analysis method
+    :type analysis: str
+    :param data_source: data source of the analysis
+    :type data_source: str
+    """
+    def __init__(self, analysis, data_source):
+        self.analysis = analysis
+        self.data_source = data_source
+        self.started = datetime.utcnow()
+        self.duration = None
+        self.peak_memory_bytes = None
+        self.spans = []
+        self.counters = {'documents_returned': 0, 'cache_hits': 0, 'cache_misses': 0}
+        self._lock = threading.Lock()
+
+    def add_span(self, kind, name, duration, self_duration=None):
+        entry = {
+            'kind': kind,
+            'name': name,
+            'duration': duration,
+            'self_duration': duration if self_duration is None else self_duration
+        }
+        with self._lock:
+            self.spans.append(entry)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def durations_by_kind(self):
+        """
+        Sums up the span durations per kind without the time of nested spans, the time not
+        covered by any span is reported as 'other'
+
+        :return: seconds per span kind
+        :rtype: dict
+        """
+        durations = {}
+        for span_entry in self.spans:
+            durations[span_entry['kind']] = durations.get(span_entry['kind'], 0) + span_entry['self_duration']
+        if self.duration is not None:
+            durations['other'] = max(self.duration - sum(durations.values()), 0)
+        return durations
+
+    def to_dict(self):
+        return {
+            'analysis': self.analysis,
+            'data_source': self.data_source,
+            'started': self.started.isoformat(),
+            'duration': self.duration,
+            'peak_memory_bytes': self.peak_memory_bytes,
+            'durations_by_kind': self.durations_by_kind(),
+            'counters': dict(self.counters),
+            'spans': list(self.spans)
+        }
+
+
+def start_memory_tracking():
+    """
+    Starts tracemalloc for the whole process at startup if the environment variable
+    ANALYSIS_TRACE_MEMORY is set to 1. Tracing slows down every analysis of every session, so it
+    is not started on demand.
+    """
+    if os.environ.get('ANALYSIS_TRACE_MEMORY') == '1' and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _enter_memory_trace():
+    global _memory_traces
+    with _memory_lock:
+        # resetting the peak while other traces run would clear their peak
+        if _memory_traces == 0:
+            tracemalloc.reset_peak()
+        _memory_traces += 1
+
+
+def _exit_memory_trace():
+    global _memory_traces
+    with _memory_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _memory_traces -= 1
+    return peak
+
+
+@contextmanager
+def trace_analysis(analysis, data_source):
+    """
+    Context manager collecting a trace of everything instrumented while an analysis runs. The
+    peak memory is only recorded while tracemalloc runs, see start_memory_tracking. It is the
+    peak of the process since the oldest of the overlapping traces started, including the memory
+    held before and the allocations of concurrent sessions.
+
+    :param analysis: name of the analysis method
+    :type analysis: str
+    :param data_source: data source of the analysis
+    :type data_source: str
+    """
+    trace = AnalysisTrace(analysis, data_source)
+    token = _current_trace.set(trace)
+    track_memory = tracemalloc.is_tracing()
+    if track_memory:
+        _enter_memory_trace()
+    started = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.duration = time.perf_counter() - started
+        if track_memory:
+            trace.peak_memory_bytes = _exit_memory_trace()
+        _current_trace.reset(token)
+        # reruns without any instrumented work, e.g. before a button is pressed, are not recorded
+        if trace.spans:
+            _recent_traces.append(trace)
+            _log(trace)
+
+
+@contextmanager
+def span(kind, name=None):
+    """
+    Context manager timing a section of an analysis, does nothing outside of a trace. Spans
+    can be nested, the time of nested spans is not counted as own time of the outer span.
+
+    :param kind: kind of work, e.g. 'query', 'transfer', 'transform', 'tokenize' or 'profanity'
+    :type kind: str
+    :param name: name of the timed function
+    :type name: str
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    parent_children = _current_span_children.get()
+    children = [0]
+    token = _current_span_children.set(children)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        _current_span_children.reset(token)
+        if parent_children is not None:
+            parent_children[0] += duration
+        # spans of parallel threads can overlap the outer span by more than its duration
+        trace.add_span(kind, name, duration, max(duration - children[0], 0))
+
+
+def count(counter, amount=1):
+    """
+    Increments a counter of the current trace, does nothing outside of a trace
+
+    :param counter: name of the counter, e.g. 'documents_returned' or 'cache_hits'
+    :type counter: str
+    :param amount: increment
+    :type amount: int
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(counter, amount)
+
+
+def current_trace():
+    """
+    Returns the trace of the running analysis
+
+    :return: current trace or None
+    :rtype: AnalysisTrace
+    """
+    return _current_trace.get()
+
+
+def recent_traces():
+    """
+    Returns the most recent finished traces of this process
+
+    :return: traces, oldest first
+    :rtype: list
+    """
+    return list(_recent_traces)
+
+
+def export_json_lines(traces):
+    """
+    Serializes traces as JSON lines
+
+    :param traces: traces to export
+    :type traces: list
+    :return: one JSON document per line
+    :rtype: str
+    """
+    return ''.join(json.dumps(trace.to_dict()) + '\n' for trace in traces)
+
+
+def _log(trace):
+    line = json.dumps(trace.to_dict())
+    logger.info(line)
+    path = os.environ.get('ANALYSIS_TRACE_LOG')
+    if path:
+        with _log_lock, open(path, 'a', encoding='utf-8') as log_file:
+            log_file.write(line + '\n')
+
+
+class TracedCursor:
+    """
+    Wraps a cursor and records the time spent fetching its documents as transfer span and the
+    number of fetched documents
+
+    :param cursor: MongoDB cursor
+    :type cursor: pymongo.command_cursor.CommandCursor
+    :param name: name of the pipeline function
+    :type name: str
+    """
+    def __init__(self, cursor, name):
+        self._cursor = cursor
+        self._name = name
+        self._trace = _current_trace.get()
+        self._transfer_time = 0
+        self._returned = 0
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            document = next(self._cursor)
+        except StopIteration:
+            self._finish()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self._transfer_time += elapsed
+            # the cursor is usually consumed within a transform span
+            parent_children = _current_span_children.get()
+            if parent_children is not None:
+                parent_children[0] += elapsed
+        self._returned += 1
+        return document
+
+    def _finish(self):
+        if self._finished or self._trace is None:
+            return
+        self._finished = True
+        self._trace.add_span('transfer', self._name, self._transfer_time)
+        self._trace.count('documents_returned', self._returned)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def traced_pipeline(func):
+    """
+    Decorator recording the query and transfer time of a pipeline function returning a cursor
+
+    :param func: pipeline function
+    :type func: callable
+    :return: decorated function
+    :rtype: callable
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current_trace.get() is None:
+            return func(*args, **kwargs)
+        with span('query', func.__name__):
+            cursor = func(*args, **kwargs)
+        return TracedCursor(cursor, func.__name__)
+    return wrapper
@@ -0,0 +1,229 @@
+"""
+Module for running the jobs of the batch scripts. Independent jobs run concurrently in a thread
+pool. A job plans a list of partitions, e.g. ranges of days, and processes them one after another.
+Status, duration and the completed partitions of every job are recorded in the collection 'jobs'
+of the analysis database, so a failed job resumes with the partitions it has not completed yet.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import utils.aggregation_pipelines as ap
+from utils.watermarks import newest_id, resume_after, set_watermark
+
+JOBS = ('analysis', 'jobs')
+# number of days recomputed by one aggregation of a day partition job, a failed run resumes after
+# the last completed one
+DAYS_PER_PARTITION = 7
+
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+
+
+class Job:
+    """
+    Job of a batch script, partitions and context have to be storable in MongoDB
+
+    :param name: unique name of the job, `_id` of its status document
+    :type name: str
+    :param plan: function without arguments returning the partitions to process and a context
+        dict, which is passed to finish once all partitions are processed
+    :type plan: callable
+    :param run: function processing one partition
+    :type run: callable
+    :param finish: function called with the context after all partitions are processed, e.g.
+        for advancing a watermark
+    :type finish: callable
+    :param describe: function returning a readable description of a partition
+    :type describe: callable
+    """
+    def __init__(self, name, plan, run, finish=None, describe=str):
+        self.name = name
+        self.plan = plan
+        self.run = run
+        self.finish = finish
+        self.describe = describe
+
+
+def get_collection(client):
+    """
+    Returns the collection storing the status of the jobs
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :return: job collection
+    :rtype: pymongo.collection.Collection
+    """
+    database, collection = JOBS
+    return client[database][collection]
+
+
+def plan_job(client, job, resume=True):
+    """
+    Returns the partitions of a job. A job whose last run failed or was interrupted resumes with
+    the plan of that run.
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param job: job to plan
+    :type job: Job
+    :param resume: whether to resume an unfinished run
+    :type resume: bool
+    :return: partitions, context and indexes of the completed partitions
+    :rtype: (list, dict, set)
+    """
+    previous = get_collection(client).find_one({'_id': job.name})
+    if resume and previous and previous['status'] in (STATUS_FAILED, STATUS_RUNNING):
+        return previous['partitions'], previous['context'], set(previous['completed'])
+    partitions, context = job.plan()
+    return partitions, context, set()
+
+
+def run_job(client, job, resume=True):
+    """
+    Runs a job and records its progress
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param job: job to run
+    :type job: Job
+    :param resume: whether to resume an unfinished run
+    :type resume: bool
+    :return: status document of the job
+    :rtype: dict
+    """
+    jobs = get_collection(client)
+    partitions, context, completed = plan_job(client, job, resume)
+    if completed:
+        logging.info(f'Resuming job {job.name}, {len(completed)} of {len(partitions)} partitions already completed')
+    started = time.perf_counter()
+    jobs.replace_one({'_id': job.name}, {
+        'status': STATUS_RUNNING,
+        'started': datetime.utcnow(),
+        'partitions': partitions,
+        'context': context,
+        'completed': sorted(completed)
+    }, upsert=True)
+    try:
+        for index, partition in enumerate(partitions):
+            if index in completed:
+                continue
+            logging.info(f'Job {job.name}: processing {job.describe(partition)}')
+            job.run(partition)
+            jobs.update_one({'_id': job.name}, {'$addToSet': {'completed': index}, '$set': {'checkpoint': datetime.utcnow()}})
+        if job.finish is not None:
+            job.finish(context)
+    except Exception as error:
+        jobs.update_one({'_id': job.name}, {'$set': {
+            'status': STATUS_FAILED,
+            'finished': datetime.utcnow(),
+            'duration': time.perf_counter() - started,
+            'error': repr(error)
+        }})
+        raise
+    jobs.update_one({'_id': job.name}, {'$set': {
+        'status': STATUS_SUCCEEDED,
+        'finished': datetime.utcnow(),
+        'duration': time.perf_counter() - started
+    }, '$unset': {'error': ''}})
+    return jobs.find_one({'_id': job.name})
+
+
+def run_jobs(client, jobs, max_workers=None, resume=True):
+    """
+    Runs independent jobs concurrently, a failing job does not stop the others
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param jobs: jobs to run
+    :type jobs: list
+    :param max_workers: number of concurrently running jobs, all at once by default
+    :type max_workers: int
+    :param resume: whether to resume unfinished runs
+    :type resume: bool
+    :return: names of the failed jobs
+    :rtype: list
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(jobs), 1)) as executor:
+        futures = {job.name: executor.submit(run_job, client, job, resume) for job in jobs}
+        for name, future in futures.items():
+            try:
+                status = future.result()
+                logging.info(f"Job {name} succeeded in {status['duration']:.1f} s")
+            except Exception:
+                logging.exception(f'Job {name} failed')
+                failed.append(name)
+    return failed
+
+
+def print_plan(client, jobs, resume=True):
+    """
+    Prints the partitions each job would process without running it
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param jobs: jobs to plan
+    :type jobs: list
+    :param resume: whether unfinished runs would be resumed
+    :type resume: bool
+    """
+    for job in jobs:
+        partitions, _, completed = plan_job(client, job, resume)
+        resumed = f', resuming after {len(completed)} completed' if completed else ''
+        print(f'{job.name}: {len(partitions) - len(completed)} of {len(partitions)} partitions{resumed}')
+        for index, partition in enumerate(partitions):
+            if index not in completed:
+                print(f'  {job.describe(partition)}')
+
+
+def describe_days(days):
+    """
+    Returns the range of days of a partition
+
+    :param days: days at midnight (UTC) in ascending order
+    :type days: list
+    :return: first and last day and the number of days
+    :rtype: str
+    """
+    first, last = days[0].strftime('%Y-%m-%d'), days[-1].strftime('%Y-%m-%d')
+    return f'{first} to {last} ({len(days)} days)' if first != last else first
+
+
+def day_partition_job(client, watermark_name, collection, date_field, upsert, full, days_per_partition=DAYS_PER_PARTITION):
+    """
+    Creates a job recomputing the days of the documents inserted since its watermark, in
+    partitions of a few days, and advancing the watermark once all partitions are processed
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param watermark_name: name of the job and its watermark, e.g. 'combined_keyword_analysis.twitter'
+    :type watermark_name: str
+    :param collection: source collection
+    :type collection: pymongo.collection.Collection
+    :param date_field: field holding the date of a document
+    :type date_field: str
+    :param upsert: upserting pipeline called with the collection and the days of a partition
+    :type upsert: callable
+    :param full: whether to recompute all days
+    :type full: bool
+    :param days_per_partition: number of days recomputed by one call of upsert
+    :type days_per_partition: int
+    :return: job
+    :rtype: Job
+    """
+    def plan():
+        # read before the recomputation, documents arriving meanwhile are processed in the next run
+        newest = newest_id(collection)
+        after = resume_after(client, watermark_name, full)
+        days = ap.days_with_new_documents(collection, date_field, after)
+        partitions = [days[i:i + days_per_partition] for i in range(0, len(days), days_per_partition)]
+        return partitions, {'newest_id': newest}
+
+    def finish(context):
+        if context['newest_id'] is not None:
+            set_watermark(client, watermark_name, context['newest_id'])
+
+    return Job(watermark_name, plan, lambda days: upsert(collection, days), finish, describe_days)
@@ -0,0 +1,276 @@
+"""
+Module for MinHash sketches of the tags of the news sources and a locality sensitive hashing
+(LSH) index over them. A sketch holds, for each of NUM_PERMUTATIONS hash functions, the minimum
+hash of all tags of a source; the share of equal minima of two sketches estimates the Jaccard
+similarity of their tag sets. The minimum is idempotent, so new articles are merged into a sketch
+with an element-wise minimum and articles seen twice do not change it.
+
+The sketches are stored in the collection 'rss_tag_sketches' of the analysis database, one
+document per source with the signature, its LSH band keys and the number of tag occurrences, so
+the sources with too few tags are left out like in the exact tag similarity. The band keys have a multikey
+index, sources sharing a band key with a source are its candidate neighbours, so the most similar
+sources are found without comparing all pairs of sources.
+
+Unlike the signature, the number of tag occurrences is not idempotent. An article is marked as
+counted by its field 'tag_sketch_counted', the counts are written before the articles of a batch
+are marked, an interrupted update may count the tags of one batch twice; rebuild the sketches to
+correct this.
+"""
+import hashlib
+from datetime import datetime
+
+import numpy as np
+from pymongo import ReplaceOne
+
+SKETCHES = ('analysis', 'rss_tag_sketches')
+MARKER_FIELD = 'tag_sketch_counted'
+NUM_PERMUTATIONS = 128
+# 32 bands of 4 rows, sources with a Jaccard similarity above ~0.4 likely share a band
+NUM_BANDS = 32
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+SEED = 1
+DEFAULT_BATCH_SIZE = 5000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# coefficients of the permutations a * x + b, which stays below 2**64 for 32 bit tag hashes x.
+# The sketches are only comparable as long as SEED and NUM_PERMUTATIONS are unchanged.
+_A, _B = np.random.RandomState(SEED).randint(1, _MAX_HASH, size=(2, NUM_PERMUTATIONS), dtype=np.uint64)
+
+
+def get_collection(client):
+    """
+    Returns the collection storing the sketches
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :return: sketch collection
+    :rtype: pymongo.collection.Collection
+    """
+    database, collection = SKETCHES
+    return client[database][collection]
+
+
+def _tag_hashes(tags):
+    return np.array([int.from_bytes(hashlib.blake2b(str(tag).encode('utf-8'), digest_size=4).digest(), 'little')
+                     for tag in tags], dtype=np.uint64)
+
+
+def signature(tags):
+    """
+    Computes the MinHash signature of a set of tags
+
+    :param tags: tags, duplicates are ignored
+    :type tags: iterable
+    :return: minimum hash per permutation
+    :rtype: numpy.ndarray
+    """
+    hashes = _tag_hashes(set(tags))
+    if len(hashes) == 0:
+        return np.full(NUM_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.int64)
+    permuted = (hashes[:, None] * _A[None, :] + _B[None, :]) % np.uint64(_MERSENNE_PRIME)
+    return permuted.min(axis=0).astype(np.int64)
+
+
+def band_keys(signature_values):
+    """
+    Returns the LSH band keys of a signature, sketches with an equal key are candidate neighbours
+
+    :param signature_values: MinHash signature
+    :type signature_values: numpy.ndarray
+    :return: one key per band
+    :rtype: list
+    """
+    values = np.asarray(signature_values, dtype=np.int64)
+    keys = []
+    for band in range(NUM_BANDS):
+        rows = values[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        keys.append(f'{band}:{hashlib.blake2b(rows.tobytes(), digest_size=8).hexdigest()}')
+    return keys
+
+
+def estimate_jaccard(first, second):
+    """
+    Estimates the Jaccard similarity of two tag sets from their signatures
+
+    :param first: MinHash signature
+    :type first: numpy.ndarray
+    :param second: MinHash signature or matrix with one signature per row
+    :type second: numpy.ndarray
+    :return: share of equal minima, per row for a matrix
+    :rtype: float or numpy.ndarray
+    """
+    equal = np.asarray(first) == np.asarray(second)
+    if equal.ndim == 2:
+        return equal.mean(axis=1)
+    return float(equal.mean())
+
+
+def merge_tags(store, tags_per_source, occurrences_per_source=None):
+    """
+    Merges new tags into the stored sketches of their sources and adds the tag occurrences of
+    the articles which have not been counted yet
+
+    :param store: collection 'rss_tag_sketches'
+    :type store: pymongo.collection.Collection
+    :param tags_per_source: sets of tags by source
+    :type tags_per_source: dict
+    :param occurrences_per_source: number of tags of the uncounted articles by source
+    :type occurrences_per_source: dict
+    """
+    occurrences_per_source = occurrences_per_source or {}
+    stored = {document['_id']: document for document in store.find(
+        {'_id': {'$in': list(tags_per_source)}}, {'signature': 1, 'occurrences': 1})}
+    requests = []
+    for source, tags in tags_per_source.items():
+        merged = signature(tags)
+        previous = stored.get(source, {})
+        sketch = {}
+        if 'signature' in previous:
+            merged = np.minimum(merged, np.asarray(previous['signature'], dtype=np.int64))
+        # sketches stored without a count only get one when they are rebuilt
+        if 'signature' not in previous or 'occurrences' in previous:
+            sketch['occurrences'] = previous.get('occurrences', 0) + occurrences_per_source.get(source, 0)
+        requests.append(ReplaceOne({'_id': source}, {
+            'signature': [int(value) for value in merged],
+            'bands': band_keys(merged),
+            **sketch,
+            'updated': datetime.utcnow()
+        }, upsert=True))
+    if requests:
+        store.bulk_write(requests, ordered=False)
+
+
+def update_sketches(store, articles, after_id=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams the tags of the articles once in the order of their `_id`, merges them into the
+    sketches of their sources and marks the articles whose tags are counted
+
+    :param store: collection 'rss_tag_sketches'
+    :type store: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    :param after_id: only articles with a greater `_id` are read, all if None
+    :type after_id: bson.objectid.ObjectId
+    :param batch_size: number of articles merged at once
+    :type batch_size: int
+    :return: number of read articles
+    :rtype: int
+    """
+    query = {'tags.0': {'$exists': True}}
+    if after_id is not None:
+        query['_id'] = {'$gt': after_id}
+    processed = 0
+    tags_per_source = {}
+    occurrences_per_source = {}
+    counted = []
+    cursor = articles.find(query, {'feed_source': 1, 'tags': 1, MARKER_FIELD: 1}).sort('_id', 1).batch_size(batch_size)
+    for article in cursor:
+        if article.get('feed_source') is None:
+            continue
+        source = article['feed_source']
+        tags_per_source.setdefault(source, set()).update(article['tags'])
+        # articles read again, e.g. in the overlap with the previous run, are merged but not counted
+        if article.get(MARKER_FIELD) is not True:
+            # every tag of an article counts like in the unwound (source, tag) counts of the exact engine
+            occurrences_per_source[source] = occurrences_per_source.get(source, 0) + len(article['tags'])
+            counted.append(article['_id'])
+        processed += 1
+        if processed % batch_size == 0:
+            _merge_batch(store, articles, tags_per_source, occurrences_per_source, counted)
+            tags_per_source, occurrences_per_source, counted = {}, {}, []
+    _merge_batch(store, articles, tags_per_source, occurrences_per_source, counted)
+    return processed
+
+
+def _merge_batch(store, articles, tags_per_source, occurrences_per_source, counted):
+    merge_tags(store, tags_per_source, occurrences_per_source)
+    if counted:
+        articles.update_many({'_id': {'$in': counted}}, {'$set': {MARKER_FIELD: True}})
+
+
+def reset_sketches(store, articles):
+    """
+    Removes all sketches and the marks of all articles
+
+    :param store: collection 'rss_tag_sketches'
+    :type store: pymongo.collection.Collection
+    :param articles: collection of RSS articles
+    :type articles: pymongo.collection.Collection
+    """
+    store.delete_many({})
+    articles.update_many({MARKER_FIELD: True}, {'$unset': {MARKER_FIELD: ''}})
+
+
+def has_sketch(store, source):
+    """
+    Checks whether a source has a sketch with its number of tag occurrences, sketches stored
+    without it are rebuilt by update_rss_tag_sketches.py --full
+
+    :param store: collection 'rss_tag_sketches'
+    :type store: pymongo.collection.Collection
+    :param source: name of the news source
+    :type source: str
+    :return: True if the source has a sketch
+    :rtype: bool
+    """
+    return store.find_one({'_id': source, 'occurrences': {'$exists': True}}, {'_id': 1}) is not None
+
+
+def similar_sources(store, source, limit=None, min_occurrences=0):
+    """
+    Finds the sources most similar to a source among the sources sharing an LSH band with it.
+    The index on the band keys returns the candidates, their number depends on the similarity of
+    the sources rather than on the number of sources. Sources with fewer tag occurrences than
+    min_occurrences are left out, no pairs are returned if the source itself has fewer.
+
+    :param store: collection 'rss_tag_sketches'
+    :type store: pymongo.collection.Collection
+    :param source: name of the news source
+    :type source: str
+    :param limit: maximum number of sources
+    :type limit: int
+    :param min_occurrences: minimum number of tag occurrences of a source
+    :type min_occurrences: int
+    :return: pairs of sources with their estimated Jaccard similarity, most similar first
+    :rtype: list
+    """
+    sketch = store.find_one({'_id': source}, {'signature': 1, 'bands': 1, 'occurrences': 1})
+    if sketch is None or sketch.get('occurrences', 0) < min_occurrences:
+        return []
+    candidates = list(store.find({'bands': {'$in': sketch['bands']}, '_id': {'$ne': source},
+                                  'occurrences': {'$gte': min_occurrences}}, {'signature': 1}))
+    return _ranked(source, sketch['signature'], candidates, limit, ascending=False)
+
+
+def dissimilar_sources(store, source, limit=None, min_occurrences=0):
+    """
+    Finds the sources least similar to a source. Dissimilar sources do not share bands, so all
+    sketches are compared, which is one vectorized comparison per source. Sources with fewer tag
+    occurrences than min_occurrences are left out like in similar_sources.
+
+    :param store: collection 'rss_tag_sketches'
+    :type store: pymongo.collection.Collection
+    :param source: name of the news source
+    :type source: str
+    :param limit: maximum number of sources
+    :type limit: int
+    :param min_occurrences: minimum number of tag occurrences of a source
+    :type min_occurrences: int
+    :return: pairs of sources with their estimated Jaccard similarity, least similar first
+    :rtype: list
+    """
+    sketch = store.find_one({'_id': source}, {'signature': 1, 'occurrences': 1})
+    if sketch is None or sketch.get('occurrences', 0) < min_occurrences:
+        return []
+    candidates = list(store.find({'_id': {'$ne': source}, 'occurrences': {'$gte': min_occurrences}}, {'signature': 1}))
+    return _ranked(source, sketch['signature'], candidates, limit, ascending=True)
+
+
+def _ranked(source, source_signature, candidates, limit, ascending):
+    if not candidates:
+        return []
+    estimates = estimate_jaccard(np.asarray(source_signature, dtype=np.int64),
+                                 np.array([candidate['signature'] for candidate in candidates], dtype=np.int64))
+    order = np.argsort(estimates if ascending else -estimates, kind='stable')[:limit]
+    return [(source, candidates[index]['_id'], float(estimates[index])) for index in order]
@@ -0,0 +1,59 @@
+"""
+Module for running the independent pipeline calls of an analysis concurrently. The calls share
+the MongoDB client of utils.connection_manager, whose connection pool serves the threads, so an
+analysis waits as long as its slowest query instead of the sum of all queries. Every call runs
+in a copy of the caller's context, so the calls are instrumented as part of the running
+analysis trace.
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+DEFAULT_TIMEOUT_SECONDS = 300
+DEFAULT_MAX_WORKERS = 8
+
+
+def run_concurrently(calls, timeout=None, max_workers=None):
+    """
+    Runs functions without arguments concurrently in a thread pool and gathers their results.
+    Functions returning a cursor should consume it, e.g. with list, so the documents are
+    transferred concurrently as well. The timeout of a call counts from the submission of all
+    calls, a call exceeding it raises a TimeoutError. The query of a timed out call is not
+    interrupted, only no longer awaited. The first failing call raises its exception.
+
+    :param calls: functions by the name of their result, e.g. {'tweets': lambda: ap.pipeline(collection)}
+    :type calls: dict
+    :param timeout: seconds to wait for every call or seconds per call name, QUERY_TIMEOUT_SECONDS
+        or DEFAULT_TIMEOUT_SECONDS by default
+    :type timeout: float or dict
+    :param max_workers: maximum number of concurrent calls, QUERY_MAX_WORKERS or DEFAULT_MAX_WORKERS by default
+    :type max_workers: int
+    :return: results by the name of their call
+    :rtype: dict
+    """
+    default_timeout = float(os.environ.get('QUERY_TIMEOUT_SECONDS', DEFAULT_TIMEOUT_SECONDS))
+    timeouts = timeout if isinstance(timeout, dict) else {}
+    if not isinstance(timeout, dict) and timeout is not None:
+        default_timeout = timeout
+    if len(calls) < 2:
+        return {name: call() for name, call in calls.items()}
+
+    max_workers = max_workers or int(os.environ.get('QUERY_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    executor = ThreadPoolExecutor(max_workers=min(len(calls), max_workers), thread_name_prefix='query')
+    try:
+        submitted = time.monotonic()
+        # a context can only be entered by one thread at a time, every call gets its own copy
+        futures = {name: executor.submit(contextvars.copy_context().run, call) for name, call in calls.items()}
+        results = {}
+        for name, future in futures.items():
+            remaining = submitted + timeouts.get(name, default_timeout) - time.monotonic()
+            try:
+                results[name] = future.result(timeout=max(remaining, 0))
+            except FutureTimeoutError:
+                raise TimeoutError(f'Query {name} did not finish within {timeouts.get(name, default_timeout)} s') from None
+        return results
+    finally:
+        # does not wait for timed out or failed calls, pending calls are cancelled
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,127 @@
+"""
+Catalog of all functions in utils.aggregation_pipelines with the collection they run on and
+representative arguments. Tools inspecting or benchmarking the pipelines, such as the index
+management script, iterate over this catalog, so new pipelines have to be registered here.
+"""
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+DATA_DATABASE = 'data'
+ANALYSIS_DATABASE = 'analysis'
+
+REDDIT_POSTS = (DATA_DATABASE, 'reddit.posts')
+TWITTER_TWEETS = (DATA_DATABASE, 'twitter.tweets')
+RSS_ARTICLES = (DATA_DATABASE, 'rss.articles')
+COMBINED_KEYWORD_ANALYSIS = (ANALYSIS_DATABASE, 'combined_keyword_analysis')
+TWITTER_DAILY_CATALOG = (ANALYSIS_DATABASE, 'twitter_daily_catalog')
+REDDIT_COMMENTS = (ANALYSIS_DATABASE, 'reddit_comments')
+REDDIT_COMMENT_FACTS = (ANALYSIS_DATABASE, 'reddit_comment_facts')
+RSS_CONTENT_EMBEDDINGS = (ANALYSIS_DATABASE, 'rss_content_embeddings')
+RSS_TAG_SKETCHES = (ANALYSIS_DATABASE, 'rss_tag_sketches')
+RSS_HEADLINE_TERMS = (ANALYSIS_DATABASE, 'rss_headline_terms')
+RSS_HEADLINE_TERM_TOTALS = (ANALYSIS_DATABASE, 'rss_headline_term_totals')
+ACTIVITY_CUBE = (ANALYSIS_DATABASE, 'activity_cube')
+
+SAMPLE_DAY = datetime(2022, 6, 1)
+# watermark of an incremental batch script which last ran on the sample day
+SAMPLE_WATERMARK = ObjectId.from_datetime(SAMPLE_DAY)
+# windows of samples drawn by utils.sampling, three hours of the sample day and three hash prefixes
+SAMPLE_OBJECT_ID_WINDOWS = [(ObjectId.from_datetime(SAMPLE_DAY + timedelta(hours=hour)),
+                             ObjectId.from_datetime(SAMPLE_DAY + timedelta(hours=hour + 1))) for hour in (3, 11, 17)]
+SAMPLE_HASH_WINDOWS = [('0a3', '0a4'), ('7f0', '7f1'), ('c12', 'c13')]
+
+# name of the pipeline function, (database, collection) and keyword arguments of a sample call.
+# Pipelines writing their results with $merge are marked, they can only be explained without
+# being executed.
+PIPELINES = [
+    {'name': 'reddit_comment_length_per_subreddit', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_top_posts', 'collection': REDDIT_POSTS, 'kwargs': {'limit': 30}},
+    {'name': 'reddit_controversial_posts', 'collection': REDDIT_POSTS, 'kwargs': {'limit': 30}},
+    {'name': 'reddit_score_by_hour', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_posts_by_hour', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_upvote_ratios', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_keyword_per_subreddit', 'collection': REDDIT_POSTS, 'kwargs': {'subreddit': 'worldnews'}},
+    {'name': 'reddit_distribution_number_posts_per_user', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_distribution_number_comments_per_user', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_frequently_used_news_sources', 'collection': REDDIT_POSTS, 'kwargs': {'subreddit': 'worldnews'}},
+    {'name': 'reddit_count_posts_per_user', 'collection': REDDIT_POSTS, 'kwargs': {'limit': 30}},
+    {'name': 'reddit_sentiment_analysis_comments', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'reddit_activity_per_weekday', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'sentiment_analysis', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'sentiment_analysis_comments', 'collection': REDDIT_POSTS, 'kwargs': {}},
+    {'name': 'get_all_reddit_comments', 'collection': REDDIT_POSTS, 'kwargs': {'after_id': SAMPLE_WATERMARK}},
+    {'name': 'upserting_reddit_comment_facts', 'collection': REDDIT_POSTS, 'kwargs': {'after_id': SAMPLE_WATERMARK}, 'writes': True},
+    {'name': 'reddit_comment_facts_length_per_subreddit', 'collection': REDDIT_COMMENT_FACTS, 'kwargs': {}},
+    {'name': 'reddit_comment_facts_distribution_number_comments_per_user', 'collection': REDDIT_COMMENT_FACTS, 'kwargs': {}},
+    {'name': 'reddit_comment_facts_sentiment', 'collection': REDDIT_COMMENT_FACTS, 'kwargs': {}},
+    {'name': 'profanity_distribution', 'collection': REDDIT_POSTS, 'kwargs': {'field': 'title_profanity'}},
+    {'name': 'profanity_distribution', 'collection': REDDIT_COMMENTS, 'kwargs': {}},
+    {'name': 'profanity_distribution', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_profanity_likes', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'sampled_profanity_counts', 'collection': TWITTER_TWEETS, 'kwargs': {'windows': SAMPLE_OBJECT_ID_WINDOWS}},
+    {'name': 'sampled_profanity_counts', 'collection': REDDIT_POSTS, 'kwargs': {'windows': SAMPLE_OBJECT_ID_WINDOWS, 'field': 'title_profanity'}},
+    {'name': 'sampled_profanity_counts', 'collection': REDDIT_COMMENTS, 'kwargs': {'windows': SAMPLE_HASH_WINDOWS}},
+    {'name': 'sampled_sentiment_counts', 'collection': TWITTER_TWEETS, 'kwargs': {'windows': SAMPLE_OBJECT_ID_WINDOWS}},
+    {'name': 'sampled_sentiment_counts', 'collection': REDDIT_POSTS,
+     'kwargs': {'windows': SAMPLE_OBJECT_ID_WINDOWS, 'compound': '$comments.sentiment.compound', 'unwind': '$comments'}},
+    {'name': 'days_with_new_documents', 'collection': REDDIT_POSTS, 'kwargs': {'date_field': 'created', 'after_id': SAMPLE_WATERMARK}},
+    {'name': 'upserting_combined_analysis_for_reddit', 'collection': REDDIT_POSTS, 'kwargs': {'days': [SAMPLE_DAY]}, 'writes': True},
+    {'name': 'twitter_tweets_by_hour', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_valid_dates', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_common_hashtags', 'collection': TWITTER_TWEETS, 'kwargs': {'limit': 30}},
+    {'name': 'twitter_high_interaction_hashtags', 'collection': TWITTER_TWEETS, 'kwargs': {'limit': 30}},
+    {'name': 'twitter_most_liked_hashtags', 'collection': TWITTER_TWEETS, 'kwargs': {'limit': 30}},
+    {'name': 'twitter_hashtags_per_trend', 'collection': TWITTER_TWEETS, 'kwargs': {'limit': 30}},
+    {'name': 'twitter_get_hashtags_for_specific_trend', 'collection': TWITTER_TWEETS, 'kwargs': {'trend': '#Wimbledon'}},
+    {'name': 'twitter_hashtag_count_per_usertype', 'collection': TWITTER_TWEETS, 'kwargs': {'day_predicate': {'$lte': 30}}},
+    {'name': 'twitter_recent_trends', 'collection': TWITTER_TWEETS, 'kwargs': {'date': SAMPLE_DAY}},
+    {'name': 'twitter_tweets_with_links', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_tweets_with_likes', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_tweet_sentiments', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_all_tweets_with_geodata', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_user_stats', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'twitter_activity_per_weekday', 'collection': TWITTER_TWEETS, 'kwargs': {}},
+    {'name': 'upserting_twitter_daily_catalog', 'collection': TWITTER_TWEETS, 'kwargs': {'since': SAMPLE_DAY}, 'writes': True},
+    {'name': 'days_with_new_documents', 'collection': TWITTER_TWEETS, 'kwargs': {'date_field': 'created_at', 'after_id': SAMPLE_WATERMARK}},
+    {'name': 'upserting_combined_analysis_for_twitter', 'collection': TWITTER_TWEETS, 'kwargs': {'days': [SAMPLE_DAY]}, 'writes': True},
+    {'name': 'twitter_catalog_dates', 'collection': TWITTER_DAILY_CATALOG, 'kwargs': {}},
+    {'name': 'twitter_catalog_trends', 'collection': TWITTER_DAILY_CATALOG, 'kwargs': {'date': SAMPLE_DAY}},
+    {'name': 'rss_feed_sources', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_source_catalog', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_avg_article_length', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_avg_article_length_from_content', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_source_tag_counts', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_tag_count', 'collection': RSS_ARTICLES, 'kwargs': {'source': 'BBC'}},
+    {'name': 'rss_content', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_published_distribution_per_weekday', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_published_distribution_per_weekday_from_published', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_published_distribution_per_hour', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_published_distribution_per_hour_from_published', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_headlines', 'collection': RSS_ARTICLES, 'kwargs': {}},
+    {'name': 'rss_headline_term_counts', 'collection': RSS_HEADLINE_TERMS, 'kwargs': {'source': 'BBC', 'limit': 30}},
+    {'name': 'rss_headline_term_totals', 'collection': RSS_HEADLINE_TERM_TOTALS, 'kwargs': {'min_count': 100}},
+    {'name': 'days_with_new_documents', 'collection': RSS_ARTICLES, 'kwargs': {'date_field': 'published', 'after_id': SAMPLE_WATERMARK}},
+    {'name': 'upserting_combined_analysis_for_rss', 'collection': RSS_ARTICLES, 'kwargs': {'days': [SAMPLE_DAY]}, 'writes': True},
+    {'name': 'upserting_activity_cube_for_twitter', 'collection': TWITTER_TWEETS, 'kwargs': {'days': [SAMPLE_DAY]}, 'writes': True},
+    {'name': 'upserting_activity_cube_for_reddit', 'collection': REDDIT_POSTS, 'kwargs': {'days': [SAMPLE_DAY]}, 'writes': True},
+    {'name': 'upserting_activity_cube_for_rss', 'collection': RSS_ARTICLES, 'kwargs': {'days': [SAMPLE_DAY]}, 'writes': True},
+    {'name': 'activity_cube_counts', 'collection': ACTIVITY_CUBE, 'kwargs': {'dimensions': ['weekday', 'hour'], 'source': 'reddit'}},
+    {'name': 'keywords_in_news_article', 'collection': COMBINED_KEYWORD_ANALYSIS, 'kwargs': {'source': 'twitter'}},
+    {'name': 'keyword_frequency_in_news_article', 'collection': COMBINED_KEYWORD_ANALYSIS, 'kwargs': {'keyword': 'ukraine', 'source': 'twitter'}}
+]
+
+
+def get_collection(client, pipeline):
+    """
+    Returns the collection a cataloged pipeline runs on
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param pipeline: entry of PIPELINES
+    :type pipeline: dict
+    :return: MongoDB collection
+    :rtype: pymongo.collection.Collection
+    """
+    database, collection = pipeline['collection']
+    return client[database][collection]
@@ -0,0 +1,141 @@
+"""
+Module for scoring the profanity of texts once and storing the score with the document. The
+texts of unscored documents are streamed in batches and scored across a process pool, the scores
+are written back with bulk updates. The profanity analyses aggregate the stored scores instead of
+scoring every text on every request.
+"""
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pymongo import UpdateOne
+
+PROFANITY_FIELD = 'profanity'
+DEFAULT_BATCH_SIZE = 2000
+
+
+def score_texts(texts):
+    """
+    Scores the profanity of texts, runs in the worker processes
+
+    :param texts: texts to score
+    :type texts: list
+    :return: probability of profanity per text
+    :rtype: list
+    """
+    # the model is loaded once per worker process
+    from profanity_check import predict_prob
+    return [float(score) for score in predict_prob(texts)]
+
+
+def unscored_documents(collection, text_field, field=PROFANITY_FIELD, rescore=False):
+    """
+    Yields the `_id` and text of the documents of a collection without a stored score
+
+    :param collection: collection holding the texts and scores
+    :type collection: pymongo.collection.Collection
+    :param text_field: field holding the text
+    :type text_field: str
+    :param field: field holding the score
+    :type field: str
+    :param rescore: whether to yield the documents which already have a score as well
+    :type rescore: bool
+    :return: pairs of `_id` and text
+    :rtype: generator
+    """
+    query = {} if rescore else {field: {'$exists': False}}
+    for document in collection.find(query, {text_field: 1}).batch_size(DEFAULT_BATCH_SIZE):
+        yield document['_id'], document.get(text_field)
+
+
+def unscored_comment_facts(facts, posts, field=PROFANITY_FIELD, rescore=False, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yields the `_id` and text of the comment facts without a stored score. The facts do not hold
+    the texts, they are read from the comments embedded in the posts.
+
+    :param facts: collection 'reddit_comment_facts'
+    :type facts: pymongo.collection.Collection
+    :param posts: collection of Reddit posts
+    :type posts: pymongo.collection.Collection
+    :param field: field holding the score
+    :type field: str
+    :param rescore: whether to yield the facts which already have a score as well
+    :type rescore: bool
+    :param batch_size: number of facts whose posts are read at once
+    :type batch_size: int
+    :return: pairs of `_id` and text
+    :rtype: generator
+    """
+    query = {} if rescore else {field: {'$exists': False}}
+    # sorted by _id, i.e. by post, so the facts of a post end up in few batches
+    cursor = facts.find(query, {'_id': 1}).sort('_id', 1).batch_size(batch_size)
+    batch = []
+    for fact in cursor:
+        batch.append(fact['_id'])
+        if len(batch) == batch_size:
+            yield from _comment_texts(posts, batch)
+            batch = []
+    if batch:
+        yield from _comment_texts(posts, batch)
+
+
+def _comment_texts(posts, fact_ids):
+    post_ids = list({fact_id['post_id'] for fact_id in fact_ids})
+    comments = {post['_id']: post.get('comments', []) for post in posts.find({'_id': {'$in': post_ids}}, {'comments.text': 1})}
+    for fact_id in fact_ids:
+        post_comments = comments.get(fact_id['post_id'], [])
+        index = fact_id['comment_index']
+        yield fact_id, post_comments[index].get('text') if index < len(post_comments) else None
+
+
+def _write_scores(collection, ids, scores, field):
+    collection.bulk_write([UpdateOne({'_id': _id}, {'$set': {field: score}}) for _id, score in zip(ids, scores)], ordered=False)
+
+
+def store_scores(collection, documents, field=PROFANITY_FIELD, processes=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Scores the texts of documents across a process pool and stores the scores with the documents.
+    At most two batches per process are scored or waiting at a time, so the memory is bounded.
+
+    :param collection: collection the scores are written to
+    :type collection: pymongo.collection.Collection
+    :param documents: pairs of `_id` and text, e.g. from unscored_documents
+    :type documents: iterable
+    :param field: field holding the score
+    :type field: str
+    :param processes: number of worker processes, the number of CPUs by default
+    :type processes: int
+    :param batch_size: number of texts scored at once
+    :type batch_size: int
+    :return: number of scored documents and seconds taken
+    :rtype: (int, float)
+    """
+    started = time.perf_counter()
+    processes = processes or os.cpu_count() or 1
+    max_pending = 2 * processes
+    scored = 0
+    pending = deque()
+    # forked workers would inherit the monitor threads of the open MongoDB client
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        def write_oldest():
+            ids, future = pending.popleft()
+            _write_scores(collection, ids, future.result(), field)
+            return len(ids)
+
+        ids, texts = [], []
+        for _id, text in documents:
+            ids.append(_id)
+            texts.append(text if isinstance(text, str) else '')
+            if len(ids) == batch_size:
+                pending.append((ids, executor.submit(score_texts, texts)))
+                ids, texts = [], []
+                if len(pending) >= max_pending:
+                    scored += write_oldest()
+        if ids:
+            pending.append((ids, executor.submit(score_texts, texts)))
+        while pending:
+            scored += write_oldest()
+    return scored, time.perf_counter() - started
@@ -0,0 +1,293 @@
+"""
+Module for caching results of aggregation pipelines. Results are held in memory with LRU
+eviction under a byte budget and expire after a TTL. Every entry additionally stores a
+token describing the state of its source collection (document count and newest _id), so an
+entry is invalidated as soon as new documents are written to that collection. If a shared
+cache directory is configured, results are also stored there, so replicas of the dashboard
+compute every result only once.
+
+The cache is configured with the following environment variables:
+
+* PIPELINE_CACHE_TTL (seconds an entry stays valid, default 600, 0 disables caching)
+* PIPELINE_CACHE_MAX_BYTES (memory budget of the cache in bytes, default 268435456)
+* RESULT_CACHE_DIR (shared cache directory, the disk cache is disabled if not set)
+* RESULT_CACHE_DIR_MAX_BYTES (size cap of the shared cache directory, default 2147483648)
+"""
+import functools
+import hashlib
+import inspect
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from utils.disk_cache import DiskCache, DEFAULT_MAX_BYTES as DEFAULT_DISK_MAX_BYTES
+from utils.instrumentation import count, span
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ResultCache:
+    """
+    Thread-safe in-memory LRU cache with a byte budget and per-entry expiry
+
+    :param max_bytes: maximum summed size of all cached values
+    :type max_bytes: int
+    :param ttl: default number of seconds an entry stays valid
+    :type ttl: int
+    """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, token):
+        """
+        Looks up a cached value
+
+        :param key: cache key
+        :type key: str
+        :param token: current state of the source collection, entries with another token are stale
+        :type token: tuple
+        :return: whether the key was found and the cached value
+        :rtype: (bool, object)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires, entry_token = entry
+                if expires > time.monotonic() and entry_token == token:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                self._remove(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, token, ttl=None):
+        """
+        Stores a value, evicting the least recently used entries until it fits into the budget.
+        Values larger than the whole budget are not cached.
+
+        :param key: cache key
+        :type key: str
+        :param value: value to cache
+        :type value: object
+        :param token: current state of the source collection
+        :type token: tuple
+        :param ttl: number of seconds the entry stays valid, defaults to the cache TTL
+        :type ttl: int
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            logging.info(f'Result for {key} ({size} bytes) exceeds the cache budget and is not cached')
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while self._entries and self._size + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = (value, size, time.monotonic() + ttl, token)
+            self._size += size
+
+    def clear(self):
+        """
+        Removes all entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        _, size, _, _ = self._entries.pop(key)
+        self._size -= size
+
+
+def estimate_size(value):
+    """
+    Estimates the memory footprint of a cacheable value by its pickled size
+
+    :param value: value to measure
+    :type value: object
+    :return: size in bytes
+    :rtype: int
+    """
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+_cache = ResultCache(
+    max_bytes=int(os.environ.get('PIPELINE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+    ttl=int(os.environ.get('PIPELINE_CACHE_TTL', DEFAULT_TTL_SECONDS))
+)
+
+_disk_cache = None
+if os.environ.get('RESULT_CACHE_DIR'):
+    _disk_cache = DiskCache(
+        os.environ['RESULT_CACHE_DIR'],
+        max_bytes=int(os.environ.get('RESULT_CACHE_DIR_MAX_BYTES', DEFAULT_DISK_MAX_BYTES))
+    )
+
+
+def get_cache():
+    """
+    Returns the result cache shared by all sessions of this process
+
+    :return: result cache
+    :rtype: ResultCache
+    """
+    return _cache
+
+
+def get_disk_cache():
+    """
+    Returns the cache on the shared directory, if one is configured
+
+    :return: shared disk cache or None
+    :rtype: utils.disk_cache.DiskCache
+    """
+    return _disk_cache
+
+
+def collection_token(collection):
+    """
+    Describes the current state of a collection by its document count and its newest _id.
+    Both values are answered from metadata and the _id index without scanning documents.
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :return: document count and newest _id
+    :rtype: tuple
+    """
+    newest = collection.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    return collection.estimated_document_count(), newest['_id'] if newest else None
+
+
+def definition_version(func):
+    """
+    Derives a version from the source code of a function, so cached results of a pipeline
+    are not reused after its definition has changed
+
+    :param func: function computing the cached result
+    :type func: callable
+    :return: version hash
+    :rtype: str
+    """
+    try:
+        definition = inspect.getsource(func).encode('utf-8')
+    except (OSError, TypeError):
+        definition = func.__code__.co_code + repr(func.__code__.co_consts).encode('utf-8')
+    return hashlib.sha1(definition).hexdigest()[:12]
+
+
+def make_key(name, collection, args=(), kwargs=None, version=''):
+    """
+    Builds the cache key for a call of a pipeline function
+
+    :param name: name of the pipeline function
+    :type name: str
+    :param collection: MongoDB collection the pipeline runs on
+    :type collection: pymongo.collection.Collection
+    :param args: positional arguments of the call
+    :type args: tuple
+    :param kwargs: keyword arguments of the call
+    :type kwargs: dict
+    :param version: version of the pipeline definition
+    :type version: str
+    :return: cache key
+    :rtype: str
+    """
+    kwargs = sorted((kwargs or {}).items())
+    fingerprint = repr((args, kwargs)).encode('utf-8')
+    return f'{name}@{version}:{collection.full_name}:{hashlib.sha1(fingerprint).hexdigest()}'
+
+
+def get_or_compute(key, collection, compute, ttl=None):
+    """
+    Returns the cached value for a key or computes and caches it
+
+    :param key: cache key
+    :type key: str
+    :param collection: source collection whose changes invalidate the value
+    :type collection: pymongo.collection.Collection
+    :param compute: function without arguments computing the value
+    :type compute: callable
+    :param ttl: number of seconds the entry stays valid, defaults to the cache TTL
+    :type ttl: int
+    :return: cached or computed value
+    """
+    token = collection_token(collection)
+    hit, value = _cache.get(key, token)
+    if hit:
+        count('cache_hits')
+        return value
+    if _disk_cache is None:
+        count('cache_misses')
+        value = compute()
+    else:
+        value = _get_or_compute_shared(key, token, compute, _cache.ttl if ttl is None else ttl)
+    _cache.put(key, value, token, ttl)
+    return value
+
+
+def _get_or_compute_shared(key, token, compute, ttl):
+    hit, value = _disk_cache.get(key, token)
+    if hit:
+        count('cache_hits')
+        return value
+    with _disk_cache.lock(key):
+        # another replica may have computed the value while this one waited for the lock
+        hit, value = _disk_cache.get(key, token)
+        if hit:
+            count('cache_hits')
+            return value
+        count('cache_misses')
+        value = compute()
+        _disk_cache.put(key, value, token, ttl)
+    return value
+
+
+def cached_pipeline(func=None, ttl=None):
+    """
+    Decorator caching the result of a pipeline function whose first argument is the collection.
+    The cursor is materialized into a list, callers receive a shallow copy of the cached list.
+    Can be used as @cached_pipeline or @cached_pipeline(ttl=...).
+
+    :param func: pipeline function
+    :type func: callable
+    :param ttl: number of seconds an entry stays valid, defaults to the cache TTL
+    :type ttl: int
+    :return: decorated function
+    :rtype: callable
+    """
+    def decorator(pipeline_func):
+        version = definition_version(pipeline_func)
+
+        name = pipeline_func.__name__
+
+        def compute(collection, args, kwargs):
+            with span('query', name):
+                cursor = pipeline_func(collection, *args, **kwargs)
+            with span('transfer', name):
+                return list(cursor)
+
+        @functools.wraps(pipeline_func)
+        def wrapper(collection, *args, **kwargs):
+            key = make_key(name, collection, args, kwargs, version)
+            result = get_or_compute(key, collection, lambda: compute(collection, args, kwargs), ttl)
+            count('documents_returned', len(result))
+            return list(result)
+        return wrapper
+
+    if func is not None:
+        return decorator(func)
+    return decorator
@@ -0,0 +1,170 @@
+"""
+Module for approximate analyses on a reproducible sample of a collection. The `_id` range of a
+collection is split into equally sized slots and a seeded random choice of slots is read, so the
+sample is drawn with range scans on the `_id` index and the same seed always yields the same
+sample. Every document belongs to exactly one slot, hence every document is sampled with the same
+probability. The documents of a slot are not independent of each other (e.g. tweets of the same
+minute share a trend), so the confidence intervals are estimated from the variation between the
+slots rather than assuming independent documents.
+"""
+import bisect
+import math
+import random
+from statistics import NormalDist
+
+from bson.objectid import ObjectId
+
+DEFAULT_SEED = 42
+DEFAULT_FRACTION = 0.05
+DEFAULT_CONFIDENCE = 0.95
+# number of slots the `_id` range of a collection with ObjectIds is split into
+OBJECT_ID_SLOTS = 1000
+# number of leading hex digits of a hash `_id` forming a slot, i.e. 4096 slots
+HASH_PREFIX_LENGTH = 3
+
+
+def _choose_slots(slots, fraction, seed):
+    # at least two slots are needed to estimate the variation between them
+    count = min(slots, max(2, round(fraction * slots)))
+    return sorted(random.Random(seed).sample(range(slots), count))
+
+
+def object_id_windows(collection, fraction=DEFAULT_FRACTION, seed=DEFAULT_SEED, slots=OBJECT_ID_SLOTS):
+    """
+    Chooses the sampled `_id` windows of a collection whose `_id` is an ObjectId. The slots split
+    the time between the first and the last inserted document.
+
+    :param collection: MongoDB collection
+    :type collection: pymongo.collection.Collection
+    :param fraction: share of the slots to sample
+    :type fraction: float
+    :param seed: seed of the random choice of slots
+    :type seed: int
+    :param slots: number of slots
+    :type slots: int
+    :return: sorted pairs of inclusive lower and exclusive upper `_id`, total number of slots
+    :rtype: (list, int)
+    """
+    first = collection.find_one({}, {'_id': 1}, sort=[('_id', 1)])
+    last = collection.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    if first is None:
+        return [], slots
+    start = int(first['_id'].generation_time.timestamp())
+    # ObjectIds have a resolution of one second, slots are at least one second long
+    seconds = int(last['_id'].generation_time.timestamp()) + 1 - start
+    slots = min(slots, seconds)
+    windows = []
+    for slot in _choose_slots(slots, fraction, seed):
+        lower = start + slot * seconds // slots
+        upper = start + (slot + 1) * seconds // slots
+        windows.append((ObjectId('%08x' % lower + '0' * 16), ObjectId('%08x' % upper + '0' * 16)))
+    return windows, slots
+
+
+def hash_windows(fraction=DEFAULT_FRACTION, seed=DEFAULT_SEED, prefix_length=HASH_PREFIX_LENGTH):
+    """
+    Chooses the sampled `_id` windows of a collection whose `_id` is a hex digest, e.g. the
+    content hash of 'analysis.reddit_comments'. A slot holds the hashes with the same prefix, the
+    hashes are uniformly distributed, so are the documents over the slots.
+
+    :param fraction: share of the slots to sample
+    :type fraction: float
+    :param seed: seed of the random choice of slots
+    :type seed: int
+    :param prefix_length: number of hex digits of a prefix
+    :type prefix_length: int
+    :return: sorted pairs of inclusive lower and exclusive upper `_id`, total number of slots
+    :rtype: (list, int)
+    """
+    slots = 16 ** prefix_length
+    windows = []
+    for slot in _choose_slots(slots, fraction, seed):
+        lower = format(slot, f'0{prefix_length}x')
+        # 'g' sorts after every hex digest starting with 'f'
+        upper = format(slot + 1, f'0{prefix_length}x') if slot + 1 < slots else 'g'
+        windows.append((lower, upper))
+    return windows, slots
+
+
+def window_counts(windows, documents, labels):
+    """
+    Counts sampled documents per window and label, for samples which are labeled on the client,
+    e.g. by scoring their texts
+
+    :param windows: sorted windows as returned by object_id_windows or hash_windows
+    :type windows: list
+    :param documents: pairs of `_id` and label
+    :type documents: iterable
+    :param labels: possible labels
+    :type labels: list
+    :return: lower bound, number of documents and of documents per label of every window with
+        documents
+    :rtype: list
+    """
+    lowers = [lower for lower, _ in windows]
+    counts = {}
+    for _id, label in documents:
+        index = bisect.bisect_right(lowers, _id) - 1
+        if index < 0 or not _id < windows[index][1]:
+            continue
+        window = counts.setdefault(index, [0] * (len(labels) + 1))
+        window[0] += 1
+        if label in labels:
+            window[labels.index(label) + 1] += 1
+    return [{'window': windows[index][0], 'count': window[0], 'labels': window[1:]} for index, window in counts.items()]
+
+
+def merge_window_counts(counts):
+    """
+    Sums up the counts of the same window, e.g. of the documents counted on the server and of the
+    documents labeled on the client
+
+    :param counts: documents per window as returned by window_counts or
+        utils.aggregation_pipelines.sampled_bucket_counts
+    :type counts: list
+    :return: one entry per window
+    :rtype: list
+    """
+    merged = {}
+    for window in counts:
+        entry = merged.setdefault(window['window'], {'window': window['window'], 'count': 0,
+                                                     'labels': [0] * len(window['labels'])})
+        entry['count'] += window['count']
+        entry['labels'] = [total + count for total, count in zip(entry['labels'], window['labels'])]
+    return list(merged.values())
+
+
+def estimate_shares(counts, sampled_slots, slots, confidence=DEFAULT_CONFIDENCE):
+    """
+    Estimates the share of every label in the whole collection from the counts of the sampled
+    windows, with a confidence interval from the variance between the windows (ratio estimator of
+    a cluster sample, including the finite population correction)
+
+    :param counts: documents per window as returned by window_counts or
+        utils.aggregation_pipelines.sampled_bucket_counts
+    :type counts: list
+    :param sampled_slots: number of sampled windows, including the windows without documents
+    :type sampled_slots: int
+    :param slots: total number of slots
+    :type slots: int
+    :param confidence: confidence level of the intervals
+    :type confidence: float
+    :return: per label the share and the lower and upper bound of its interval, sampled documents
+    :rtype: (list, int)
+    """
+    total = sum(window['count'] for window in counts)
+    if not counts:
+        return [], 0
+    labels = len(counts[0]['labels'])
+    if total == 0:
+        return [(0, 0, 0)] * labels, 0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    correction = (1 - sampled_slots / slots) * sampled_slots / max(sampled_slots - 1, 1)
+    estimates = []
+    for label in range(labels):
+        share = sum(window['labels'][label] for window in counts) / total
+        # windows without documents have a residual of zero
+        residuals = sum((window['labels'][label] - share * window['count']) ** 2 for window in counts)
+        error = z * math.sqrt(correction * residuals) / total
+        estimates.append((share, max(share - error, 0), min(share + error, 1)))
+    return estimates, total
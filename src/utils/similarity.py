@@ -0,0 +1,200 @@
+"""
+Module for the pairwise similarity of items described by weighted features, e.g. news sources
+described by the counts of their tags. The items and features form a sparse incidence matrix, all
+pairwise scores are computed with sparse matrix products instead of comparing every pair. Most
+pairs share no feature, so the similarity matrices stay sparse and only hold the pairs with a
+positive score.
+"""
+import itertools
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+JACCARD = 'jaccard'
+WEIGHTED_JACCARD = 'weighted_jaccard'
+
+
+def incidence_matrix(data, item, feature, weight):
+    """
+    Builds the sparse item by feature matrix from one row per item and feature
+
+    :param data: rows with an item, a feature and a weight, e.g. from a (source, tag) count aggregation
+    :type data: pandas.DataFrame
+    :param item: column of the items
+    :type item: str
+    :param feature: column of the features
+    :type feature: str
+    :param weight: column of the positive weights
+    :type weight: str
+    :return: matrix with one row per item and the items in the order of the rows
+    :rtype: (scipy.sparse.csr_matrix, list)
+    """
+    # items and features filtered out of a categorical column do not get a row or a column
+    items = pd.Categorical(data[item]).remove_unused_categories()
+    features = pd.Categorical(data[feature]).remove_unused_categories()
+    matrix = sparse.csr_matrix(
+        (data[weight].to_numpy(dtype=np.float64), (items.codes, features.codes)),
+        shape=(len(items.categories), len(features.categories))
+    )
+    # duplicate rows of an item and a feature are summed up
+    matrix.sum_duplicates()
+    return matrix, list(items.categories)
+
+
+def _sparse_ratio(numerator, sizes):
+    """
+    Divides the nonzero entries of an item by item matrix of intersections by the size of the
+    union of both items, i.e. sizes[i] + sizes[j] - intersection
+    """
+    numerator = sparse.coo_matrix(numerator)
+    union = sizes[numerator.row] + sizes[numerator.col] - numerator.data
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(union > 0, numerator.data / union, 0).astype(np.float32)
+    result = sparse.csr_matrix((ratios, (numerator.row, numerator.col)), shape=numerator.shape)
+    result.eliminate_zeros()
+    return result
+
+
+def jaccard(matrix):
+    """
+    Computes the Jaccard similarity of the feature sets of all pairs of items, i.e. the number of
+    shared features divided by the number of features of either item
+
+    :param matrix: item by feature matrix, every positive weight counts as present
+    :type matrix: scipy.sparse.csr_matrix
+    :return: symmetric item by item matrix, pairs without shared features are not stored
+    :rtype: scipy.sparse.csr_matrix
+    """
+    present = (matrix > 0).astype(np.float64)
+    intersection = present @ present.T
+    sizes = np.asarray(present.sum(axis=1)).ravel()
+    return _sparse_ratio(intersection, sizes)
+
+
+def weighted_jaccard(matrix):
+    """
+    Computes the weighted Jaccard similarity of all pairs of items, i.e. the sum of the smaller
+    weights of every feature divided by the sum of the larger weights. The sum of the minima is
+    built up level by level: min(a, b) is the sum over all distinct weights w_k <= min(a, b) of
+    w_k - w_k-1, so every level is one sparse product of the indicators of weights >= w_k. Few
+    features have high weights, so the indicator matrices of the upper levels are nearly empty.
+
+    :param matrix: item by feature matrix with non-negative weights
+    :type matrix: scipy.sparse.csr_matrix
+    :return: symmetric item by item matrix, pairs without shared features are not stored
+    :rtype: scipy.sparse.csr_matrix
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=np.float64)
+    matrix.eliminate_zeros()
+    remaining = matrix.copy()
+    minima = sparse.csr_matrix((matrix.shape[0], matrix.shape[0]))
+    previous = 0
+    for level in np.unique(matrix.data):
+        # drops the weights below the level, the remaining matrix shrinks with every level
+        remaining.data[remaining.data < level] = 0
+        remaining.eliminate_zeros()
+        indicator = remaining.copy()
+        indicator.data[:] = 1
+        minima = minima + (level - previous) * (indicator @ indicator.T)
+        previous = level
+    totals = np.asarray(matrix.sum(axis=1)).ravel()
+    # the sum of the maxima is totals[i] + totals[j] - minima[i, j]
+    return _sparse_ratio(minima, totals)
+
+
+def _zero_pairs(similarity, item=None):
+    """
+    Yields the pairs (i, j) with i < j which are not stored in a symmetric sparse matrix, in the
+    order of the rows, only the pairs of an item if given
+    """
+    size = similarity.shape[0]
+    for row in range(size) if item is None else [item]:
+        stored = set(similarity.indices[similarity.indptr[row]:similarity.indptr[row + 1]])
+        for column in range(row + 1 if item is None else 0, size):
+            if column != row and column not in stored:
+                yield (row, column) if row < column else (column, row)
+
+
+def _sparse_top_pairs(similarity, limit, ascending, item):
+    """
+    Selects the pairs of a sparse similarity matrix. The pairs which are not stored have a score
+    of 0 and are only enumerated as far as they are needed.
+    """
+    similarity = sparse.csr_matrix(similarity)
+    similarity.eliminate_zeros()
+    if item is None:
+        stored = sparse.triu(similarity, k=1).tocoo()
+        first, second, scores = stored.row, stored.col, stored.data
+    else:
+        stored = similarity.getrow(item).tocoo()
+        others = stored.col != item
+        first = np.minimum(stored.col[others], item)
+        second = np.maximum(stored.col[others], item)
+        scores = stored.data[others]
+    order = np.argsort(scores if ascending else -scores, kind='stable')
+    first, second, scores = first[order], second[order], scores[order]
+    # the stored scores on the near side of 0 come before the pairs which are not stored
+    before = scores < 0 if ascending else scores > 0
+    selected = list(zip(first[before], second[before], scores[before]))[:limit]
+    if limit is None or len(selected) < limit:
+        zeros = _zero_pairs(similarity, item)
+        if limit is not None:
+            zeros = itertools.islice(zeros, limit - len(selected))
+        selected += [(first_item, second_item, 0.0) for first_item, second_item in zeros]
+        after = ~before & (scores != 0)
+        selected += list(zip(first[after], second[after], scores[after]))
+    return selected[:limit]
+
+
+def top_pairs(similarity, items, limit=None, ascending=False, item=None):
+    """
+    Returns the most (or least) similar pairs of distinct items. A sparse matrix only holds the
+    nonzero scores, the pairs with a score of 0 are enumerated on demand, e.g. for the least
+    similar pairs.
+
+    :param similarity: symmetric item by item matrix
+    :type similarity: numpy.ndarray or scipy.sparse.csr_matrix
+    :param items: items in the order of the rows
+    :type items: list
+    :param limit: number of pairs, all pairs if None
+    :type limit: int
+    :param ascending: whether to return the least similar pairs
+    :type ascending: bool
+    :param item: only the pairs of this item, all pairs if None
+    :type item: object
+    :return: pairs with the columns 'Source 1', 'Source 2' and 'Similarity'
+    :rtype: pandas.DataFrame
+    """
+    names = np.asarray(items, dtype=object)
+    index = None
+    if item is not None:
+        matches = np.flatnonzero(names == item)
+        if len(matches) == 0:
+            return pd.DataFrame(columns=['Source 1', 'Source 2', 'Similarity'])
+        index = int(matches[0])
+    if sparse.issparse(similarity):
+        selected = _sparse_top_pairs(similarity, limit, ascending, index)
+        return pd.DataFrame({
+            'Source 1': [names[first] for first, _, _ in selected],
+            'Source 2': [names[second] for _, second, _ in selected],
+            'Similarity': np.array([score for _, _, score in selected], dtype=np.float32)
+        })
+    if index is None:
+        first, second = np.triu_indices(len(items), k=1)
+    else:
+        others = np.array([other for other in range(len(items)) if other != index], dtype=int)
+        first, second = np.minimum(others, index), np.maximum(others, index)
+    scores = similarity[first, second]
+    order_scores = scores if ascending else -scores
+    if limit is not None and limit < len(scores):
+        # only the selected pairs are sorted
+        selected = np.argpartition(order_scores, limit)[:limit]
+        selected = selected[np.argsort(order_scores[selected], kind='stable')]
+    else:
+        selected = np.argsort(order_scores, kind='stable')
+    return pd.DataFrame({
+        'Source 1': names[first[selected]],
+        'Source 2': names[second[selected]],
+        'Similarity': scores[selected]
+    })
@@ -0,0 +1,40 @@
+"""
+Module providing stopword lists from a copy bundled with the application, so no corpus has to
+be downloaded from the network when an analyzer is loaded
+"""
+import functools
+import os
+
+RESOURCES_DIRECTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'resources')
+
+
+@functools.lru_cache(maxsize=None)
+def _load_stopwords(language):
+    path = os.path.join(RESOURCES_DIRECTORY, f'stopwords_{language}.txt')
+    with open(path, 'r', encoding='utf-8') as stopwords_file:
+        return tuple(line.strip() for line in stopwords_file if line.strip())
+
+
+def words(language='english'):
+    """
+    Returns the stopwords of a language, the bundled English list equals the NLTK stopwords corpus
+
+    :param language: language of the stopwords
+    :type language: str
+    :return: stopwords
+    :rtype: list
+    """
+    return list(_load_stopwords(language))
+
+
+@functools.lru_cache(maxsize=None)
+def word_set(language='english'):
+    """
+    Returns the stopwords of a language as a set for constant time membership tests
+
+    :param language: language of the stopwords
+    :type language: str
+    :return: stopwords
+    :rtype: frozenset
+    """
+    return frozenset(_load_stopwords(language))
@@ -0,0 +1,144 @@
+"""
+Module for tokenizing and normalizing the texts of the analyses. The tokenizer splits like
+nltk.tokenize.wordpunct_tokenize (runs of word characters and runs of other non-space
+characters) with a precompiled pattern, stopwords are looked up in a frozenset. The batch
+functions take whole Series or iterables and return token lists, term counts or a sparse
+document by term matrix; corpora with at least PARALLEL_THRESHOLD texts can be tokenized across
+a process pool. The pool is meant for batch scripts and benchmarks, the dashboard tokenizes in its
+own process instead of starting workers from a multithreaded server.
+"""
+import multiprocessing
+import os
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+
+from utils import stopwords
+
+# the pattern of nltk's WordPunctTokenizer
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]+')
+_NON_WORD = re.compile(r'\W')
+
+# number of texts from which tokenize_many uses a process pool if processes are requested
+PARALLEL_THRESHOLD = 50000
+# number of texts sent to a worker process at once
+CHUNK_SIZE = 5000
+
+
+def tokenize(text):
+    """
+    Splits a text into tokens like nltk.tokenize.wordpunct_tokenize
+
+    :param text: text, anything but a string yields no tokens
+    :type text: str
+    :return: tokens
+    :rtype: list
+    """
+    if not isinstance(text, str):
+        return []
+    return _TOKEN_PATTERN.findall(text)
+
+
+def normalize(text, remove_stopwords=True, words_only=True, lowercase=True, language='english'):
+    """
+    Tokenizes a text and normalizes its tokens. With all options this is the normalization of
+    the headline analyses: stopwords, numbers and punctuation are left out and words are lowercased.
+
+    :param text: text to normalize
+    :type text: str
+    :param remove_stopwords: whether to leave out stopwords, compared case-insensitively
+    :type remove_stopwords: bool
+    :param words_only: whether to leave out numbers and tokens of punctuation or special characters
+    :type words_only: bool
+    :param lowercase: whether to lowercase the tokens
+    :type lowercase: bool
+    :param language: language of the stopwords
+    :type language: str
+    :return: normalized tokens
+    :rtype: list
+    """
+    sws = stopwords.word_set(language) if remove_stopwords else frozenset()
+    tokens = []
+    for token in tokenize(text):
+        lowered = token.lower()
+        if lowered in sws or (words_only and (_NON_WORD.match(token) or token.isdigit())):
+            continue
+        tokens.append(lowered if lowercase else token)
+    return tokens
+
+
+def _normalize_chunk(texts, options):
+    return [normalize(text, **options) for text in texts]
+
+
+def tokenize_many(texts, processes=None, **options):
+    """
+    Normalizes many texts, see normalize for the options. With processes and at least
+    PARALLEL_THRESHOLD texts, the texts are normalized in chunks across a process pool of spawned
+    workers, which has to be started from a script guarded by `if __name__ == '__main__'`.
+
+    :param texts: texts, e.g. a column of a DataFrame
+    :type texts: iterable
+    :param processes: number of worker processes, 0 for the number of CPUs, None to stay in this process
+    :type processes: int
+    :return: normalized tokens per text, in the order of the texts
+    :rtype: list
+    """
+    texts = list(texts)
+    if processes is None or processes == 1 or len(texts) < PARALLEL_THRESHOLD:
+        return _normalize_chunk(texts, options)
+    chunks = [texts[start:start + CHUNK_SIZE] for start in range(0, len(texts), CHUNK_SIZE)]
+    # spawned workers do not inherit the threads and connections of the calling process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count() or 1, mp_context=context) as executor:
+        results = executor.map(_normalize_chunk, chunks, [options] * len(chunks))
+        return list(chain.from_iterable(results))
+
+
+def term_counts(texts, processes=None, **options):
+    """
+    Counts the normalized tokens of many texts
+
+    :param texts: texts, e.g. a column of a DataFrame
+    :type texts: iterable
+    :param processes: see tokenize_many
+    :type processes: int
+    :return: occurrences per token
+    :rtype: collections.Counter
+    """
+    return Counter(chain.from_iterable(tokenize_many(texts, processes, **options)))
+
+
+def count_matrix(texts, vocabulary=None, processes=None, **options):
+    """
+    Builds the sparse document by term matrix of the normalized tokens of many texts
+
+    :param texts: texts, e.g. a column of a DataFrame
+    :type texts: iterable
+    :param vocabulary: terms of the columns, tokens outside of it are left out; all tokens if None
+    :type vocabulary: list
+    :param processes: see tokenize_many
+    :type processes: int
+    :return: occurrences per text and term, terms of the columns
+    :rtype: (scipy.sparse.csr_matrix, list)
+    """
+    documents = tokenize_many(texts, processes, **options)
+    columns = {}
+    if vocabulary is not None:
+        columns = {term: index for index, term in enumerate(vocabulary)}
+    indices, indptr = [], [0]
+    for tokens in documents:
+        for token in tokens:
+            if vocabulary is None:
+                indices.append(columns.setdefault(token, len(columns)))
+            elif token in columns:
+                indices.append(columns[token])
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix((np.ones(len(indices)), indices, indptr), shape=(len(documents), len(columns)))
+    # repeated tokens of a text are summed up
+    matrix.sum_duplicates()
+    return matrix, list(columns)
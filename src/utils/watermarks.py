@@ -0,0 +1,108 @@
+"""
+Module for the high-water marks of the incremental batch scripts. A watermark is the newest
+`_id` of a source collection that a batch script has processed. ObjectIds grow with the time of
+insertion, so documents with a greater `_id` have arrived since the last run, regardless of the
+date they carry. The watermarks are stored in the collection 'watermarks' of the analysis
+database, with the name of the job and source as `_id`.
+"""
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+WATERMARKS = ('analysis', 'watermarks')
+# documents whose _id was generated shortly before the watermark but inserted after it, e.g. by
+# a scraper with a lagging clock, are covered by looking back this far. The batch scripts skip or
+# overwrite documents processed twice, by a mark on the document or by replacing their results.
+WATERMARK_OVERLAP = timedelta(minutes=30)
+
+
+def get_collection(client):
+    """
+    Returns the collection storing the watermarks
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :return: watermark collection
+    :rtype: pymongo.collection.Collection
+    """
+    database, collection = WATERMARKS
+    return client[database][collection]
+
+
+def get_watermark(client, name):
+    """
+    Returns the watermark of a job
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param name: name of the job and source, e.g. 'combined_keyword_analysis.twitter'
+    :type name: str
+    :return: newest processed `_id` or None if the job has not run yet
+    :rtype: bson.objectid.ObjectId
+    """
+    watermark = get_collection(client).find_one({'_id': name})
+    return watermark['value'] if watermark else None
+
+
+def resume_after(client, name, full=False):
+    """
+    Returns the `_id` after which the next run of a job has to process the documents, i.e. the
+    watermark of the job less WATERMARK_OVERLAP
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param name: name of the job and source
+    :type name: str
+    :param full: whether the run processes all documents regardless of the watermark
+    :type full: bool
+    :return: lower bound of the `_id`, None if all documents have to be processed
+    :rtype: bson.objectid.ObjectId
+    """
+    watermark = None if full else get_watermark(client, name)
+    if watermark is None:
+        return None
+    return ObjectId.from_datetime(watermark.generation_time - WATERMARK_OVERLAP)
+
+
+def set_watermark(client, name, value):
+    """
+    Stores the watermark of a job
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param name: name of the job and source
+    :type name: str
+    :param value: newest processed `_id`
+    :type value: bson.objectid.ObjectId
+    """
+    get_collection(client).update_one(
+        {'_id': name},
+        {'$set': {'value': value, 'updated': datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def delete_watermark(client, name):
+    """
+    Removes the watermark of a job, so its next run processes all documents
+
+    :param client: MongoDB connection client
+    :type client: pymongo.MongoClient
+    :param name: name of the job and source
+    :type name: str
+    """
+    get_collection(client).delete_one({'_id': name})
+
+
+def newest_id(collection):
+    """
+    Returns the newest `_id` of a collection, to be stored as watermark after processing all
+    documents up to it
+
+    :param collection: source collection
+    :type collection: pymongo.collection.Collection
+    :return: newest `_id` or None if the collection is empty
+    :rtype: bson.objectid.ObjectId
+    """
+    document = collection.find_one({}, {'_id': 1}, sort=[('_id', -1)])
+    return document['_id'] if document else None